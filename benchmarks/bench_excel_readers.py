@@ -0,0 +1,66 @@
+"""Compare the workbook reader engines on a large generated workbook.
+
+Writes a workbook of `--rows` rows of mixed types, then times reading it
+whole, and in chunks, with each engine that is installed:
+
+    python benchmarks/bench_excel_readers.py --rows 200000
+"""
+import argparse
+import io
+import time
+from datetime import datetime, timedelta
+from importlib.util import find_spec
+
+import numpy as np
+import openpyxl
+
+from skyloader.readers import ReadOptions, reader_for
+
+ENGINES = ("pandas", "openpyxl", "calamine")
+
+
+def synthetic_workbook(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet("data")
+    sheet.append(["id", "amount", "label", "observed_at", "flag"])
+    start = datetime(2023, 1, 1)
+    amounts = rng.normal(size=rows).round(4).tolist()
+    labels = rng.choice(["alpha", "beta", "gamma", ""], size=rows).tolist()
+    flags = (rng.random(rows) < 0.5).tolist()
+    for i in range(rows):
+        sheet.append([i, amounts[i], labels[i] or None, start + timedelta(seconds=i), flags[i]])
+    fh = io.BytesIO()
+    workbook.save(fh)
+    return fh.getvalue()
+
+
+def time_read(payload, engine, chunked):
+    reader = reader_for(ReadOptions(engine=engine, sheet_name="data"))
+    started = time.perf_counter()
+    if chunked:
+        rows = sum(len(chunk) for chunk in reader.chunks(io.BytesIO(payload)))
+    else:
+        rows = len(reader.read(io.BytesIO(payload)))
+    return rows, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    args = parser.parse_args()
+
+    payload = synthetic_workbook(args.rows)
+    print(f"workbook of {args.rows:,} rows, {len(payload) / 2**20:.1f} MiB")
+    for engine in ENGINES:
+        if engine == "calamine" and find_spec("python_calamine") is None:
+            print(f"{engine:>9}: skipped, python-calamine is not installed")
+            continue
+        for chunked in (False, True) if engine != "pandas" else (False,):
+            rows, elapsed = time_read(payload, engine, chunked)
+            label = f"{engine} ({'chunks' if chunked else 'whole'})"
+            print(f"{label:>20}: {elapsed:8.2f}s  {rows / elapsed:12,.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Time importing skyloader and its modules, each in a fresh interpreter.
+
+Reports the best and median wall time of `--repeat` imports of each
+module, and the modules that took longest by `-X importtime`.  With
+`--max-ms`, exits with an error when a module takes longer to import than
+that, so slow imports can be caught before they reach the cron jobs:
+
+    python benchmarks/bench_import.py --repeat 10 --max-ms 400 --output imports.json
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+MODULES = (
+    "skyloader",
+    "skyloader.loader_manager",
+    "skyloader.loader_postgres",
+    "skyloader.drive",
+)
+
+
+def time_import(module):
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", f"import {module}"], check=True)
+    return time.perf_counter() - started
+
+
+def slowest_imports(module, top=5):
+    """Return the `top` (cumulative microseconds, module) pairs reported by `-X importtime`."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    timings = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        timings.append((int(cumulative), name.strip()))
+    return sorted(timings, reverse=True)[1:top + 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--max-ms", type=float, help="fail when a module's best import time exceeds this")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    baseline = min(time_import("sys") for _ in range(args.repeat))
+    results = []
+    for module in args.modules:
+        timings = [max(time_import(module) - baseline, 0) for _ in range(args.repeat)]
+        results.append(
+            {
+                "module": module,
+                "best_ms": min(timings) * 1000,
+                "median_ms": statistics.median(timings) * 1000,
+                "slowest": [{"module": name, "cumulative_ms": us / 1000} for us, name in slowest_imports(module)],
+            }
+        )
+    print(f"interpreter startup: {baseline * 1000:.0f} ms (subtracted)")
+    for result in results:
+        slowest = ", ".join(f"{s['module']} {s['cumulative_ms']:.0f}" for s in result["slowest"][:3])
+        print(f"{result['module']:>26}: {result['best_ms']:7.0f} ms best  {result['median_ms']:7.0f} ms median  ({slowest})")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"python": sys.version.split()[0], "baseline_ms": baseline * 1000, "imports": results}, f, indent=2)
+    if args.max_ms is not None:
+        slow = [r["module"] for r in results if r["best_ms"] > args.max_ms]
+        if slow:
+            raise SystemExit(f"Importing {', '.join(slow)} took longer than {args.max_ms:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""Benchmark the whole load pipeline against an in-process Drive and a local database.
+
+Generates `--files` synthetic xlsx or CSV files of `--rows` rows and
+`--columns` columns, serves them from the fake Drive service used by the
+tests, and loads them into SQLite (or PostgreSQL, given `--postgres DSN`).
+Each stage (list, download, parse, records, insert, move) is run over all
+files in turn and reported in rows/s, MB/s of file contents and peak RSS,
+followed by a `LoaderManager.process_files` run of the same files end to
+end, broken down by the stages its `Metrics` times.  Results are printed, and written as JSON with `--output` so runs can
+be compared:
+
+    python benchmarks/bench_pipeline.py --format csv --rows 100000 --columns 20 --output before.json
+"""
+import argparse
+import csv
+import io
+import json
+import logging
+import os
+import platform
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+from skyloader.drive import Drive
+from skyloader.loader_base import LoaderBase
+from skyloader.loader_manager import LoaderManager
+from skyloader.metrics import Metrics
+from skyloader.mode import Mode
+from skyloader.test.fake_drive import FakeDriveService
+
+MIMETYPES = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv",
+}
+
+STAGES = ("list", "download", "parse", "records", "insert", "move")
+
+
+def synthetic_rows(rows, columns, seed=0):
+    """Yield the header and `rows` rows of `columns` columns, cycling through int, float, text, datetime and bool."""
+    rng = np.random.default_rng(seed)
+    yield [f"col_{i}" for i in range(columns)]
+    start = datetime(2023, 1, 1)
+    labels = np.array(["alpha", "beta", "gamma", "delta"])
+    generators = (
+        lambda i: i,
+        lambda i: round(float(rng.normal()), 4),
+        lambda i: str(labels[i % 4]),
+        lambda i: start + timedelta(seconds=i),
+        lambda i: bool(i % 2),
+    )
+    for i in range(rows):
+        yield [generators[c % len(generators)](i) for c in range(columns)]
+
+
+def synthetic_file(kind, rows, columns, seed=0):
+    if kind == "csv":
+        fh = io.StringIO()
+        csv.writer(fh).writerows(synthetic_rows(rows, columns, seed))
+        return fh.getvalue().encode()
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet("data")
+    for row in synthetic_rows(rows, columns, seed):
+        sheet.append(row)
+    fh = io.BytesIO()
+    workbook.save(fh)
+    return fh.getvalue()
+
+
+class InProcessDrive(Drive):
+    """A `Drive` whose downloads are served from the fake service's contents rather than over HTTP."""
+
+    def download_file(self, file_id, export_mimetype=None):
+        fh = tempfile.SpooledTemporaryFile(max_size=self.spool_max_size)
+        fh.write(self.media_request(file_id, export_mimetype).execute())
+        fh.seek(0)
+        return fh
+
+
+class SqliteLoader(LoaderBase):
+    """Appends datafiles to SQLite tables, standing in for a database server."""
+
+    def __init__(self, path=":memory:", batch_size=10_000):
+        super().__init__(schemaname="main")
+        self.path = path
+        self.batch_size = batch_size
+        self.connection = None
+
+    def connect(self):
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.path, check_same_thread=False)
+
+    def close_connection(self):
+        if getattr(self, "connection", None) is not None:
+            self.connection.close()
+            self.connection = None
+
+    def load_datafile(self, datafile, mode=Mode.APPEND, allow_schema_evolution=True):
+        self.connect()
+        columns = ", ".join(f'"{column}"' for column in datafile.columns)
+        placeholders = ", ".join("?" for _ in datafile.columns)
+        with self.connection:
+            self.connection.execute(f'CREATE TABLE IF NOT EXISTS "{datafile.tablename}" ({columns})')
+            for batch in datafile.batches(self.batch_size):
+                self.connection.executemany(
+                    f'INSERT INTO "{datafile.tablename}" ({columns}) VALUES ({placeholders})', batch
+                )
+
+
+for timestamp_type in (datetime, pd.Timestamp):
+    sqlite3.register_adapter(timestamp_type, lambda value: value.isoformat())
+
+
+def postgres_loader(dsn):
+    from skyloader.loader_postgres import PostgresLoader
+
+    class DsnPostgresLoader(PostgresLoader):
+        @property
+        def connection_string(self):
+            return dsn
+
+    loader = DsnPostgresLoader(server=None, database=None, schemaname="skyloader_bench")
+    loader.connect()
+    loader.connection.execute("DROP SCHEMA IF EXISTS skyloader_bench CASCADE")
+    loader.connection.commit()
+    return loader
+
+
+def current_rss():
+    """The resident set size in bytes, or the peak so far where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if platform.system() == "Darwin" else peak * 1024
+
+
+class PeakRss:
+    """Samples the resident set size on a background thread, keeping the peak seen."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, current_rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = current_rss()
+        self._thread = threading.Thread(target=self.sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+
+def measure(name, rows, nbytes, run):
+    with PeakRss() as rss:
+        started = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - started
+    return {
+        "stage": name,
+        "seconds": elapsed,
+        "rows": rows,
+        "rows_per_second": rows / elapsed if elapsed else None,
+        "mb_per_second": nbytes / 2**20 / elapsed if elapsed else None,
+        "peak_rss_mb": rss.peak / 2**20,
+    }
+
+
+def populate(service, payloads, kind):
+    service.add_folder("Archive", "root")
+    service.add_folder("Error", "root")
+    for i, payload in enumerate(payloads):
+        item = service.add_file(f"bench_{i}.{kind}", "root", mimetype=MIMETYPES[kind], size=str(len(payload)))
+        service.contents[item["id"]] = payload
+
+
+def manager_for(loader, payloads, kind, **kwargs):
+    service = FakeDriveService()
+    populate(service, payloads, kind)
+    manager = LoaderManager(InProcessDrive("root", service=service), loader, **kwargs)
+    manager.configure_folders()
+    return manager
+
+
+def run_stages(manager, rows, nbytes):
+    """Run each stage over every file before the next, as `LoaderManager` would for one file."""
+    datafiles = []
+
+    def list_inbox():
+        listed, _ = manager.list_inbox()
+        datafiles.extend(d for d in listed if d.is_file)
+        for datafile in datafiles:
+            manager.prepare_datafile(datafile)
+
+    def download():
+        for datafile in datafiles:
+            datafile.fh = manager.drive.download_datafile(datafile)
+
+    def parse():
+        for datafile in datafiles:
+            datafile.data = datafile.read()
+
+    def records():
+        for datafile in datafiles:
+            for _ in datafile.batches():
+                pass
+
+    def insert():
+        for datafile in datafiles:
+            manager.insert_metadata_fields(datafile)
+            manager.loader.load_datafile(datafile, mode=manager.mode)
+
+    def move():
+        for datafile in datafiles:
+            manager.mark_success(datafile)
+            datafile.release()
+
+    stages = {"list": list_inbox, "download": download, "parse": parse, "records": records, "insert": insert, "move": move}
+    return [measure(name, rows, nbytes if name != "list" else 0, stages[name]) for name in STAGES]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--format", choices=sorted(MIMETYPES), default="xlsx")
+    parser.add_argument("--files", type=int, default=4)
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--columns", type=int, default=10)
+    parser.add_argument("--read-engine", default="auto")
+    parser.add_argument("--download-workers", type=int, default=4)
+    parser.add_argument("--parse-workers", type=int, default=0)
+    parser.add_argument("--postgres", metavar="DSN", help="load into PostgreSQL rather than SQLite")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args()
+    logging.getLogger("skyloader").setLevel(logging.ERROR)
+
+    payloads = [synthetic_file(args.format, args.rows, args.columns, seed=i) for i in range(args.files)]
+    rows = args.rows * args.files
+    nbytes = sum(len(payload) for payload in payloads)
+    options = dict(
+        read_engine=args.read_engine,
+        download_workers=args.download_workers,
+        parse_workers=args.parse_workers,
+    )
+
+    def new_loader():
+        return postgres_loader(args.postgres) if args.postgres else SqliteLoader()
+
+    results = run_stages(manager_for(new_loader(), payloads, args.format, **options), rows, nbytes)
+    metrics = Metrics()
+    manager = manager_for(new_loader(), payloads, args.format, metrics=metrics, **options)
+    results.append(measure("pipeline", rows, nbytes, manager.process_files))
+    if manager.failed:
+        raise SystemExit(f"{manager.failed} files failed to load in the pipeline run")
+
+    report = {
+        "parameters": {**vars(args), "postgres": bool(args.postgres), "bytes": nbytes},
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "stages": results,
+        "pipeline": metrics.report(),
+    }
+    print(f"{args.files} {args.format} files of {args.rows:,} rows x {args.columns} columns, {nbytes / 2**20:.1f} MiB")
+    for result in results:
+        rate = f"{result['rows_per_second']:12,.0f} rows/s  {result['mb_per_second']:8.1f} MB/s"
+        print(f"{result['stage']:>9}: {result['seconds']:8.3f}s  {rate}  {result['peak_rss_mb']:8.1f} MB peak RSS")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
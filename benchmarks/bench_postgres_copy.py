@@ -0,0 +1,89 @@
+"""Compare PostgresLoader's COPY load paths with row-wise executemany.
+
+Requires a reachable PostgreSQL server; point the benchmark at it with a
+libpq connection string:
+
+    python benchmarks/bench_postgres_copy.py "host=localhost dbname=bench" --rows 200000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from skyloader.datafile import DataFile
+from skyloader.loader_postgres import PostgresLoader
+
+
+def synthetic_frame(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    floats = rng.normal(size=rows)
+    floats[rng.random(rows) < 0.05] = np.nan
+    return pd.DataFrame(
+        {
+            "id": np.arange(rows, dtype="int64"),
+            "amount": floats,
+            "label": rng.choice(["alpha", "beta", "gamma", None], size=rows).astype(object),
+            "observed_at": pd.Timestamp("2023-01-01") + pd.to_timedelta(np.arange(rows), unit="s"),
+            "flag": rng.random(rows) < 0.5,
+        }
+    )
+
+
+class DsnPostgresLoader(PostgresLoader):
+    def __init__(self, dsn, **kwargs):
+        super().__init__(server=None, database=None, schemaname="skyloader_bench", **kwargs)
+        self.dsn = dsn
+
+    @property
+    def connection_string(self):
+        return self.dsn
+
+
+def executemany_load(loader, datafile):
+    insert = loader.insert_statement(datafile.columns, datafile.tablename)
+    with loader.connection.transaction():
+        with loader.connection.cursor() as cursor:
+            for batch in datafile.batches(loader.batch_size):
+                cursor.executemany(insert, batch)
+
+
+def run(loader, data, method):
+    datafile = DataFile(name=f"bench_{method}.xlsx")
+    datafile.data = data
+    loader.connect()
+    loader.connection.execute(f"DROP TABLE IF EXISTS {loader.qualified_name(datafile.tablename)}")
+    loader.load_catalog()
+    loader.ensure_table(datafile)
+    started = time.perf_counter()
+    if method == "executemany":
+        executemany_load(loader, datafile)
+    else:
+        loader.load_data(datafile)
+    elapsed = time.perf_counter() - started
+    loader.close_connection()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("dsn", help="libpq connection string of the benchmark database")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    args = parser.parse_args()
+
+    data = synthetic_frame(args.rows)
+    for method in ("executemany", "text", "binary", "arrow"):
+        copy_format = "binary" if method == "binary" else "text"
+        loader = DsnPostgresLoader(args.dsn, copy_format=copy_format, batch_size=args.batch_size)
+        if method == "arrow":
+            import pyarrow as pa
+
+            elapsed = run(loader, pa.Table.from_pandas(data, preserve_index=False), method)
+        else:
+            elapsed = run(loader, data, method)
+        print(f"{method:>12}: {elapsed:8.2f}s  {args.rows / elapsed:12,.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
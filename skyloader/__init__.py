@@ -1,5 +1,8 @@
 from __future__ import annotations
 
+from importlib import import_module
+from importlib.util import find_spec
+
 from skyloader.__version__ import (
     __title__,
     __description__,
@@ -11,7 +14,7 @@ from skyloader.__version__ import (
     __copyright__,
 )
 
-_hard_dependencies = set(["numpy", "pandas", "requests"])
+_hard_dependencies = set(["numpy", "openpyxl", "pandas", "requests"])
 _optional_dependencies = {
     "gdrive": set(
         [
@@ -20,16 +23,20 @@ _optional_dependencies = {
             "google-auth",
             "googleapis-common-protos",
         ]
-    )
+    ),
+    "postgres": set(["psycopg"]),
+    "mssql": set(["pyodbc"]),
+    "calamine": set(["python_calamine"]),
+    "arrow": set(["pyarrow"]),
 }
 _dependencies = _optional_dependencies["gdrive"].union(_hard_dependencies)
 
 
 def _available(dependency: str):
+    """Whether `dependency` can be imported, without importing it."""
     try:
-        __import__(dependency)
-        return True
-    except:
+        return find_spec(dependency) is not None
+    except (ImportError, ValueError):
         return False
 
 
@@ -44,30 +51,50 @@ if m := _missing_hard_dependencies:
       """
     )
 
-del _hard_dependencies, _optional_dependencies, _dependencies, m
-
-from skyloader import (
-    datafile,
-    drive,
-    folder_google,
-    folder_sharepoint,
-    loader_base,
-    loader_manager,
-    loader_postgres,
-    loader_sql_server,
-    mode,
-    utils,
-)
+del _hard_dependencies, _dependencies, m
 
+# Submodules are imported on first access, so that using one backend doesn't
+# import pandas, the Google API client or the drivers of the others
 __all__ = [
+    "cache",
+    "catalog",
     "datafile",
+    "download",
     "drive",
     "folder_google",
     "folder_sharepoint",
+    "ledger",
     "loader_base",
     "loader_manager",
     "loader_postgres",
     "loader_sql_server",
+    "metrics",
     "mode",
+    "pool",
+    "readers",
+    "scheduler",
+    "schema",
+    "sqltypes",
+    "storage_base",
+    "storage_local",
     "utils",
 ]
+
+
+def __getattr__(name: str):
+    if name in __all__:
+        try:
+            return import_module(f"{__name__}.{name}")
+        except ModuleNotFoundError as e:
+            missing = (e.name or "").split(".")[0]
+            for extra, dependencies in _optional_dependencies.items():
+                if missing in dependencies:
+                    raise ModuleNotFoundError(
+                        f"skyloader.{name} requires {missing}; install skyloader[{extra}]", name=e.name
+                    ) from e
+            raise
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
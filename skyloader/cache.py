@@ -0,0 +1,190 @@
+"""Keep parsed files as compressed Parquet, to load them again without parsing.
+
+Parsing a workbook is the slowest step of a load, and a file moved to the
+error folder for a database failure has to be parsed all over again when
+it is replayed.  `ParseCache` stores each parsed file under its Drive
+`md5Checksum` and the `ReadOptions` it was read with, and evicts the least
+recently used files once the cache outgrows its size limit.  Requires
+pyarrow (`skyloader[arrow]`).
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import threading
+from importlib.util import find_spec
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 1024**3
+
+# Bump to invalidate entries written by earlier versions
+CACHE_VERSION = 1
+
+# Schema metadata holding the name a file was parsed under
+NAME_KEY = b"skyloader.name"
+
+
+class ParseCache:
+    """A directory of Parquet files, at most `max_bytes` in all, compressed with `compression`."""
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES, compression="zstd"):
+        if find_spec("pyarrow") is None:
+            raise ImportError("ParseCache requires pyarrow; install skyloader[arrow]")
+        self.path = path
+        self.max_bytes = max_bytes
+        self.compression = compression
+        self.lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def key(self, datafile):
+        """Identify a file's parsed contents by its checksum and the options that shape them, or None without a checksum."""
+        if datafile.md5 is None:
+            return None
+        options = datafile.read_options
+        parts = [CACHE_VERSION, datafile.md5, datafile.mimetype]
+        if options is not None:
+            parts += [options.engine, options.sheet_name, options.dtypes, options.newlines_in_values]
+        return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+    def entry_path(self, datafile):
+        key = self.key(datafile)
+        return os.path.join(self.path, f"{key}.parquet") if key is not None else None
+
+    def get(self, datafile):
+        """Return the cached data of `datafile`, as set out by its `ReadOptions`, or None."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        path = self.entry_path(datafile)
+        if path is None:
+            return None
+        try:
+            table = pq.read_table(path)
+        except FileNotFoundError:
+            return None
+        except (pa.ArrowException, OSError) as e:
+            logger.warning(f"Discarding unreadable cache entry {path} for {datafile}: {e}")
+            self.remove(path)
+            return None
+        try:
+            # The modification time orders entries for eviction
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        table = table.replace_schema_metadata(
+            {k: v for k, v in (table.schema.metadata or {}).items() if k != NAME_KEY}
+        )
+        logger.debug(f"Read {datafile} from cache entry {path}")
+        if datafile.read_options is not None and datafile.read_options.arrow:
+            return table
+        return table.to_pandas()
+
+    def original_name(self, datafile):
+        """The name `datafile` had when it was cached, before any move renamed it, or None."""
+        import pyarrow.parquet as pq
+
+        path = self.entry_path(datafile)
+        if path is None or not os.path.exists(path):
+            return None
+        name = (pq.read_schema(path).metadata or {}).get(NAME_KEY)
+        return name.decode() if name is not None else None
+
+    def put(self, datafile):
+        """Cache the parsed data of `datafile`.
+
+        Data Parquet can't hold, and entries that can't be written, are
+        skipped with a warning: a file that parsed is loaded either way.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        path = self.entry_path(datafile)
+        if path is None or datafile.data is None:
+            return
+        try:
+            if datafile.is_arrow:
+                table = datafile.data
+            else:
+                table = pa.Table.from_pandas(datafile.data, preserve_index=False)
+        except (pa.ArrowException, TypeError, ValueError) as e:
+            logger.warning(f"Not caching {datafile}, whose data Parquet can't hold: {e}")
+            return
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), NAME_KEY: datafile.name.encode()})
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            pq.write_table(table, tmp_path, compression=self.compression)
+            os.replace(tmp_path, path)
+        except (pa.ArrowException, OSError) as e:
+            logger.warning(f"Failed to cache {datafile} as {path}: {e}")
+            self.remove(tmp_path)
+            return
+        logger.debug(f"Cached {datafile} as {path}")
+        self.evict()
+
+    def entries(self):
+        """Return (path, size, modified time) for every entry, least recently used first."""
+        entries = []
+        with os.scandir(self.path) as scan:
+            for entry in scan:
+                if not entry.name.endswith(".parquet"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((entry.path, stat.st_size, stat.st_mtime))
+        entries.sort(key=lambda e: e[2])
+        return entries
+
+    def evict(self, max_bytes=None):
+        """Remove the least recently used entries until the cache fits in `max_bytes`; returns the paths removed."""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        removed = []
+        with self.lock:
+            entries = self.entries()
+            total = sum(size for _, size, _ in entries)
+            for path, size, _ in entries:
+                if total <= max_bytes:
+                    break
+                self.remove(path)
+                removed.append(path)
+                total -= size
+        return removed
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m skyloader.cache",
+        description="Inspect a skyloader parse cache, or prune it to a size",
+    )
+    parser.add_argument("cache", help="path of the cache directory")
+    parser.add_argument("command", choices=["list", "prune"])
+    parser.add_argument("--max-bytes", type=int, default=DEFAULT_MAX_BYTES)
+    args = parser.parse_args()
+
+    cache = ParseCache(args.cache, max_bytes=args.max_bytes)
+    if args.command == "list":
+        import pyarrow.parquet as pq
+
+        entries = cache.entries()
+        for path, size, _ in entries:
+            metadata = pq.read_metadata(path)
+            name = (metadata.schema.to_arrow_schema().metadata or {}).get(NAME_KEY, b"?").decode()
+            print(f"{os.path.basename(path)}  {name}  {metadata.num_rows} rows  {size:,} bytes")
+        print(f"{len(entries)} entries, {sum(size for _, size, _ in entries):,} bytes")
+        return
+
+    removed = cache.evict()
+    print(f"{len(removed)} entries removed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import re
+
+# A single round trip returning the target schema, with the columns of its tables;
+# uppercase names work with case-sensitive SQL Server collations and Postgres alike,
+# and the schema name is compared the way the database compares identifiers
+CATALOG_QUERY = """
+SELECT s.SCHEMA_NAME, c.TABLE_NAME, c.COLUMN_NAME, c.DATA_TYPE,
+       c.CHARACTER_MAXIMUM_LENGTH, c.NUMERIC_PRECISION, c.NUMERIC_SCALE, c.IS_NULLABLE
+FROM INFORMATION_SCHEMA.SCHEMATA s
+LEFT JOIN INFORMATION_SCHEMA.COLUMNS c ON c.TABLE_SCHEMA = s.SCHEMA_NAME
+WHERE s.SCHEMA_NAME = {placeholder}
+ORDER BY s.SCHEMA_NAME, c.TABLE_NAME, c.ORDINAL_POSITION
+"""
+
+SQL_TYPE_PATTERN = re.compile(r"^\s*([a-z0-9_ ]+?)\s*(?:\(\s*(max|\d+)\s*(?:,\s*(\d+)\s*)?\))?\s*$", re.I)
+
+# Types whose single parameter is a length rather than a precision
+LENGTH_TYPES = {"char", "varchar", "nchar", "nvarchar", "binary", "varbinary", "character varying", "character"}
+
+
+class Column:
+    def __init__(self, name, data_type, max_length=None, precision=None, scale=None, nullable=True):
+        self.name = name
+        self.data_type = data_type.lower()
+        self.max_length = max_length
+        self.precision = precision
+        self.scale = scale
+        self.nullable = nullable
+
+    @classmethod
+    def from_sql_type(cls, name, sql_type, nullable=True):
+        """Build a column from a type as written in DDL, such as `nvarchar(max)` or `decimal(10,2)`."""
+        match = SQL_TYPE_PATTERN.match(sql_type)
+        if match is None:
+            return cls(name, sql_type, nullable=nullable)
+        data_type, first, second = match.groups()
+        data_type = data_type.lower()
+        if first is None:
+            return cls(name, data_type, nullable=nullable)
+        if data_type in LENGTH_TYPES:
+            return cls(name, data_type, max_length=-1 if first.lower() == "max" else int(first), nullable=nullable)
+        return cls(name, data_type, precision=int(first), scale=int(second) if second else None, nullable=nullable)
+
+    def __eq__(self, other):
+        return isinstance(other, Column) and (
+            self.name, self.data_type, self.max_length, self.precision, self.scale, self.nullable
+        ) == (other.name, other.data_type, other.max_length, other.precision, other.scale, other.nullable)
+
+    def __repr__(self):
+        return (
+            f"<Column {self.name} {self.data_type} length={self.max_length} precision={self.precision} "
+            f"scale={self.scale} nullable={self.nullable}>"
+        )
+
+
+class Catalog:
+    """The schemas, tables and columns of a target database.
+
+    Loaded with one introspection query, then kept up to date by the loader
+    as it creates objects, so DDL is only sent when something is missing.
+    Names are matched case-insensitively, as SQL Server does by default,
+    unless `case_sensitive`, as Postgres matches the quoted identifiers
+    loaders write.  Columns keep the names the database spells them with.
+    """
+
+    def __init__(self, case_sensitive=False):
+        self.case_sensitive = case_sensitive
+        self.schemas = set()
+        self.tables = {}
+
+    @classmethod
+    def from_rows(cls, rows, case_sensitive=False):
+        catalog = cls(case_sensitive)
+        for schema, table, column, data_type, max_length, precision, scale, is_nullable in rows:
+            catalog.add_schema(schema)
+            if table is None:
+                continue
+            columns = catalog.tables.setdefault(catalog.table_key(schema, table), {})
+            columns[catalog.key(column)] = Column(
+                column, data_type, max_length, precision, scale, nullable=is_nullable != "NO"
+            )
+        return catalog
+
+    @classmethod
+    def load(cls, connection, schema, placeholder="?", case_sensitive=False):
+        """Introspect `schema` only, with `placeholder` as the driver's parameter marker."""
+        query = CATALOG_QUERY.format(placeholder=placeholder)
+        return cls.from_rows(connection.execute(query, (schema,)).fetchall(), case_sensitive)
+
+    def key(self, name):
+        """The key `name` is matched by."""
+        return str(name) if self.case_sensitive else str(name).lower()
+
+    def table_key(self, schema, table):
+        return self.key(schema), self.key(table)
+
+    def has_schema(self, schema):
+        return self.key(schema) in self.schemas
+
+    def has_table(self, schema, table):
+        return self.table_key(schema, table) in self.tables
+
+    def columns(self, schema, table):
+        """Return the table's columns in order, or None when the table is not known."""
+        columns = self.tables.get(self.table_key(schema, table))
+        return list(columns.values()) if columns is not None else None
+
+    def add_schema(self, schema):
+        self.schemas.add(self.key(schema))
+
+    def add_table(self, schema, table, columns):
+        self.add_schema(schema)
+        self.tables[self.table_key(schema, table)] = {self.key(c.name): c for c in columns}
+
+    def add_columns(self, schema, table, columns):
+        for column in columns:
+            self.tables[self.table_key(schema, table)][self.key(column.name)] = column
+
+    def drop_table(self, schema, table):
+        self.tables.pop(self.table_key(schema, table), None)
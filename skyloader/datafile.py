@@ -1,8 +1,47 @@
+import io
 from datetime import datetime
 from pathlib import Path
 
 import numpy as np
 
+from skyloader.readers import reader_for
+from skyloader.sqltypes import is_arrow
+
+DEFAULT_BATCH_SIZE = 10_000
+
+
+def column_values(series):
+    """Convert a column to a list of native Python values, with nulls as None."""
+    if isinstance(series.dtype, np.dtype) and series.dtype.kind in "biuf":
+        values = series.to_numpy().tolist()
+    else:
+        values = series.to_numpy(dtype=object).tolist()
+    mask = series.isna().to_numpy()
+    if mask.any():
+        for i in np.flatnonzero(mask).tolist():
+            values[i] = None
+    return values
+
+
+def read_file(fh, options=None, name=None, mimetype=None):
+    """Parse a downloaded file into a DataFrame, as set out by `ReadOptions`.
+
+    The file's format is told by its `mimetype`, or the suffix of its `name`.
+    """
+    return reader_for(options, name, mimetype).read(fh)
+
+
+def parse_payload(payload, options=None, name=None, mimetype=None):
+    """Parse the raw bytes of a file; used to parse in worker processes."""
+    return read_file(io.BytesIO(payload), options, name, mimetype)
+
+
+def parse_path(path, options=None, name=None, mimetype=None):
+    """Parse the file at `path`; used to parse local files in worker processes."""
+    with open(path, "rb") as fh:
+        return read_file(fh, options, name, mimetype)
+
+
 class DataFile:
     def __init__(
         self,
@@ -12,7 +51,9 @@ class DataFile:
         kind=None,
         stat=None,
         parents=None,
-        run_id=None
+        run_id=None,
+        md5=None,
+        size=None,
     ):
         self.name = name
         self.mimetype = mimetype
@@ -20,11 +61,24 @@ class DataFile:
         self.kind = kind
         self.stat = stat
         self.fh = None
-        self.data = None
+        self._data = None
         self.success = False
         self.fail = False
         self.processed = 0
         self.parents = parents if parents is not None else []
+        self.run_id = run_id
+        self.md5 = md5
+        self.size = size
+        self.target_table = None
+        self.read_options = None
+        # The format native Google documents were exported in, when downloaded
+        self.export_mimetype = None
+        # Column and value identifying the rows this file replaces when merged
+        self.partition = None
+        # Streamed files are read a chunk at a time; see `stream`
+        self.streamed = False
+        self.added_columns = {}
+        self.chunk_types = None
 
     @classmethod
     def from_gdrive(cls, gdrive_object):
@@ -38,6 +92,9 @@ class DataFile:
             "modified_at": gdrive_object["modifiedTime"],
         }
         c.parents = gdrive_object["parents"]
+        # Folders and native Google documents have no checksum or size
+        c.md5 = gdrive_object.get("md5Checksum")
+        c.size = int(gdrive_object["size"]) if "size" in gdrive_object else None
         return c
 
     @property
@@ -84,6 +141,15 @@ class DataFile:
     def is_file(self):
         return not self.is_folder
 
+    @property
+    def is_google_document(self):
+        return (self.mimetype or "").startswith("application/vnd.google-apps.") and not self.is_folder
+
+    @property
+    def content_type(self):
+        """The mimetype of the downloaded contents."""
+        return self.export_mimetype or self.mimetype
+
     @property
     def is_inbox(self):
         return self.name.lower() == "Inbox" ## <<< NOTE: we are NOW using the root as the inbox for each registered folder
@@ -100,20 +166,133 @@ class DataFile:
     def is_logs(self):
         return self.name.lower() == "log" if self.name else False
 
+    @property
+    def data(self):
+        """The parsed contents of the file, read on first access; the current chunk of a streamed file."""
+        if self._data is None and self.fh is not None and not self.streamed:
+            self._data = self.read()
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+
+    def open(self):
+        """Return the downloaded contents as a binary file object, rewound."""
+        if self.fh is None:
+            raise ValueError(f"{self} has not been downloaded")
+        self.fh.seek(0)
+        return self.fh
+
+    def read(self):
+        return read_file(self.open(), self.read_options, self.name, self.content_type)
+
+    def read_chunks(self):
+        """Yield the downloaded contents as DataFrames of at most `ReadOptions.chunk_size` rows."""
+        return reader_for(self.read_options, self.name, self.content_type).chunks(self.open())
+
+    def stream(self):
+        """Read the file a chunk at a time as loaders iterate `chunks`, rather than whole.
+
+        Only the first chunk is read now, as `data`, for its columns.
+        """
+        self.streamed = True
+        self.added_columns = {}
+        self.chunk_types = None
+        chunks = self.read_chunks()
+        try:
+            self._data = next(chunks, None)
+        finally:
+            chunks.close()
+
+    def chunks(self):
+        """Yield the data whole, or chunk by chunk from the start of a streamed file.
+
+        Each chunk is `data` while it is yielded, with the columns given to
+        `add_column`.
+        """
+        if not self.streamed:
+            yield self.data
+            return
+        for chunk in self.read_chunks():
+            self._data = chunk
+            for name, value in self.added_columns.items():
+                self.set_column(name, value)
+            yield self._data
+
+    def release(self):
+        """Drop the parsed data and close the downloaded contents."""
+        self._data = None
+        self.chunk_types = None
+        if self.fh is not None:
+            self.fh.close()
+            self.fh = None
+
     @property
     def records(self):
-        records = self.data.replace({np.nan: None}).to_dict(orient='records')
-        for item in records:
-            self.processed += 1
-            yield tuple(item.values())
+        for batch in self.batches():
+            yield from batch
+
+    @property
+    def is_arrow(self):
+        """Whether the data is held as an Arrow table rather than a DataFrame."""
+        return is_arrow(self.data)
+
+    def add_column(self, name, value):
+        """Add a column holding `value` in every row.
+
+        Arrow tables get a new column next to the existing ones, which are
+        not copied.  Streamed files get it in every chunk.
+        """
+        if self.streamed:
+            self.added_columns[name] = value
+        self.set_column(name, value)
+
+    def set_column(self, name, value):
+        if self.is_arrow:
+            import pyarrow as pa
+
+            self.data = self.data.append_column(name, pa.repeat(value, self.data.num_rows))
+        else:
+            self.data[name] = value
+
+    def arrow_batches(self, batch_size=DEFAULT_BATCH_SIZE, start=0):
+        """Yield slices of an Arrow table, `batch_size` rows at a time, without copying."""
+        data = self.data
+        for offset in range(start, data.num_rows, batch_size):
+            chunk = data.slice(offset, batch_size)
+            self.processed += chunk.num_rows
+            yield chunk
+
+    def column_batches(self, batch_size=DEFAULT_BATCH_SIZE, start=0):
+        """Yield the data as lists of column buffers, `batch_size` rows at a time.
+
+        Values are taken from each column's array directly, with NaN/NaT/NA
+        converted to None, so the frame is never copied as a whole.
+        """
+        if self.is_arrow:
+            for chunk in self.arrow_batches(batch_size, start):
+                yield [column.to_pylist() for column in chunk.columns]
+            return
+        data = self.data
+        for offset in range(start, len(data), batch_size):
+            chunk = data.iloc[offset:offset + batch_size]
+            columns = [column_values(chunk.iloc[:, i]) for i in range(chunk.shape[1])]
+            self.processed += len(chunk)
+            yield columns
+
+    def batches(self, batch_size=DEFAULT_BATCH_SIZE, start=0):
+        """Yield the data as lists of parameter tuples, `batch_size` rows at a time."""
+        for columns in self.column_batches(batch_size, start=start):
+            yield list(zip(*columns))
 
     @property
     def columns(self):
-        return self.data.columns
+        return self.data.column_names if self.is_arrow else self.data.columns
 
     @property
     def tablename(self):
-        return self.stem
+        return self.target_table or self.stem
 
     def __repr__(self):
         return f"<Datafile {self.name} id={self.identifier}>"
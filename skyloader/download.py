@@ -0,0 +1,155 @@
+"""Download large files as concurrent HTTP Range requests.
+
+Download time of large files is dominated by per-request latency when they
+are fetched one chunk after another.  `RangedDownloader` splits a file of
+known size into ranges, fetches them on a pool of threads straight into
+their place in a preallocated temporary file, retries each range on its
+own, and checks the result against the file's MD5 checksum.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .metrics import NULL_METRICS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 16 * 1024 * 1024
+DEFAULT_WORKERS = 8
+DEFAULT_RETRIES = 3
+
+# Bytes read from a response, or from the file when checksumming, at a time
+BLOCK_SIZE = 1024 * 1024
+
+
+class DownloadError(Exception):
+    pass
+
+
+class ChecksumMismatch(DownloadError):
+    pass
+
+
+def file_md5(fh):
+    digest = hashlib.md5()
+    fh.seek(0)
+    while block := fh.read(BLOCK_SIZE):
+        digest.update(block)
+    fh.seek(0)
+    return digest.hexdigest()
+
+
+class RangedDownloader:
+    """Downloads files as `chunk_size` byte ranges, fetched on `workers` threads.
+
+    `session_factory` is called once per thread for the `requests.Session`
+    (or `google.auth.transport.requests.AuthorizedSession`) it sends its
+    requests with; a plain `requests.Session` by default.  A range that fails is retried up to `retries` times,
+    resuming after the bytes it already received.
+    """
+
+    def __init__(
+        self,
+        session_factory=None,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        workers=DEFAULT_WORKERS,
+        retries=DEFAULT_RETRIES,
+        backoff=0.5,
+        timeout=60,
+        metrics=NULL_METRICS,
+    ):
+        self.session_factory = session_factory
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.metrics = metrics
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self.retried = 0
+
+    def session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            if self.session_factory is None:
+                import requests
+
+                self.session_factory = requests.Session
+            session = self._local.session = self.session_factory()
+        return session
+
+    def ranges(self, size):
+        return [(start, min(start + self.chunk_size, size) - 1) for start in range(0, size, self.chunk_size)]
+
+    def write_at(self, fh, data, offset):
+        """Write `data` at `offset` in `fh` without moving a file position shared with other threads."""
+        if hasattr(os, "pwrite"):
+            view = memoryview(data)
+            while view:
+                written = os.pwrite(fh.fileno(), view, offset)
+                view, offset = view[written:], offset + written
+            return
+        with self._write_lock:
+            fh.seek(offset)
+            fh.write(data)
+
+    def fetch_range(self, url, fh, start, end, headers=None):
+        """Fetch bytes `start` to `end` inclusive into their place in `fh`, retrying from where a failure left off."""
+        import requests
+
+        position = start
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session().get(
+                    url,
+                    headers={**(headers or {}), "Range": f"bytes={position}-{end}"},
+                    stream=True,
+                    timeout=self.timeout,
+                )
+                with response:
+                    if response.status_code != 206:
+                        response.raise_for_status()
+                        raise DownloadError(f"Expected a partial response for a range of {url}; got {response.status_code}")
+                    for block in response.iter_content(BLOCK_SIZE):
+                        block = block[:end + 1 - position]
+                        self.write_at(fh, block, position)
+                        position += len(block)
+                if position > end:
+                    return end + 1 - start
+                raise DownloadError(f"Range {start}-{end} of {url} ended after {position - start} bytes")
+            except (requests.RequestException, DownloadError) as e:
+                if attempt == self.retries:
+                    raise DownloadError(f"Range {start}-{end} of {url} failed after {attempt + 1} attempts") from e
+                self.retried += 1
+                self.metrics.count("retries")
+                logger.warning(f"Range {start}-{end} of {url} failed ({e}); retrying from byte {position}")
+                time.sleep(self.backoff * 2**attempt)
+
+    def download(self, url, size, md5=None, headers=None):
+        """Download `size` bytes from `url` into a temporary file, and return it rewound.
+
+        Raises `ChecksumMismatch` if `md5` is given and the contents don't match it.
+        """
+        fh = tempfile.TemporaryFile()
+        try:
+            fh.truncate(size)
+            ranges = self.ranges(size)
+            logger.debug(f"Downloading {size} bytes from {url} in {len(ranges)} ranges")
+            with ThreadPoolExecutor(min(self.workers, len(ranges)) or 1) as pool:
+                futures = [pool.submit(self.fetch_range, url, fh, start, end, headers) for start, end in ranges]
+                for future in futures:
+                    future.result()
+            if md5 is not None:
+                actual = file_md5(fh)
+                if actual != md5:
+                    raise ChecksumMismatch(f"MD5 of {url} is {actual}; expected {md5}")
+            fh.seek(0)
+            return fh
+        except BaseException:
+            fh.close()
+            raise
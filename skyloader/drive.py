@@ -1,99 +1,289 @@
-import io
-
-from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload, MediaIoBaseUpload
+from __future__ import annotations
 
-import pandas as pd
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+from typing import TYPE_CHECKING
 
 from .datafile import DataFile
+from .download import DEFAULT_CHUNK_SIZE, DEFAULT_WORKERS, RangedDownloader
+from .storage_base import FOLDER_MIMETYPE, StorageBase
 from .utils import authenticated
 
+# The Google API client takes a good part of a second to import, so it is
+# only imported once Drive is actually talked to
+if TYPE_CHECKING:
+    from google.oauth2.service_account import Credentials
+
+logger = logging.getLogger(__name__)
+
 SCOPES = ["https://www.googleapis.com/auth/drive"]
 
+# Drive accepts at most 100 calls in one batch request
+BATCH_LIMIT = 100
+
+# The largest page files().list and changes().list will return
+PAGE_SIZE = 1000
+
+FILE_FIELDS = "id, name, createdTime, kind, mimeType, modifiedTime, properties, parents, md5Checksum, size"
+
+# Downloads are held in memory up to this size, and spill to a temporary file beyond it
+SPOOL_MAX_SIZE = 32 * 1024 * 1024
+
+# Files at least this large are downloaded as concurrent ranges
+RANGE_THRESHOLD = 64 * 1024 * 1024
+
+MEDIA_URL = "https://www.googleapis.com/drive/v3/files/{file_id}?alt=media&supportsAllDrives=true"
+
+SPREADSHEET_MIMETYPE = "application/vnd.google-apps.spreadsheet"
+CSV_MIMETYPE = "text/csv"
+XLSX_MIMETYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def export_mimetype(datafile):
+    """Choose the format to export a native Google Sheet in, to read its configured sheet.
+
+    Drive exports only the first sheet of a spreadsheet as CSV, which is much
+    faster to parse than a workbook; any other sheet needs the whole
+    spreadsheet exported as xlsx.
+    """
+    if datafile.mimetype != SPREADSHEET_MIMETYPE:
+        raise ValueError(f"{datafile} is a {datafile.mimetype} document; only spreadsheets can be exported for loading")
+    sheet_name = datafile.read_options.sheet_name if datafile.read_options is not None else None
+    return CSV_MIMETYPE if sheet_name in (None, 0) else XLSX_MIMETYPE
+
+
+class PageTokenStore:
+    """Keeps the Drive changes page token between runs in a local JSON file."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path) as f:
+            return json.load(f).get("page_token")
+
+    def save(self, page_token):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"page_token": page_token}, f)
+        os.replace(tmp_path, self.path)
+
 
-class Drive:
+class Drive(StorageBase):
     credentials: Credentials
     root_id: str
 
-    def __init__(self, root_folder_id: str, credentials: Credentials):
-        self.credentials = credentials.with_scopes(SCOPES)
+    def __init__(
+        self,
+        root_folder_id: str,
+        credentials: Credentials = None,
+        spool_max_size: int = SPOOL_MAX_SIZE,
+        page_size: int = PAGE_SIZE,
+        service=None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        range_threshold: int = RANGE_THRESHOLD,
+        range_workers: int = DEFAULT_WORKERS,
+        downloader: RangedDownloader = None,
+    ):
+        super().__init__()
+        self.credentials = credentials.with_scopes(SCOPES) if credentials is not None else None
         self.root_id = root_folder_id
+        self.spool_max_size = spool_max_size
+        self.page_size = page_size
+        self.chunk_size = chunk_size
+        self.range_threshold = range_threshold
+        self.range_workers = range_workers
+        self._downloader = downloader
+        self.media_url = MEDIA_URL
         self.root = DataFile(
             name="Root",
             identifier=self.root_id,
-            mimetype="application/vnd.google-apps.folder",
+            mimetype=FOLDER_MIMETYPE,
         )
-        self.authenticated = False
-        self.service = None
+        self.authenticated = service is not None
+        self.service = service
         self.successful = None
         self.fail = None
+        self._local = threading.local()
 
 
     def authenticate(self):
         """Authenticate to Google Drive using a service account."""
+        from googleapiclient.discovery import build
+
         service = build("drive", "v3", credentials=self.credentials)
         self.service = service
         self.authenticated = True
 
 
+    def thread_http(self):
+        """Return an authorized HTTP object owned by the calling thread.
+
+        httplib2 connections are not thread-safe, so requests issued from
+        worker threads must not share the service's own connection.
+        """
+        http = getattr(self._local, "http", None)
+        if http is None:
+            from google_auth_httplib2 import AuthorizedHttp
+            from googleapiclient.http import build_http
+
+            http = self._local.http = AuthorizedHttp(self.credentials, http=build_http())
+        return http
+
+
+    @property
+    def downloader(self):
+        """The `RangedDownloader` for large files, sending requests on sessions authorized with our credentials."""
+        if self._downloader is None:
+            from google.auth.transport.requests import AuthorizedSession
+
+            self._downloader = RangedDownloader(
+                session_factory=lambda: AuthorizedSession(self.credentials),
+                chunk_size=self.chunk_size,
+                workers=self.range_workers,
+            )
+        return self._downloader
+
+
     @authenticated
     def _ls(self, folder_id=None):
-        """List all files in a Google Drive folder."""
+        """List all files in a Google Drive folder, following every page of results."""
         folder_id = folder_id or self.root_id
 
-        fields = "files(id, name, createdTime, kind, mimeType, modifiedTime, properties, parents)"
-        results = (
-            self.service.files()
-            .list(
-                q=f"'{folder_id}' in parents", 
-                fields=fields,
-                corpora="allDrives",
-                includeItemsFromAllDrives=True,
-                supportsAllDrives=True
+        files = []
+        page_token = None
+        while True:
+            results = (
+                self.service.files()
+                .list(
+                    q=f"'{folder_id}' in parents",
+                    fields=f"nextPageToken, files({FILE_FIELDS})",
+                    pageSize=self.page_size,
+                    pageToken=page_token,
+                    corpora="allDrives",
+                    includeItemsFromAllDrives=True,
+                    supportsAllDrives=True
+                )
+                .execute()
             )
-            .execute()
-        )
-        return results.get("files", [])
+            files.extend(results.get("files", []))
+            page_token = results.get("nextPageToken")
+            if not page_token:
+                return files
 
-    def ls(
-        self, folder_id=None, download=False, most_recent_only=False
-    ):
-        folder_id = folder_id or self.root_id
-        datafiles = [
-            DataFile.from_gdrive(item) for item in self._ls(folder_id=folder_id)
-        ]
-        if most_recent_only and datafiles:
-            datafiles = [max(datafiles, key=lambda d: d.modified_at and d.is_file)]
-        datafiles.sort(key=lambda d: d.modified_at)
-        if download:
-            self.download_files(datafiles)
-        return datafiles
+
+    @authenticated
+    def start_page_token(self):
+        """Return the page token from which to list changes made after this call."""
+        results = self.service.changes().getStartPageToken(supportsAllDrives=True).execute()
+        return results["startPageToken"]
 
 
     @authenticated
-    def download_files(self, files: list):
-        for file in files:
-            if not file.is_folder:
-                fh = self.download_file(file.identifier)
-                file.fh = fh
-                file.data = pd.read_excel(fh) ###  <<< wouldn't this blow up the memory usage if we are loading all files into memory??  should we move this function outside the "drive" to simply return file-like objects to be processed externally??
+    def _changes(self, page_token):
+        """List all changes since `page_token`, along with the token to resume from next time."""
+        changes = []
+        while True:
+            results = (
+                self.service.changes()
+                .list(
+                    pageToken=page_token,
+                    fields=f"nextPageToken, newStartPageToken, changes(fileId, removed, file({FILE_FIELDS}, trashed))",
+                    pageSize=self.page_size,
+                    includeItemsFromAllDrives=True,
+                    supportsAllDrives=True
+                )
+                .execute()
+            )
+            changes.extend(results.get("changes", []))
+            if "newStartPageToken" in results:
+                return changes, results["newStartPageToken"]
+            page_token = results["nextPageToken"]
+
+
+    def ls_changed(self, folder_ids, page_token=None):
+        """List files added to or modified in any of `folder_ids` since `page_token`.
+
+        Without a page token every folder is listed in full.  Returns the
+        files, oldest first, and the page token to pass on the next call;
+        callers should only store that token once the files are processed.
+        """
+        folder_ids = set(folder_ids)
+        if page_token is None:
+            new_page_token = self.start_page_token()
+            items = [item for folder_id in folder_ids for item in self._ls(folder_id=folder_id)]
+        else:
+            changes, new_page_token = self._changes(page_token)
+            latest = {}
+            for change in changes:
+                file = change.get("file")
+                if (
+                    change.get("removed")
+                    or file is None
+                    or file.get("trashed")
+                    or not folder_ids.intersection(file.get("parents", []))
+                ):
+                    latest.pop(change["fileId"], None)
+                else:
+                    latest[change["fileId"]] = file
+            items = list(latest.values())
+        datafiles = [DataFile.from_gdrive(item) for item in items]
+        datafiles.sort(key=lambda d: d.modified_at)
+        return datafiles, new_page_token
+
+
+    def list_datafiles(self, folder_id):
+        return [DataFile.from_gdrive(item) for item in self._ls(folder_id=folder_id)]
+
+
+    def download_datafile(self, datafile):
+        """Download a file's contents, exporting native Google documents in the format they are read in."""
+        if datafile.is_google_document:
+            datafile.export_mimetype = export_mimetype(datafile)
+            return self.download_file(datafile.identifier, export_mimetype=datafile.export_mimetype)
+        if datafile.size is not None and datafile.size >= self.range_threshold:
+            return self.download_ranges(datafile)
+        return self.download_file(datafile.identifier)
+
+
+    def download_ranges(self, datafile):
+        """Download a large file as concurrent ranges into a temporary file, checked against its MD5 checksum."""
+        url = self.media_url.format(file_id=datafile.identifier)
+        self.downloader.metrics = self.metrics
+        return self.downloader.download(url, datafile.size, md5=datafile.md5)
+
+
+    def media_request(self, file_id, export_mimetype=None):
+        if export_mimetype is not None:
+            return self.service.files().export_media(fileId=file_id, mimeType=export_mimetype)
+        return self.service.files().get_media(fileId=file_id)
 
 
     @authenticated
-    def download_file(self, file_id):
-        """Download a file from Google Drive and return a file-like object."""
-        request = self.service.files().get_media(fileId=file_id)
+    def download_file(self, file_id, export_mimetype=None):
+        """Download a file from Google Drive and return a file-like object.
+
+        Native Google documents have no contents of their own, and must be
+        exported as `export_mimetype` instead.
+        """
+        from googleapiclient.http import MediaIoBaseDownload
 
-        fh = io.BytesIO()
-        downloader = MediaIoBaseDownload(fh, request)
+        request = self.media_request(file_id, export_mimetype)
+        request.http = self.thread_http()
+
+        fh = tempfile.SpooledTemporaryFile(max_size=self.spool_max_size)
+        downloader = MediaIoBaseDownload(fh, request, chunksize=self.chunk_size)
 
         done = False
-        i = 0
         while not done:
             status, done = downloader.next_chunk()
-            if not (i % 5):
-                print(f"Downloaded {i+1} chunks")
+            logger.debug(f"Downloaded {int(status.progress() * 100)}% of {file_id}")
         fh.seek(0)
         return fh
 
@@ -127,29 +317,59 @@ class Drive:
         return file
 
 
-    @authenticated
-    def move_and_rename_file(self, file_id, new_parent_id, new_name):
-        """Move and rename a file."""
-        file = self.service.files().get(fileId=file_id, fields="parents", supportsAllDrives=True).execute()
-        previous_parents = ",".join(file.get("parents"))
-        file = (
-            self.service.files()
-            .update(
-                fileId=file_id,
-                body={"name": new_name},
-                addParents=new_parent_id,
-                removeParents=previous_parents,
-                fields="id, parents, name",
-                supportsAllDrives=True
-            )
-            .execute()
+    def move_and_rename_request(self, file_id, new_parent_id, new_name, previous_parents):
+        return self.service.files().update(
+            fileId=file_id,
+            body={"name": new_name},
+            addParents=new_parent_id,
+            removeParents=",".join(previous_parents),
+            fields="id, parents, name",
+            supportsAllDrives=True
         )
-        return file
+
+
+    @authenticated
+    def move_and_rename_file(self, file_id, new_parent_id, new_name, previous_parents=None):
+        """Move and rename a file.
+
+        The file's current parents are looked up unless `previous_parents` is given.
+        """
+        if previous_parents is None:
+            file = self.service.files().get(fileId=file_id, fields="parents", supportsAllDrives=True).execute()
+            previous_parents = file.get("parents")
+        request = self.move_and_rename_request(file_id, new_parent_id, new_name, previous_parents)
+        return request.execute()
+
+
+    @authenticated
+    def flush_moves(self):
+        """Send all queued moves as batch requests.
+
+        Returns a mapping of file id to the exception raised for that file's
+        move, or None when it succeeded.
+        """
+        results = {}
+
+        def callback(request_id, response, exception):
+            results[request_id] = exception
+
+        moves, self.pending_moves = self.pending_moves, []
+        for start in range(0, len(moves), BATCH_LIMIT):
+            batch = self.service.new_batch_http_request(callback=callback)
+            for datafile, new_parent_id, new_name in moves[start:start + BATCH_LIMIT]:
+                request = self.move_and_rename_request(
+                    datafile.id, new_parent_id, new_name, datafile.parents
+                )
+                batch.add(request, request_id=datafile.id)
+            batch.execute()
+        return results
     
 
     @authenticated
     def upload_file(self, fh, file_name, parent_folder_id):
         """Upload a file-like object to Google Drive."""
+        from googleapiclient.http import MediaIoBaseUpload
+
         fh.seek(0)
         media = MediaIoBaseUpload(fh, mimetype='application/octet-stream', resumable=True)
         request = self.service.files().create(
@@ -163,8 +383,10 @@ class Drive:
 
 
     @authenticated
-    def upload_log_to_drive(self, log_stream, file_name, parent_folder_id):
+    def upload_log(self, log_stream, file_name, parent_folder_id):
         """Upload a log stream to Google Drive."""
+        from googleapiclient.http import MediaIoBaseUpload
+
         log_stream.seek(0)  # Ensure the stream is at the beginning
         byte_stream = io.BytesIO(log_stream.getvalue().encode())  # Encode text to bytes
         media = MediaIoBaseUpload(byte_stream, mimetype='text/plain', resumable=True)
@@ -178,3 +400,5 @@ class Drive:
             supportsAllDrives=True
         )
         request.execute()
+
+    upload_log_to_drive = upload_log
@@ -1,11 +1,18 @@
 from .mode import Mode
 
 class GoogleFolder:
-    def __init__(self, folder_id, desc, mode=Mode.APPEND, match_pattern="", allow_schema_evolution=True, sheet_name=None, date_mask="YYYYMMDD"):
+    def __init__(self, folder_id, desc, mode=Mode.APPEND, match_pattern="", allow_schema_evolution=True, sheet_name=None, date_mask="YYYYMMDD", target_table=None, database=None, dtypes=None):
         self.id = folder_id
         self.desc = desc
         self.mode = mode
         self.match_pattern = match_pattern
         self.allow_schema_evolution = allow_schema_evolution
         self.sheet_name = sheet_name
-        self.date_mask = date_mask
\ No newline at end of file
+        self.date_mask = date_mask
+        self.target_table = target_table or desc
+        self.database = database
+        # Column name to dtype, for columns whose type shouldn't be inferred
+        self.dtypes = dtypes
+
+    def __repr__(self):
+        return f"<GoogleFolder {self.desc} id={self.id}>"
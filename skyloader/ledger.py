@@ -0,0 +1,167 @@
+import argparse
+import datetime
+import logging
+import sqlite3
+import threading
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+
+class LoadLedger:
+    """A local SQLite record of every file loaded, keyed on its content.
+
+    Files are identified by their Drive `md5Checksum` and size together with
+    the table they were loaded into, so a re-uploaded copy of a loaded file,
+    or a loaded file whose move to the archive failed, can be recognized
+    before it is downloaded again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                """CREATE TABLE IF NOT EXISTS loads (
+                    md5 TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    target_table TEXT NOT NULL,
+                    file_id TEXT,
+                    name TEXT,
+                    run_id TEXT,
+                    row_count INTEGER,
+                    loaded_at TEXT,
+                    PRIMARY KEY (md5, size, target_table)
+                )"""
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS loads_by_run ON loads (target_table, run_id)"
+            )
+
+    def close(self):
+        self.connection.close()
+
+    def contains(self, datafile, target_table):
+        if datafile.md5 is None or datafile.size is None:
+            return False
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT 1 FROM loads WHERE md5 = ? AND size = ? AND target_table = ?",
+                (datafile.md5, datafile.size, target_table),
+            ).fetchone()
+        return row is not None
+
+    def record(self, datafile, target_table):
+        if datafile.md5 is None or datafile.size is None:
+            logger.debug(f"{datafile} has no checksum; not recording it in the ledger")
+            return
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO loads VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    datafile.md5,
+                    datafile.size,
+                    target_table,
+                    datafile.id,
+                    datafile.name,
+                    datafile.run_id,
+                    datafile.processed,
+                    datetime.datetime.now().isoformat(),
+                ),
+            )
+
+    def entries(self, target_table=None):
+        query = "SELECT md5, size, target_table, file_id, name, run_id, row_count, loaded_at FROM loads"
+        params = ()
+        if target_table is not None:
+            query += " WHERE target_table = ?"
+            params = (target_table,)
+        with self.lock:
+            cursor = self.connection.execute(query + " ORDER BY loaded_at", params)
+            columns = [c[0] for c in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def forget_run(self, target_table, run_id):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "DELETE FROM loads WHERE target_table = ? AND run_id = ?",
+                (target_table, run_id),
+            )
+
+    def reconcile(self, loader):
+        """Drop entries whose rows are no longer present in their target table.
+
+        Rows in target tables are matched to ledger entries by their `run_id`
+        metadata column.  When a table holds fewer rows for a run than the
+        ledger recorded, all of that run's entries for the table are dropped,
+        so those files are loaded again the next time they are seen.  Returns
+        the dropped entries.
+        """
+        recorded = defaultdict(int)
+        for entry in self.entries():
+            recorded[(entry["target_table"], entry["run_id"])] += entry["row_count"] or 0
+        dropped = []
+        counts = {}
+        for (target_table, run_id), row_count in recorded.items():
+            if target_table not in counts:
+                counts[target_table] = loader.row_counts_by_run(target_table)
+            present = counts[target_table].get(run_id, 0)
+            if present < row_count:
+                logger.warning(
+                    f"{target_table} holds {present} of the {row_count} rows recorded for run {run_id}; "
+                    "dropping its ledger entries"
+                )
+                dropped.extend(
+                    e for e in self.entries(target_table) if e["run_id"] == run_id
+                )
+                self.forget_run(target_table, run_id)
+        return dropped
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m skyloader.ledger",
+        description="Inspect a skyloader load ledger, or reconcile it against the target tables",
+    )
+    parser.add_argument("ledger", help="path of the ledger database")
+    parser.add_argument("command", choices=["list", "reconcile"])
+    parser.add_argument("--dialect", choices=["postgres", "sqlserver"], default="sqlserver")
+    parser.add_argument("--connection-string", help="ODBC connection string (sqlserver)")
+    parser.add_argument("--server")
+    parser.add_argument("--port", type=int, default=5432)
+    parser.add_argument("--database")
+    parser.add_argument("--user")
+    parser.add_argument("--password")
+    parser.add_argument("--schema")
+    args = parser.parse_args()
+
+    ledger = LoadLedger(args.ledger)
+    if args.command == "list":
+        for entry in ledger.entries():
+            print(
+                f"{entry['loaded_at']}  {entry['target_table']}  {entry['name']}  "
+                f"{entry['row_count']} rows  run={entry['run_id']}  md5={entry['md5']}"
+            )
+        return
+
+    if args.dialect == "postgres":
+        from skyloader.loader_postgres import PostgresLoader
+
+        loader = PostgresLoader(
+            args.server, args.database, port=args.port, schemaname=args.schema,
+            user=args.user, password=args.password,
+        )
+    else:
+        from skyloader.loader_sql_server import SqlLoader
+
+        loader = SqlLoader(args.connection_string, schemaname=args.schema)
+    with loader:
+        dropped = ledger.reconcile(loader)
+    for entry in dropped:
+        print(f"dropped {entry['target_table']}  {entry['name']}  run={entry['run_id']}")
+    print(f"{len(dropped)} ledger entries dropped")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,30 @@
+import logging
 from abc import abstractmethod
 
+from skyloader.catalog import Catalog, Column
+from skyloader.metrics import NULL_METRICS
+from skyloader.mode import Mode
+from skyloader.schema import SchemaDiff, SchemaMismatch
+from skyloader.sqltypes import (
+    chunked_column_types,
+    column_types,
+    format_type,
+    null_columns,
+)
+
+logger = logging.getLogger(__name__)
+
+# Overwrites load into this table beside the target, then swap it in
+SHADOW_SUFFIX = "__shadow"
+
 
 class LoaderBase():
+    catalog = None
+    metrics = NULL_METRICS
+    # The driver's parameter marker
+    placeholder = "?"
+    # Whether the database matches the identifiers loaders write by case
+    case_sensitive = False
 
     def __init__(self, schemaname=None):
         self.schema = schemaname
@@ -25,21 +48,116 @@ class LoaderBase():
         pass
 
     @abstractmethod
-    def load_datafile(self, datafile):
+    def load_datafile(self, datafile, mode=Mode.APPEND, allow_schema_evolution=True):
         pass
 
+    def load_catalog(self):
+        """Introspect the target database once; `ensure_table` keeps the result current."""
+        self.catalog = Catalog.load(self.connection, self.schemaname, self.placeholder, self.case_sensitive)
+        return self.catalog
+
+    def ensure_schema(self):
+        """Create the schema, unless the catalog shows it exists."""
+        if self.catalog is None:
+            self.load_catalog()
+        if not self.catalog.has_schema(self.schemaname):
+            self.create_schema_if_not_exists()
+            self.catalog.add_schema(self.schemaname)
+
+    def ensure_table(self, datafile, allow_schema_evolution=True):
+        """Create the schema and table for `datafile`, unless the catalog shows they exist.
+
+        An existing table is altered to take the columns of `datafile`, when
+        `allow_schema_evolution`; otherwise `SchemaMismatch` is raised if
+        they differ.
+        """
+        with self.metrics.span("ddl", datafile):
+            self.ensure_schema()
+            if not self.catalog.has_table(self.schemaname, datafile.tablename):
+                self.create_table_if_not_exists(datafile)
+                self.catalog.add_table(self.schemaname, datafile.tablename, self.table_columns(datafile))
+            else:
+                self.evolve_schema(datafile, allow_schema_evolution)
+
+    def evolve_schema(self, datafile, allow_schema_evolution=True):
+        columns = self.catalog.columns(self.schemaname, datafile.tablename)
+        diff = SchemaDiff.compare(
+            columns,
+            datafile.data,
+            self.dialect,
+            self.type_margin,
+            types=self.generic_types(datafile),
+            case_sensitive=self.case_sensitive,
+        )
+        if diff.missing:
+            logger.info(f"Columns {', '.join(diff.missing)} are missing from {datafile}; loading them as NULL")
+        if not diff.changes:
+            return
+        target = f"{self.schemaname}.{datafile.tablename}"
+        if diff.incompatible or not allow_schema_evolution:
+            raise SchemaMismatch(f"{datafile} does not fit {target}: {diff}")
+        ddl = self.alter_table_statement(datafile.tablename, diff)
+        logger.info(f"Evolving schema of {target} for {datafile}:\n\n{ddl}")
+        self.connection.execute(ddl)
+        # Widened columns keep their nullability
+        nullable = {column.name: column.nullable for column in columns}
+        self.catalog.add_columns(
+            self.schemaname,
+            datafile.tablename,
+            [
+                Column.from_sql_type(column, sql_type, nullable.get(column, True))
+                for column, sql_type in diff.added + diff.widened
+            ],
+        )
+
+    def merge_partition(self, datafile):
+        """The column and value identifying the rows `datafile` replaces when merged."""
+        if not datafile.partition:
+            raise ValueError(
+                f"{datafile} has no partition to merge by; set its partition, as LoaderManager does in merge mode"
+            )
+        (column, value), = datafile.partition.items()
+        return column, value
+
+    def table_columns(self, datafile):
+        """The columns of a table created for `datafile`."""
+        return [
+            Column.from_sql_type(column, sql_type)
+            for column, sql_type in zip(datafile.columns, self.column_types(datafile))
+        ]
+
+    def generic_types(self, datafile):
+        """The generic type and parameters of each column of `datafile`, with which hold only nulls.
+
+        Streamed files are typed in a first pass over their chunks, so the
+        table fits every chunk before any is loaded.
+        """
+        if not datafile.streamed:
+            return column_types(datafile.data, self.type_margin, self.dialect), null_columns(datafile.data)
+        if datafile.chunk_types is None:
+            logger.debug(f"Typing the columns of {datafile} chunk by chunk")
+            datafile.chunk_types = chunked_column_types(datafile.chunks(), self.type_margin, self.dialect)
+        return datafile.chunk_types
+
+    def column_types(self, datafile):
+        return [format_type(kind, params, self.dialect) for kind, params in self.generic_types(datafile)[0]]
+
     @abstractmethod
     def create_schema_if_not_exists(self):
         pass
 
     @abstractmethod
-    def create_table_statement(self, datafile):
+    def create_table_statement(self, datafile, tablename=None):
         pass
 
     @abstractmethod
     def create_table_if_not_exists(self, datafile):
         pass
 
+    @abstractmethod
+    def alter_table_statement(self, tablename, diff):
+        pass
+
     @abstractmethod
     def perform_load(self, datafile):
         pass
@@ -50,4 +168,16 @@ class LoaderBase():
 
     @abstractmethod
     def load_data(self, datafile):
+        pass
+
+    @abstractmethod
+    def merge_data(self, datafile):
+        pass
+
+    @abstractmethod
+    def overwrite_data(self, datafile):
+        pass
+
+    @abstractmethod
+    def row_counts_by_run(self, tablename):
         pass
\ No newline at end of file
@@ -1,19 +1,99 @@
 import datetime
+import io
+import logging
+import multiprocessing
 import traceback
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import nullcontext
+from itertools import islice
 
-from skyloader.datafile import DataFile
-from skyloader.drive import Drive
+from skyloader.datafile import DataFile, parse_path, parse_payload
+from skyloader.metrics import NULL_METRICS
+from skyloader.mode import Mode
+from skyloader.readers import ReadOptions
+from skyloader.utils import extract_date
+
+logger = logging.getLogger(__name__)
+
+# Downloads up to this size are handed to parse workers as bytes; larger ones
+# are parsed in the downloading thread rather than copied into a worker
+PARSE_MAX_BYTES = 32 * 1024 * 1024
+
+# Files from this size on are streamed to the loader a chunk at a time
+STREAM_MIN_BYTES = 256 * 1024 * 1024
 
 
 class LoaderManager:
-    def __init__(self):
-        self.drive = Drive()
-        # self.loader = Loader()
+    def __init__(
+        self,
+        drive,
+        loader,
+        folder=None,
+        download_workers=4,
+        parse_workers=2,
+        max_pending=4,
+        parse_max_bytes=PARSE_MAX_BYTES,
+        stream_min_bytes=STREAM_MIN_BYTES,
+        batch_moves=False,
+        page_tokens=None,
+        ledger=None,
+        run_id=None,
+        read_engine="auto",
+        read_arrow=False,
+        metrics=None,
+        cache=None,
+    ):
+        """
+        Loads the files in `drive`'s root folder with `loader`, applying the
+        settings of `folder`, its `GoogleFolder` registration, when given.
+        Files are downloaded on `download_workers` threads and parsed on
+        `parse_workers` processes (in the downloading thread when 0), while
+        the loader inserts them one at a time.  Local files are handed to
+        the workers by path, and downloads of at most `parse_max_bytes` as
+        bytes; larger downloads are parsed in the downloading thread.  Files
+        of `stream_min_bytes` or more are not parsed whole, but read by the
+        loader a chunk at a time (see `DataFile.stream`).  At most
+        `max_pending` fetched files wait for the loader at any time.
+        With `batch_moves`, moves to
+        the archive and error folders are sent together at the end of the run.
+        Given a `PageTokenStore` as `page_tokens`, only files added to or
+        modified in the inbox since the previous run are listed.  Given a
+        `LoadLedger`, files whose content was already loaded into their
+        target table are archived without being downloaded.  Workbooks are
+        parsed with `read_engine` (see `skyloader.readers`), into Arrow
+        tables rather than DataFrames with `read_arrow`.  Given a `Metrics`,
+        the stages of the run are timed and counted, by the drive and loader
+        too (see `skyloader.metrics`).  Given a `ParseCache`, files it holds
+        are read from it rather than downloaded and parsed again.
+        """
+        self.download_workers = download_workers
+        self.parse_workers = parse_workers
+        self.max_pending = max_pending
+        self.parse_max_bytes = parse_max_bytes
+        self.stream_min_bytes = stream_min_bytes
+        self.batch_moves = batch_moves
+        self.page_tokens = page_tokens
+        self.ledger = ledger
+        self.run_id = run_id or datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.read_engine = read_engine
+        self.read_arrow = read_arrow
+        self.cache = cache
+        self.drive = drive
+        self.loader = loader
+        self.metrics = metrics if metrics is not None else NULL_METRICS
+        if self.metrics.enabled and self.metrics.run_id is None:
+            self.metrics.run_id = self.run_id
+        self.drive.metrics = self.loader.metrics = self.metrics
+        self.folder = folder
         self.root = self.drive.root
         self.inbox = None
         self.archive = None
         self.logs = None
         self.error = None
+        self.moves = {}
+        self.loaded = 0
+        self.failed = 0
 
     def __enter__(self):
         self.configure_folders()
@@ -46,39 +126,211 @@ class LoaderManager:
     def ls(self, *args, **kwargs):
         return self.drive.ls(*args, **kwargs)
 
-    def process_datafile(self, datafile):
+    @property
+    def mode(self):
+        return self.folder.mode if self.folder is not None else Mode.APPEND
+
+    @property
+    def allow_schema_evolution(self):
+        return self.folder.allow_schema_evolution if self.folder is not None else True
+
+    def target_table(self, datafile):
+        return datafile.tablename
+
+    def prepare_datafile(self, datafile):
+        datafile.run_id = self.run_id
+        datafile.read_options = ReadOptions(engine=self.read_engine, arrow=self.read_arrow)
+        if self.folder is not None:
+            datafile.target_table = self.folder.target_table
+            datafile.read_options.sheet_name = self.folder.sheet_name
+            datafile.read_options.dtypes = self.folder.dtypes or {}
+
+    def skip_loaded(self, datafiles):
+        """Archive files the ledger shows were already loaded, and return the rest."""
+        remaining = []
+        for datafile in datafiles:
+            if datafile.is_file and self.ledger.contains(datafile, self.target_table(datafile)):
+                logger.info(
+                    f"{datafile} (md5={datafile.md5}) was already loaded into {self.target_table(datafile)}, skipping"
+                )
+                self.mark_success(datafile)
+            else:
+                remaining.append(datafile)
+        return remaining
+
+    def fetch_datafile(self, datafile, parser=None):
+        """Download and parse a datafile; runs on a download worker thread."""
+        if datafile.is_folder:
+            return
+        if self.cache is not None:
+            with self.metrics.span("parse", datafile):
+                datafile.data = self.cache.get(datafile)
+            if datafile.data is not None:
+                logger.debug(f"Read {datafile} from the parse cache")
+                self.metrics.count("cache_hits")
+                return
+        logger.debug(f"Downloading {datafile}")
+        with self.metrics.span("download", datafile):
+            datafile.fh = self.drive.download_datafile(datafile)
+        size = datafile.fh.seek(0, io.SEEK_END)
+        self.metrics.count("bytes", size)
+        if size >= self.stream_min_bytes:
+            # Streamed files are parsed as they are loaded, and never held whole to be cached
+            logger.debug(f"Streaming {datafile} ({size} bytes) to the loader")
+            with self.metrics.span("parse", datafile):
+                datafile.stream()
+            return
+        with self.metrics.span("parse", datafile):
+            datafile.data = self.parse_datafile(datafile, size, parser)
+        if self.cache is not None:
+            self.cache.put(datafile)
+
+    def parse_datafile(self, datafile, size, parser=None):
+        """Parse a downloaded file on `parser`, unless its contents would have to be copied there whole."""
+        args = (datafile.read_options, datafile.name, datafile.content_type)
+        path = getattr(datafile.fh, "path", None)
+        if parser is None:
+            return datafile.read()
+        if path is not None:
+            return parser.submit(parse_path, path, *args).result()
+        if size <= self.parse_max_bytes:
+            return parser.submit(parse_payload, datafile.open().read(), *args).result()
+        logger.debug(f"Parsing {datafile} ({size} bytes) in the downloading thread")
+        return datafile.read()
+
+    def process_datafile(self, datafile, fetched=None):
         if datafile.is_folder:
             logger.warning(f"Found folder {datafile} in Inbox, skipping")
             return
         logger.info(f"Now processing {datafile}")
         try:
-            self.insert_metadata_fields(datafile)
-            self.loader.load_datafile(datafile)
+            if fetched is not None:
+                fetched.result()
+            with self.metrics.span("metadata", datafile):
+                self.insert_metadata_fields(datafile)
+            self.loader.load_datafile(
+                datafile, mode=self.mode, allow_schema_evolution=self.allow_schema_evolution
+            )
+            if self.ledger is not None:
+                self.ledger.record(datafile, self.target_table(datafile))
             self.mark_success(datafile)
         except Exception as e:
             logger.error(traceback.format_exc())
+            self.failed += 1
+            self.metrics.count("failures")
             self.mark_fail(datafile)
         else:
+            self.loaded += 1
+            self.metrics.count("files")
+            self.metrics.count("rows", datafile.processed)
             logger.info(f"Successfully processed {datafile}")
+        finally:
+            datafile.release()
+
+    def list_inbox(self):
+        """List the inbox, along with the changes page token to store once it is processed."""
+        with self.metrics.span("list"):
+            if self.page_tokens is None:
+                return self.ls(self.inbox.identifier, most_recent_only=False), None
+            return self.drive.ls_changed([self.inbox.identifier], self.page_tokens.load())
 
     def process_files(self):
-        datafiles = self.ls(
-            self.inbox.identifier, most_recent_only=False, download=True
+        # Tables may have been changed or dropped since the last run
+        self.loader.catalog = None
+        datafiles, page_token = self.list_inbox()
+        for datafile in datafiles:
+            self.prepare_datafile(datafile)
+        # Files the ledger skips are archived too, so queued moves are sent
+        # however the run ends, before the page token moves past the files
+        try:
+            if self.ledger is not None:
+                datafiles = self.skip_loaded(datafiles)
+            if datafiles:
+                self.process_datafiles(datafiles)
+            else:
+                logger.info("No datafiles in Inbox, nothing to do! Exiting")
+        finally:
+            if self.batch_moves:
+                self.flush_moves()
+        if page_token is not None:
+            self.page_tokens.save(page_token)
+
+    def replay_errors(self):
+        """Load the files in the error folder again, archiving those that succeed.
+
+        Files are given back the names they had before they were moved to the
+        error folder, as recorded by the parse cache, from which they are then
+        read without downloading or parsing them again.  Files the cache
+        doesn't hold are left in the error folder, as the table and archive
+        name their original name sets out are unknown.
+        """
+        if self.is_root("error"):
+            logger.warning("There is no error folder to replay files from")
+            return
+        datafiles = []
+        for datafile in self.ls(self.error.identifier):
+            if not datafile.is_file:
+                continue
+            self.prepare_datafile(datafile)
+            name = self.cache.original_name(datafile) if self.cache is not None else None
+            if name is None:
+                logger.warning(f"{datafile} is not in the parse cache; leaving it in the error folder")
+                continue
+            datafile.name = name
+            datafiles.append(datafile)
+        if not datafiles:
+            logger.info("No datafiles in the error folder, nothing to replay")
+            return
+        logger.info(f"Replaying {len(datafiles)} files from the error folder")
+        self.loader.catalog = None
+        try:
+            self.process_datafiles(datafiles)
+        finally:
+            if self.batch_moves:
+                self.flush_moves()
+
+    def process_datafiles(self, datafiles):
+        # Files are handed to the loader in the modified_at order returned by
+        # ls, so loads into any one table are committed in that order too
+        # Workers are spawned, not forked: forking while download threads
+        # hold locks can leave a worker deadlocked on one of them
+        parser = (
+            ProcessPoolExecutor(self.parse_workers, mp_context=multiprocessing.get_context("spawn"))
+            if self.parse_workers else None
         )
-        if datafiles:
-            for datafile in datafiles:
-                self.process_datafile(datafile)
-        else:
-            logger.info("No datafiles in Inbox, nothing to do! Exiting")
+        with ThreadPoolExecutor(self.download_workers) as downloader, parser or nullcontext():
+            queued = iter(datafiles)
+            pending = deque()
+            while True:
+                for datafile in islice(queued, self.max_pending - len(pending)):
+                    pending.append(
+                        (datafile, downloader.submit(self.fetch_datafile, datafile, parser))
+                    )
+                if not pending:
+                    break
+                self.process_datafile(*pending.popleft())
 
     def insert_metadata_fields(self, datafile):
         logger.debug(f"Adding metadata fields to {datafile}")
         if datafile.data is not None:
-            datafile.data["run_id"] = RUN_ID
-            datafile.data["loaded_at"] = datetime.datetime.now()
+            datafile.add_column("run_id", self.run_id)
+            datafile.add_column("loaded_at", datetime.datetime.now())
+            if self.mode == Mode.MERGE:
+                self.insert_partition_fields(datafile)
         else:
             logger.warning(f"No data present in datafile {datafile}")
 
+    def insert_partition_fields(self, datafile):
+        """Tag rows with the file, and the date in its name, that merges replace them by."""
+        datafile.add_column("source_file", datafile.name)
+        date_mask = self.folder.date_mask if self.folder is not None else "YYYYMMDD"
+        file_date = extract_date(datafile.name, date_mask)
+        if file_date is not None:
+            datafile.add_column("file_date", file_date)
+            datafile.partition = {"file_date": file_date}
+        else:
+            datafile.partition = {"source_file": datafile.name}
+
     def datafile_name(self, datafile, kind="archive"):
         valid_kinds = ("archive", "error")
         if kind not in valid_kinds:
@@ -92,13 +344,38 @@ class LoaderManager:
     def is_root(self, kind):
         return getattr(self, kind).id == self.root.id
 
-    def move_file_to_destination(self, datafile, kind):
-        logger.debug(f"Moving {datafile} to {kind} folder")
+    def destination_path(self, datafile, kind):
         name = self.datafile_name(datafile, kind)
         parent_folder = getattr(self, kind)
-        self.drive.move_and_rename_file(datafile.id, parent_folder.id, name)
         parent_name = "/" if parent_folder.name == "Root" else f"{parent_folder.name}/"
-        logger.info(f"Moved {datafile} to {parent_name}{name}")
+        return f"{parent_name}{name}"
+
+    def move_file_to_destination(self, datafile, kind):
+        name = self.datafile_name(datafile, kind)
+        parent_folder = getattr(self, kind)
+        if self.batch_moves:
+            logger.debug(f"Queueing move of {datafile} to {kind} folder")
+            self.moves[datafile.id] = (datafile, kind)
+            self.drive.queue_move_and_rename(datafile, parent_folder.id, name)
+            return
+        logger.debug(f"Moving {datafile} to {kind} folder")
+        with self.metrics.span("move", datafile):
+            self.drive.move_and_rename_file(
+                datafile.id, parent_folder.id, name, previous_parents=datafile.parents or None
+            )
+        logger.info(f"Moved {datafile} to {self.destination_path(datafile, kind)}")
+
+    def flush_moves(self):
+        logger.debug(f"Sending {len(self.moves)} queued moves")
+        with self.metrics.span("move"):
+            results = self.drive.flush_moves()
+        for file_id, (datafile, kind) in self.moves.items():
+            error = results.get(file_id)
+            if error is None and file_id in results:
+                logger.info(f"Moved {datafile} to {self.destination_path(datafile, kind)}")
+            else:
+                logger.error(f"Failed to move {datafile} to {kind} folder: {error or 'no response'}")
+        self.moves = {}
 
     def mark_fail(self, datafile):
         self.move_file_to_destination(datafile, "error")
@@ -107,7 +384,7 @@ class LoaderManager:
         self.move_file_to_destination(datafile, "archive")
 
     def upload_run_logs_to_drive(self):
-        self.drive.upload_log_to_drive(
-            log_stream, f"{RUN_ID}.logs", self.logs.identifier
+        self.drive.upload_log(
+            log_stream, f"{self.run_id}.logs", self.logs.identifier
         )
         log_stream.truncate()
@@ -1,134 +1,476 @@
-from itertools import repeat
+from decimal import Decimal
+import logging
 
-from skyloader.loader_base import LoaderBase
+from skyloader.datafile import DEFAULT_BATCH_SIZE
+from skyloader.loader_base import SHADOW_SUFFIX, LoaderBase
+from skyloader.mode import Mode
+from skyloader.sqltypes import SAFETY_MARGIN
 from skyloader.utils import connected
 
-import pandas as pd
-import pyodbc
+import psycopg
+from psycopg.conninfo import make_conninfo
 
+logger = logging.getLogger(__name__)
 
-def schema_information(df):
-    info_schema = {
-        "column": df.columns,
-        "dtype": df.dtypes.astype(str),
-        "non-null count": df.count(),
-    }
-    return pd.DataFrame(info_schema).to_dict(orient="list")
+COPY_FORMATS = ("text", "binary")
+
+
+INTEGER_TYPES = {"smallint", "integer", "bigint", "int2", "int4", "int8"}
+
+# Index definitions of a table, other than those backing constraints, with
+# the names they are rebuilt under on its shadow
+INDEXES_QUERY = """
+SELECT indexdef, format('%%I', indexname), format('%%I', indexname || %s), format('%%I.%%I', schemaname, tablename)
+FROM pg_indexes
+WHERE schemaname = %s AND tablename = %s
+  AND NOT EXISTS (
+    SELECT 1 FROM pg_constraint WHERE conindid = format('%%I.%%I', schemaname, indexname)::regclass
+  )
+"""
+
+# Constraints of a table, with the names they are rebuilt under on its shadow;
+# those backed by an index need a name of their own until the swap
+CONSTRAINTS_QUERY = """
+SELECT format('%%I', conname),
+       format('%%I', CASE WHEN contype IN ('p', 'u', 'x') THEN conname || %s ELSE conname END),
+       contype IN ('p', 'u', 'x'),
+       pg_get_constraintdef(oid)
+FROM pg_constraint
+WHERE conrelid = to_regclass(%s) AND contype IN ('p', 'u', 'x', 'c', 'f')
+ORDER BY contype IN ('p', 'u', 'x') DESC, conname
+"""
+
+# Columns of a table declared NOT NULL, its column defaults, and the sequences its columns own
+NOT_NULL_QUERY = """
+SELECT attname FROM pg_attribute
+WHERE attrelid = to_regclass(%s) AND attnum > 0 AND attnotnull AND NOT attisdropped
+"""
+DEFAULTS_QUERY = """
+SELECT a.attname, pg_get_expr(d.adbin, d.adrelid)
+FROM pg_attrdef d
+JOIN pg_attribute a ON a.attrelid = d.adrelid AND a.attnum = d.adnum
+WHERE d.adrelid = to_regclass(%s) AND a.attgenerated = ''
+"""
+OWNED_SEQUENCES_QUERY = """
+SELECT a.attname, d.objid::regclass::text
+FROM pg_depend d
+JOIN pg_class s ON s.oid = d.objid AND s.relkind = 'S'
+JOIN pg_attribute a ON a.attrelid = d.refobjid AND a.attnum = d.refobjsubid
+WHERE d.refobjid = to_regclass(%s) AND d.deptype = 'a'
+"""
+
+# The owner of a table when it isn't the current user, and its grants to other roles
+OWNER_QUERY = """
+SELECT format('%%I', pg_get_userbyid(relowner))
+FROM pg_class
+WHERE oid = to_regclass(%s) AND pg_get_userbyid(relowner) <> current_user
+"""
+GRANTS_QUERY = """
+SELECT CASE WHEN a.grantee = 0 THEN 'PUBLIC' ELSE format('%%I', pg_get_userbyid(a.grantee)) END,
+       a.privilege_type, a.is_grantable
+FROM pg_class c, aclexplode(c.relacl) a
+WHERE c.oid = to_regclass(%s) AND a.grantee <> c.relowner
+"""
+
+# Whether views depend on a table, and whether foreign keys reference it
+DEPENDENTS_QUERY = """
+SELECT EXISTS (
+         SELECT 1 FROM pg_depend d JOIN pg_rewrite r ON r.oid = d.objid
+         WHERE d.refobjid = to_regclass(%s) AND r.ev_class <> d.refobjid
+       ),
+       EXISTS (SELECT 1 FROM pg_constraint WHERE confrelid = to_regclass(%s))
+"""
+
+
+def quote_identifier(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def to_decimal(value):
+    return Decimal(repr(value)) if isinstance(value, float) else Decimal(value)
 
 
 class PostgresLoader(LoaderBase):
-    def __init__(self, server, database, port=5432, schemaname=None):
+    dialect = "postgres"
+    placeholder = "%s"
+    # Every identifier is quoted, and quoted identifiers are matched by case
+    case_sensitive = True
+
+    def __init__(
+        self,
+        server,
+        database,
+        port=5432,
+        schemaname=None,
+        user=None,
+        password=None,
+        copy_format="text",
+        batch_size=DEFAULT_BATCH_SIZE,
+        pool=None,
+        type_margin=SAFETY_MARGIN,
+    ):
+        if copy_format not in COPY_FORMATS:
+            raise ValueError(
+                f"Expected copy_format to be one of {COPY_FORMATS}; got {copy_format} instead"
+            )
         self.server = server
         self.port = port
         self.database = database
+        self.user = user
+        self.password = password
+        self.copy_format = copy_format
+        self.batch_size = batch_size
+        self.pool = pool
+        self.type_margin = type_margin
         self.connection = None
         self.connected = False
-        self.schema = schemaname
+        self.schema = schemaname or "public"
 
     @property
     def schemaname(self):
         return self.schema
 
+    @property
+    def connection_string(self):
+        return make_conninfo(
+            host=self.server,
+            port=self.port,
+            dbname=self.database,
+            user=self.user,
+            password=self.password,
+        )
+
     def connect(self):
-        self.connection = pyodbc.connect(self.connection_string)
+        if self.pool is not None:
+            self.connection = self.pool.acquire()
+        else:
+            self.connection = psycopg.connect(self.connection_string)
         self.connection.autocommit = True
         self.connected = True
 
-    def create_jdbc_url(self):
-        pg_jdbc_url = f"jdbc:postgresql://{server}:{port}/{database}"
-        return pg_jdbc_url
+    def close_connection(self):
+        if getattr(self, "connection", None) is not None:
+            if self.pool is not None:
+                self.pool.release(self.connection)
+            else:
+                self.connection.close()
+            self.connection = None
+        self.connected = False
+
+    def qualified_name(self, tablename):
+        return f"{quote_identifier(self.schemaname)}.{quote_identifier(tablename)}"
 
     @connected
-    def load_datafile(self, datafile):
-        self.create_schema_if_not_exists()
-        self.create_table_if_not_exists(datafile)
-        self.load_data(datafile)
-
-    def write_sql(self):
-        (
-            df.write.format("jdbc")
-            .option("user", pg_user)
-            .option("password", pg_pass)
-            .option("url", pg_jdbc_url)
-            .option("dbtable", target_table)
-            .mode(write_mode)
-            .save()
-        )
+    def load_datafile(self, datafile, mode=Mode.APPEND, allow_schema_evolution=True):
+        if mode == Mode.OVERWRITE:
+            self.ensure_schema()
+            self.overwrite_data(datafile)
+            return
+        self.ensure_table(datafile, allow_schema_evolution)
+        if mode == Mode.MERGE:
+            self.merge_data(datafile)
+        else:
+            self.load_data(datafile)
 
     def create_schema_if_not_exists(self):
-        ddl = f"""IF NOT EXISTS (SELECT schema_name 
-        FROM information_schema.schemata 
-        WHERE schema_name = '{self.schemaname}')
-        BEGIN
-            EXEC('CREATE SCHEMA [{self.schemaname}]')
-        END
-        """
+        ddl = f"CREATE SCHEMA IF NOT EXISTS {quote_identifier(self.schemaname)}"
         logger.info(
             f"Creating schema {self.schemaname} if it does not already exist:\n\n{ddl}"
         )
         self.connection.execute(ddl)
         logger.info(f"DDL SQL for schema {self.schemaname} finished successfully")
 
-    def create_table_statement(self, datafile):
-        tablename = datafile.tablename
-        schema_info = schema_information(datafile.data)
-        dtypes_mapping = {
-            "object": "nvarchar(max)",
-            "float64": "float",
-            "int64": "bigint",
-            "datetime64[ns]": "datetime",
-            "bool": "bit",
-            "timedelta[ns]": "time",
-            "category": "nvarchar(max)",
+    def target_columns(self, datafile):
+        columns = {
+            self.catalog.key(column.name): column
+            for column in self.catalog.columns(self.schemaname, datafile.tablename)
         }
-        columns_spec = ", ".join(
-            f"[{column}] {dtypes_mapping[dtype]}"
-            for column, dtype in zip(schema_info["column"], schema_info["dtype"])
-        )
+        return [columns[self.catalog.key(name)] for name in datafile.columns]
+
+    def value_converters(self, datafile):
+        """Return (position, converter) pairs for columns whose values need adapting to their column type.
 
-        return f"""
-        IF NOT EXISTS (SELECT * FROM INFORMATION_SCHEMA.TABLES WHERE TABLE_NAME = N'{datafile.tablename}' AND TABLE_SCHEMA = N'{self.schemaname}')
-        BEGIN
-            CREATE TABLE {self.schema}.{datafile.tablename} ({columns_spec})
-        END
+        Whole-number floats (integers with missing values) must be sent as
+        ints to integer columns, and binary COPY only accepts Decimals for
+        numeric columns.
         """
+        converters = []
+        for i, column in enumerate(self.target_columns(datafile)):
+            if column.data_type in INTEGER_TYPES and datafile.data.dtypes.iloc[i].kind == "f":
+                converters.append((i, int))
+            elif column.data_type == "numeric" and self.copy_format == "binary":
+                converters.append((i, to_decimal))
+        return converters
+
+    def create_table_statement(self, datafile, tablename=None):
+        columns_spec = ", ".join(
+            f"{quote_identifier(column)} {sqltype}"
+            for column, sqltype in zip(datafile.columns, self.column_types(datafile))
+        )
+        return f"CREATE TABLE IF NOT EXISTS {self.qualified_name(tablename or datafile.tablename)} ({columns_spec})"
 
     def create_table_if_not_exists(self, datafile):
         ddl = self.create_table_statement(datafile)
         logger.info(
-            f"Table {self.schema}.{datafile.tablename} does not exist, executing SQL:\n\n{ddl}"
+            f"Creating table {self.schema}.{datafile.tablename} if it does not already exist:\n\n{ddl}"
         )
         self.connection.execute(ddl)
         logger.info(f"DDL SQL executed successfully")
 
-    def perform_load(self, datafile):
-        insert = self.insert_statement(datafile.data.columns, datafile.tablename)
-        logger.debug(f"Executing SQL: \n{insert}")
-        cursor = self.connection.cursor()
-        cursor.fast_executemany = True
-        logger.info(f"{datafile.records}")
-        cursor.executemany(insert, datafile.records)
-        cursor.commit()
-        cursor.close()
+    def alter_table_statement(self, tablename, diff):
+        changes = [f"ADD COLUMN {quote_identifier(column)} {sql_type}" for column, sql_type in diff.added]
+        changes += [f"ALTER COLUMN {quote_identifier(column)} TYPE {sql_type}" for column, sql_type in diff.widened]
+        return f"ALTER TABLE {self.qualified_name(tablename)} {', '.join(changes)}"
+
+    def copy_statement(self, column_names, target, copy_format=None):
+        columns = ", ".join(quote_identifier(column) for column in column_names)
+        copy_format = copy_format or self.copy_format
+        options = f" (FORMAT {copy_format.upper()})" if copy_format != "text" else ""
+        return f"COPY {target} ({columns}) FROM STDIN{options}"
+
+    def arrow_for_copy(self, datafile):
+        """Cast whole-number float columns going to integer columns, as `value_converters` does for DataFrames."""
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        data = datafile.data
+        for i, column in enumerate(self.target_columns(datafile)):
+            if column.data_type in INTEGER_TYPES and pa.types.is_floating(data.schema.types[i]):
+                data = data.set_column(i, data.schema.names[i], pc.cast(data.column(i), pa.int64()))
+        return data
+
+    def perform_arrow_load(self, datafile, target):
+        """COPY an Arrow table as CSV, rendered from its buffers by Arrow rather than row by row in Python."""
+        import pyarrow as pa
+        from pyarrow import csv as pacsv
+
+        copy = self.copy_statement(datafile.columns, target, copy_format="csv")
+        logger.debug(f"Executing SQL: \n{copy}")
+        datafile.data = self.arrow_for_copy(datafile)
+        options = pacsv.WriteOptions(include_header=False)
+        with self.connection.cursor() as cursor:
+            with cursor.copy(copy) as stream:
+                for chunk in datafile.arrow_batches(self.batch_size):
+                    sink = pa.BufferOutputStream()
+                    pacsv.write_csv(chunk, sink, options)
+                    stream.write(sink.getvalue())
+
+    def perform_load(self, datafile, target=None):
+        target = target or self.qualified_name(datafile.tablename)
+        with self.metrics.span("insert", datafile):
+            # Streamed files are copied a chunk at a time, each with its own COPY
+            for _ in datafile.chunks():
+                if datafile.is_arrow:
+                    self.perform_arrow_load(datafile, target)
+                else:
+                    self.perform_frame_load(datafile, target)
+
+    def perform_frame_load(self, datafile, target):
+        copy = self.copy_statement(datafile.columns, target)
+        logger.debug(f"Executing SQL: \n{copy}")
+        converters = self.value_converters(datafile)
+        with self.connection.cursor() as cursor:
+            with cursor.copy(copy) as stream:
+                if self.copy_format == "binary":
+                    stream.set_types([column.data_type for column in self.target_columns(datafile)])
+                for columns in datafile.column_batches(self.batch_size):
+                    for i, convert in converters:
+                        columns[i] = [None if v is None else convert(v) for v in columns[i]]
+                    for row in zip(*columns):
+                        stream.write_row(row)
 
     def insert_statement(self, column_names, tablename):
-        columns = ", ".join(column_names)
-        q = ",".join(repeat("?", len(column_names)))
-        return f"INSERT INTO {self.schemaname}.{tablename} ({columns}) VALUES ({q})"
+        columns = ", ".join(quote_identifier(column) for column in column_names)
+        q = ", ".join(["%s"] * len(column_names))
+        return f"INSERT INTO {self.qualified_name(tablename)} ({columns}) VALUES ({q})"
+
+    @connected
+    def row_counts_by_run(self, tablename):
+        qualified_name = self.qualified_name(tablename)
+        exists = self.connection.execute(
+            "SELECT to_regclass(%s)", (qualified_name,)
+        ).fetchone()[0]
+        if exists is None:
+            return {}
+        rows = self.connection.execute(
+            f"SELECT run_id, COUNT(*) FROM {qualified_name} GROUP BY run_id"
+        ).fetchall()
+        return {run_id: count for run_id, count in rows}
+
+    def merge_data(self, datafile):
+        """Replace the rows of `datafile`'s partition of the target table with its contents.
+
+        Rows are copied into a temporary staging table, then the partition is
+        deleted and refilled from staging with one statement each, all in one
+        transaction, so readers see either the old or the new partition.
+        """
+        target = self.qualified_name(datafile.tablename)
+        staging = quote_identifier(f"staging_{datafile.tablename}")
+        columns = ", ".join(quote_identifier(column) for column in datafile.columns)
+        partition_column, partition_value = self.merge_partition(datafile)
+        # The transaction commits as its block exits
+        commit = self.metrics.span("commit", datafile)
+        try:
+            logger.info(f"Merging records from {datafile} into PostgreSQL")
+            with self.connection.transaction():
+                # Staging takes only the file's columns, so the columns the
+                # file leaves to their defaults can't fail as NULL there
+                self.connection.execute(
+                    f"CREATE TEMPORARY TABLE {staging} ON COMMIT DROP AS SELECT {columns} FROM {target} WITH NO DATA"
+                )
+                self.perform_load(datafile, target=staging)
+                deleted = self.connection.execute(
+                    f"DELETE FROM {target} WHERE {quote_identifier(partition_column)} = %s",
+                    (partition_value,),
+                ).rowcount
+                self.connection.execute(
+                    f"INSERT INTO {target} ({columns}) SELECT {columns} FROM {staging}"
+                )
+                commit.start()
+        except psycopg.Error as err:
+            logger.error(f"Merging of data into PostgreSQL of {datafile} failed")
+            raise err
+        else:
+            logger.info(
+                f"Merge successful. Replaced {deleted} records where {partition_column} = {partition_value} "
+                f"with {datafile.processed} records from {datafile}"
+            )
+        finally:
+            commit.stop()
+
+    def shadow_statements(self, tablename, columns):
+        """Return statements rebuilding `tablename` on its shadow, and renaming its objects back once swapped.
+
+        The shadow, which has the `columns` of the file loaded into it, gets
+        the NOT NULL columns, indexes, constraints, defaults, owned sequences,
+        grants and owner of the table.
+        """
+        target = self.qualified_name(tablename)
+        shadow = self.qualified_name(f"{tablename}{SHADOW_SUFFIX}")
+        columns = {str(column) for column in columns}
+        creates = [
+            f"ALTER TABLE {shadow} ALTER COLUMN {quote_identifier(column)} SET NOT NULL"
+            for column, in self.connection.execute(NOT_NULL_QUERY, (target,)).fetchall()
+            if column in columns
+        ]
+        renames = []
+        rows = self.connection.execute(
+            INDEXES_QUERY, (SHADOW_SUFFIX, self.schemaname, tablename)
+        ).fetchall()
+        for indexdef, name, shadow_name, table in rows:
+            creates.append(
+                indexdef.replace(f" INDEX {name} ON {table} ", f" INDEX {shadow_name} ON {shadow} ", 1)
+            )
+            renames.append(
+                f"ALTER INDEX {quote_identifier(self.schemaname)}.{shadow_name} RENAME TO {name}"
+            )
+        for name, shadow_name, renamed, definition in self.connection.execute(
+            CONSTRAINTS_QUERY, (SHADOW_SUFFIX, target)
+        ).fetchall():
+            creates.append(f"ALTER TABLE {shadow} ADD CONSTRAINT {shadow_name} {definition}")
+            if renamed:
+                renames.append(f"ALTER TABLE {target} RENAME CONSTRAINT {shadow_name} TO {name}")
+        for column, default in self.connection.execute(DEFAULTS_QUERY, (target,)).fetchall():
+            if column in columns:
+                creates.append(f"ALTER TABLE {shadow} ALTER COLUMN {quote_identifier(column)} SET DEFAULT {default}")
+        for column, sequence in self.connection.execute(OWNED_SEQUENCES_QUERY, (target,)).fetchall():
+            # Sequences go with the table that owns them, unless handed over
+            if column in columns:
+                creates.append(f"ALTER SEQUENCE {sequence} OWNED BY {shadow}.{quote_identifier(column)}")
+        for grantee, privilege, is_grantable in self.connection.execute(GRANTS_QUERY, (target,)).fetchall():
+            option = " WITH GRANT OPTION" if is_grantable else ""
+            creates.append(f"GRANT {privilege} ON {shadow} TO {grantee}{option}")
+        # Last, so the grants above pass to the owner as their grantor
+        for owner, in self.connection.execute(OWNER_QUERY, (target,)).fetchall():
+            creates.append(f"ALTER TABLE {shadow} OWNER TO {owner}")
+        return creates, renames
+
+    def table_dependents(self, tablename):
+        """Tell whether views depend on `tablename`, and whether foreign keys reference it."""
+        target = self.qualified_name(tablename)
+        return self.connection.execute(DEPENDENTS_QUERY, (target, target)).fetchone()
+
+    def overwrite_data(self, datafile):
+        """Replace the target table with one holding the contents of `datafile`.
+
+        Rows are copied into a shadow table without indexes, the indexes,
+        constraints, defaults and grants of the target are then rebuilt on
+        it, and it is renamed into place.  It all runs in one transaction,
+        and readers of the target are blocked only from the rename until the
+        commit.  Tables that views depend on or foreign keys reference can't
+        be swapped out; they are emptied and reloaded in the transaction
+        instead, which blocks their readers for the whole load.
+        """
+        tablename = datafile.tablename
+        commit = self.metrics.span("commit", datafile)
+        try:
+            logger.info(f"Overwriting {self.schemaname}.{tablename} with records from {datafile}")
+            with self.connection.transaction():
+                has_views, is_referenced = self.table_dependents(tablename)
+                if has_views or is_referenced:
+                    self.reload_table(datafile, is_referenced)
+                else:
+                    self.swap_in_shadow(datafile)
+                commit.start()
+        except psycopg.Error as err:
+            # The target table was left as it was; introspect it again on the next load
+            self.catalog = None
+            logger.error(f"Overwriting of {self.schemaname}.{tablename} with {datafile} failed")
+            raise err
+        else:
+            logger.info(
+                f"Overwrite successful. Loaded {datafile.processed} records from {datafile} into PostgreSQL"
+            )
+        finally:
+            commit.stop()
+
+    def swap_in_shadow(self, datafile):
+        tablename = datafile.tablename
+        target = self.qualified_name(tablename)
+        shadow_name = f"{tablename}{SHADOW_SUFFIX}"
+        shadow = self.qualified_name(shadow_name)
+        retired = f"{tablename}__retired"
+        creates, renames = self.shadow_statements(tablename, datafile.columns)
+        self.connection.execute(f"DROP TABLE IF EXISTS {shadow}")
+        self.connection.execute(self.create_table_statement(datafile, shadow_name))
+        self.catalog.add_table(self.schemaname, tablename, self.table_columns(datafile))
+        self.perform_load(datafile, target=shadow)
+        for ddl in creates:
+            logger.debug(f"Executing SQL: \n{ddl}")
+            self.connection.execute(ddl)
+        exists = self.connection.execute("SELECT to_regclass(%s)", (target,)).fetchone()[0]
+        if exists is not None:
+            self.connection.execute(f"ALTER TABLE {target} RENAME TO {quote_identifier(retired)}")
+        self.connection.execute(f"ALTER TABLE {shadow} RENAME TO {quote_identifier(tablename)}")
+        if exists is not None:
+            self.connection.execute(f"DROP TABLE {self.qualified_name(retired)}")
+        for ddl in renames:
+            self.connection.execute(ddl)
+
+    def reload_table(self, datafile, is_referenced=False):
+        """Empty the target table and load `datafile` into it, taking its columns."""
+        target = self.qualified_name(datafile.tablename)
+        logger.info(f"{self.schemaname}.{datafile.tablename} has dependents; reloading it in place")
+        self.ensure_table(datafile)
+        # TRUNCATE is refused on tables that foreign keys reference
+        self.connection.execute(f"DELETE FROM {target}" if is_referenced else f"TRUNCATE {target}")
+        self.perform_load(datafile)
 
     def load_data(self, datafile):
-        # We don't want to autocommit here, since the driver will issue a commit for each record in the load
-        # Rather we'll commit explicitly at the end so that either all the records are committed, or none are
-        self.autocommit = False
+        # The COPY runs inside a single transaction, so that either all the
+        # records of the file are committed, or none are
+        commit = self.metrics.span("commit", datafile)
         try:
-            logger.info(f"Loading records from {datafile} into SQL Server")
-            self.perform_load(datafile)
-        except pyodbc.DatabaseError as err:
-            self.connection.rollback()
-            logger.error(f"Loading of data into SQL Server of {datafile} failed")
+            logger.info(f"Loading records from {datafile} into PostgreSQL")
+            with self.connection.transaction():
+                self.perform_load(datafile)
+                commit.start()
+        except psycopg.Error as err:
+            logger.error(f"Loading of data into PostgreSQL of {datafile} failed")
             raise err
         else:
             logger.info(
-                f"Load successful. Loaded {datafile.processed} records from {datafile} into SQL Server"
+                f"Load successful. Loaded {datafile.processed} records from {datafile} into PostgreSQL"
             )
-            self.autocommit = True
+        finally:
+            commit.stop()
@@ -1,45 +1,177 @@
 from itertools import repeat
+import logging
 
+from skyloader.catalog import Column
+from skyloader.datafile import DEFAULT_BATCH_SIZE
+from skyloader.sqltypes import SAFETY_MARGIN
 from skyloader.utils import connected
-from skyloader.loader_base import LoaderBase
+from skyloader.loader_base import SHADOW_SUFFIX, LoaderBase
+from skyloader.mode import Mode
 
-import pandas as pd
 import pyodbc
 
+logger = logging.getLogger(__name__)
 
-def schema_information(df):
-    info_schema = {
-        "column": df.columns,
-        "dtype": df.dtypes.astype(str),
-        "non-null count": df.count(),
-    }
-    return pd.DataFrame(info_schema).to_dict(orient="list")
+CHECKPOINT_TABLE = "skyloader_checkpoint"
+
+# Key and included columns of a table's indexes, other than those backing constraints
+INDEXES_QUERY = """
+SELECT i.name, i.type_desc, i.is_unique, c.name, ic.is_descending_key, ic.is_included_column
+FROM sys.indexes i
+JOIN sys.index_columns ic ON ic.object_id = i.object_id AND ic.index_id = i.index_id
+JOIN sys.columns c ON c.object_id = ic.object_id AND c.column_id = ic.column_id
+WHERE i.object_id = OBJECT_ID(?) AND i.type IN (1, 2)
+  AND i.is_primary_key = 0 AND i.is_unique_constraint = 0
+ORDER BY i.index_id, ic.is_included_column, ic.key_ordinal, ic.index_column_id
+"""
+
+
+# Columns of a table declared NOT NULL
+NOT_NULL_QUERY = "SELECT name FROM sys.columns WHERE object_id = OBJECT_ID(?) AND is_nullable = 0"
+
+# Columns of a table's primary key and unique constraints
+KEY_CONSTRAINTS_QUERY = """
+SELECT k.name, k.type, i.type_desc, c.name, ic.is_descending_key
+FROM sys.key_constraints k
+JOIN sys.indexes i ON i.object_id = k.parent_object_id AND i.index_id = k.unique_index_id
+JOIN sys.index_columns ic ON ic.object_id = i.object_id AND ic.index_id = i.index_id
+JOIN sys.columns c ON c.object_id = ic.object_id AND c.column_id = ic.column_id
+WHERE k.parent_object_id = OBJECT_ID(?)
+ORDER BY k.type, k.name, ic.key_ordinal
+"""
+
+CHECK_CONSTRAINTS_QUERY = "SELECT name, definition FROM sys.check_constraints WHERE parent_object_id = OBJECT_ID(?)"
+
+DEFAULT_CONSTRAINTS_QUERY = """
+SELECT d.name, c.name, d.definition
+FROM sys.default_constraints d
+JOIN sys.columns c ON c.object_id = d.parent_object_id AND c.column_id = d.parent_column_id
+WHERE d.parent_object_id = OBJECT_ID(?)
+"""
+
+FOREIGN_KEYS_QUERY = """
+SELECT f.name, pc.name, OBJECT_SCHEMA_NAME(f.referenced_object_id), OBJECT_NAME(f.referenced_object_id), rc.name,
+       f.delete_referential_action_desc, f.update_referential_action_desc
+FROM sys.foreign_keys f
+JOIN sys.foreign_key_columns fc ON fc.constraint_object_id = f.object_id
+JOIN sys.columns pc ON pc.object_id = fc.parent_object_id AND pc.column_id = fc.parent_column_id
+JOIN sys.columns rc ON rc.object_id = fc.referenced_object_id AND rc.column_id = fc.referenced_column_id
+WHERE f.parent_object_id = OBJECT_ID(?)
+ORDER BY f.name, fc.constraint_column_id
+"""
+
+# Permissions granted or denied on a table, or on its columns
+PERMISSIONS_QUERY = """
+SELECT p.state_desc, p.permission_name, USER_NAME(p.grantee_principal_id), COL_NAME(p.major_id, p.minor_id)
+FROM sys.database_permissions p
+WHERE p.class = 1 AND p.major_id = OBJECT_ID(?)
+"""
+
+# Whether schema-bound views or functions depend on a table, and whether foreign keys reference it
+DEPENDENTS_QUERY = """
+SELECT
+  CASE WHEN EXISTS (
+    SELECT 1 FROM sys.sql_expression_dependencies WHERE referenced_id = OBJECT_ID(?) AND is_schema_bound_reference = 1
+  ) THEN 1 ELSE 0 END,
+  CASE WHEN EXISTS (SELECT 1 FROM sys.foreign_keys WHERE referenced_object_id = OBJECT_ID(?)) THEN 1 ELSE 0 END
+"""
+
+
+def grouped(rows):
+    """Group rows by their first value, keeping the order of both."""
+    groups = {}
+    for name, *values in rows:
+        groups.setdefault(name, []).append(values)
+    return groups
+
+
+def index_statements(rows, tablename):
+    """Build CREATE INDEX statements on `tablename` from the rows of `INDEXES_QUERY`."""
+    indexes = {}
+    for name, type_desc, is_unique, column, is_descending, is_included in rows:
+        index = indexes.setdefault(name, {"type": type_desc, "unique": is_unique, "keys": [], "include": []})
+        if is_included:
+            index["include"].append(f"[{column}]")
+        else:
+            index["keys"].append(f"[{column}] DESC" if is_descending else f"[{column}]")
+    statements = []
+    for name, index in indexes.items():
+        unique = "UNIQUE " if index["unique"] else ""
+        include = f" INCLUDE ({', '.join(index['include'])})" if index["include"] else ""
+        statements.append(
+            f"CREATE {unique}{index['type']} INDEX [{name}] ON {tablename} ({', '.join(index['keys'])}){include}"
+        )
+    return statements
 
 
 class SqlLoader(LoaderBase):
+    dialect = "sqlserver"
+
     def __init__(
         self,
-        # connection_string=SQL_SERVER_CONNECTION_STRING,
-        # schemaname=SQL_SERVER_SCHEMA,
+        connection_string=None,
+        schemaname=None,
+        batch_size=DEFAULT_BATCH_SIZE,
+        tablock=False,
+        checkpoint=False,
+        pool=None,
+        type_margin=SAFETY_MARGIN,
     ):
-        # self.connection_string = connection_string
+        """
+        `batch_size` rows are sent per `executemany` call.  `tablock` adds a
+        TABLOCK hint to inserts, which takes one table lock instead of many row
+        locks and allows minimal logging under the simple or bulk-logged
+        recovery models.  With `checkpoint`, each batch is committed together
+        with the row offset reached in the file, so that a failed load resumes
+        from there on retry instead of starting over; a file replaced with
+        new contents in the meantime starts over.  Given a
+        `ConnectionPool` as `pool`, connections are borrowed from it instead
+        of opened by the loader.  Column types of created tables are sized
+        to the data with `type_margin` to spare.
+        """
+        self.connection_string = connection_string
         self.connection = None
         self.connected = False
-        # self.schema = schemaname
+        self.schema = schemaname
+        self.batch_size = batch_size
+        self.tablock = tablock
+        self.checkpoint = checkpoint
+        self.pool = pool
+        self.type_margin = type_margin
 
     @property
     def schemaname(self):
         return self.schema
 
     def connect(self):
-        self.connection = pyodbc.connect(self.connection_string)
+        if self.pool is not None:
+            self.connection = self.pool.acquire()
+        else:
+            self.connection = pyodbc.connect(self.connection_string)
         self.connection.autocommit = True
         self.connected = True
 
+    def close_connection(self):
+        if getattr(self, "connection", None) is not None:
+            if self.pool is not None:
+                self.pool.release(self.connection)
+            else:
+                self.connection.close()
+            self.connection = None
+        self.connected = False
+
     @connected
-    def load_datafile(self, datafile):
-        self.create_schema_if_not_exists()
-        self.create_table_if_not_exists(datafile)
+    def load_datafile(self, datafile, mode=Mode.APPEND, allow_schema_evolution=True):
+        if mode == Mode.OVERWRITE:
+            self.ensure_schema()
+            self.overwrite_data(datafile)
+            return
+        self.ensure_table(datafile, allow_schema_evolution)
+        if mode == Mode.MERGE:
+            self.merge_data(datafile)
+            return
+        if self.checkpoint:
+            self.create_checkpoint_table_if_not_exists()
         self.load_data(datafile)
 
     def create_schema_if_not_exists(self):
@@ -56,27 +188,17 @@ class SqlLoader(LoaderBase):
         self.connection.execute(ddl)
         logger.info(f"DDL SQL for schema {self.schemaname} finished successfully")
 
-    def create_table_statement(self, datafile):
-        tablename = datafile.tablename
-        schema_info = schema_information(datafile.data)
-        dtypes_mapping = {
-            "object": "nvarchar(max)",
-            "float64": "float",
-            "int64": "bigint",
-            "datetime64[ns]": "datetime",
-            "bool": "bit",
-            "timedelta[ns]": "time",
-            "category": "nvarchar(max)",
-        }
+    def create_table_statement(self, datafile, tablename=None):
+        tablename = tablename or datafile.tablename
         columns_spec = ", ".join(
-            f"[{column}] {dtypes_mapping[dtype]}"
-            for column, dtype in zip(schema_info["column"], schema_info["dtype"])
+            f"[{column}] {sqltype}"
+            for column, sqltype in zip(datafile.columns, self.column_types(datafile))
         )
 
         return f"""
-        IF NOT EXISTS (SELECT * FROM INFORMATION_SCHEMA.TABLES WHERE TABLE_NAME = N'{datafile.tablename}' AND TABLE_SCHEMA = N'{self.schemaname}')
+        IF NOT EXISTS (SELECT * FROM INFORMATION_SCHEMA.TABLES WHERE TABLE_NAME = N'{tablename}' AND TABLE_SCHEMA = N'{self.schemaname}')
         BEGIN
-            CREATE TABLE {self.schema}.{datafile.tablename} ({columns_spec})
+            CREATE TABLE {self.schema}.{tablename} ({columns_spec})
         END
         """
 
@@ -88,25 +210,313 @@ class SqlLoader(LoaderBase):
         self.connection.execute(ddl)
         logger.info(f"DDL SQL executed successfully")
 
+    def alter_table_statement(self, tablename, diff):
+        # Columns are added with one statement, but each widened column needs its own; all go in one batch
+        target = f"{self.schema}.{tablename}"
+        statements = []
+        if diff.added:
+            added = ", ".join(f"[{column}] {sql_type}" for column, sql_type in diff.added)
+            statements.append(f"ALTER TABLE {target} ADD {added}")
+        # ALTER COLUMN sets nullability too, so NOT NULL columns must say so again
+        not_null = {
+            column.name for column in self.catalog.columns(self.schemaname, tablename) or [] if not column.nullable
+        }
+        statements += [
+            f"ALTER TABLE {target} ALTER COLUMN [{column}] {sql_type} {'NOT NULL' if column in not_null else 'NULL'}"
+            for column, sql_type in diff.widened
+        ]
+        return ";\n".join(statements)
+
+    def create_checkpoint_table_if_not_exists(self):
+        if self.catalog is not None and self.catalog.has_table(self.schemaname, CHECKPOINT_TABLE):
+            return
+        ddl = f"""
+        IF NOT EXISTS (SELECT * FROM INFORMATION_SCHEMA.TABLES WHERE TABLE_NAME = N'{CHECKPOINT_TABLE}' AND TABLE_SCHEMA = N'{self.schemaname}')
+        BEGIN
+            CREATE TABLE {self.schema}.{CHECKPOINT_TABLE} (
+                file_id nvarchar(256) NOT NULL PRIMARY KEY,
+                row_offset bigint NOT NULL,
+                updated_at datetime2 NOT NULL
+            )
+        END
+        """
+        self.connection.execute(ddl)
+        if self.catalog is not None:
+            self.catalog.add_table(
+                self.schemaname,
+                CHECKPOINT_TABLE,
+                [Column("file_id", "nvarchar", 256), Column("row_offset", "bigint"), Column("updated_at", "datetime2")],
+            )
+
+    def checkpoint_key(self, datafile):
+        """Key a checkpoint on the file's contents as well as its id, so a file replaced in place starts over."""
+        version = datafile.md5 or datafile._modified_at
+        return f"{datafile.id}@{version}" if version else datafile.id
+
+    def read_checkpoint(self, datafile):
+        row = self.connection.execute(
+            f"SELECT row_offset FROM {self.schema}.{CHECKPOINT_TABLE} WHERE file_id = ?",
+            self.checkpoint_key(datafile),
+        ).fetchone()
+        return row[0] if row else 0
+
+    def write_checkpoint(self, cursor, datafile, offset):
+        cursor.execute(
+            f"UPDATE {self.schema}.{CHECKPOINT_TABLE} SET row_offset = ?, updated_at = SYSUTCDATETIME() WHERE file_id = ?",
+            offset,
+            self.checkpoint_key(datafile),
+        )
+        if cursor.rowcount == 0:
+            cursor.execute(
+                f"INSERT INTO {self.schema}.{CHECKPOINT_TABLE} (file_id, row_offset, updated_at) VALUES (?, ?, SYSUTCDATETIME())",
+                self.checkpoint_key(datafile),
+                offset,
+            )
+
+    def clear_checkpoint(self, cursor, datafile):
+        # Checkpoints left by earlier versions of the file go too
+        cursor.execute(
+            f"DELETE FROM {self.schema}.{CHECKPOINT_TABLE} WHERE file_id = ? OR LEFT(file_id, ?) = ?",
+            datafile.id,
+            len(datafile.id) + 1,
+            f"{datafile.id}@",
+        )
+
     def perform_load(self, datafile):
-        insert = self.insert_statement(datafile.data.columns, datafile.tablename)
+        insert = self.insert_statement(datafile.columns, datafile.tablename)
         logger.debug(f"Executing SQL: \n{insert}")
+        offset = resumed = self.read_checkpoint(datafile) if self.checkpoint else 0
+        if offset:
+            logger.info(f"Resuming load of {datafile} from checkpoint at row {offset}")
         cursor = self.connection.cursor()
         cursor.fast_executemany = True
-        logger.info(f"{datafile.records}")
-        cursor.executemany(insert, datafile.records)
-        cursor.commit()
+        with self.metrics.span("insert", datafile):
+            # Rows of the file before the current chunk, which checkpoints count from
+            passed = 0
+            for _ in datafile.chunks():
+                for batch in datafile.batches(self.batch_size, start=max(resumed - passed, 0)):
+                    cursor.executemany(insert, batch)
+                    offset += len(batch)
+                    if self.checkpoint:
+                        self.write_checkpoint(cursor, datafile, offset)
+                        cursor.commit()
+                        logger.debug(f"Committed {datafile} through row {offset}")
+                passed += len(datafile.data)
+        if self.checkpoint:
+            self.clear_checkpoint(cursor, datafile)
+        with self.metrics.span("commit", datafile):
+            cursor.commit()
         cursor.close()
 
     def insert_statement(self, column_names, tablename):
-        columns = ", ".join(column_names)
+        columns = ", ".join(f"[{column}]" for column in column_names)
         q = ",".join(repeat("?", len(column_names)))
-        return f"INSERT INTO {self.schemaname}.{tablename} ({columns}) VALUES ({q})"
+        hint = " WITH (TABLOCK)" if self.tablock else ""
+        return f"INSERT INTO {self.schema}.{tablename}{hint} ({columns}) VALUES ({q})"
+
+    def merge_data(self, datafile):
+        """Replace the rows of `datafile`'s partition of the target table with its contents.
+
+        Rows are bulk inserted into a session temporary table, then the
+        partition is deleted and refilled from it with one statement each,
+        all in one transaction, so readers see either the old or the new
+        partition.
+        """
+        target = f"{self.schema}.{datafile.tablename}"
+        staging = f"#staging_{datafile.tablename}"
+        columns = ", ".join(f"[{column}]" for column in datafile.columns)
+        partition_column, partition_value = self.merge_partition(datafile)
+        hint = " WITH (TABLOCK)" if self.tablock else ""
+        self.connection.autocommit = False
+        cursor = self.connection.cursor()
+        try:
+            logger.info(f"Merging records from {datafile} into SQL Server")
+            cursor.execute(f"SELECT TOP 0 {columns} INTO {staging} FROM {target}")
+            cursor.fast_executemany = True
+            insert = f"INSERT INTO {staging} ({columns}) VALUES ({','.join(repeat('?', len(datafile.columns)))})"
+            with self.metrics.span("insert", datafile):
+                for _ in datafile.chunks():
+                    for batch in datafile.batches(self.batch_size):
+                        cursor.executemany(insert, batch)
+                cursor.execute(f"DELETE FROM {target} WHERE [{partition_column}] = ?", partition_value)
+                deleted = cursor.rowcount
+                cursor.execute(f"INSERT INTO {target}{hint} ({columns}) SELECT {columns} FROM {staging}")
+            with self.metrics.span("commit", datafile):
+                cursor.commit()
+        except pyodbc.DatabaseError as err:
+            self.connection.rollback()
+            logger.error(f"Merging of data into SQL Server of {datafile} failed")
+            raise err
+        else:
+            logger.info(
+                f"Merge successful. Replaced {deleted} records where {partition_column} = {partition_value} "
+                f"with {datafile.processed} records from {datafile}"
+            )
+        finally:
+            # After a failure the connection may be unusable; the original error is the one to raise
+            try:
+                cursor.execute(f"IF OBJECT_ID('tempdb..{staging}') IS NOT NULL DROP TABLE {staging}")
+            except pyodbc.Error as err:
+                logger.warning(f"Failed to drop {staging}: {err}")
+            cursor.close()
+            self.connection.autocommit = True
+
+    def shadow_statements(self, cursor, datafile):
+        """Return statements rebuilding the target table of `datafile` on its shadow, and the constraints to rename.
+
+        The shadow gets the NOT NULL columns, constraints, indexes and
+        permissions of the table.  Constraint names are unique within a
+        schema, so constraints are built under names of their own, and
+        returned as (shadow name, name) pairs to rename once the table they
+        were copied from is dropped.
+        """
+        target = f"{self.schema}.{datafile.tablename}"
+        shadow = f"{self.schema}.{datafile.tablename}{SHADOW_SUFFIX}"
+        types = dict(zip((str(column) for column in datafile.columns), self.column_types(datafile)))
+        statements = [
+            f"ALTER TABLE {shadow} ALTER COLUMN [{column}] {types[column]} NOT NULL"
+            for column, in cursor.execute(NOT_NULL_QUERY, target).fetchall()
+            if column in types
+        ]
+        renames = []
+
+        def add_constraint(name, definition):
+            statements.append(f"ALTER TABLE {shadow} ADD CONSTRAINT [{name}{SHADOW_SUFFIX}] {definition}")
+            renames.append((f"{name}{SHADOW_SUFFIX}", name))
+
+        # The clustered primary key goes before the other indexes, which would be rebuilt by it
+        for name, columns in grouped(cursor.execute(KEY_CONSTRAINTS_QUERY, target).fetchall()).items():
+            kind = "PRIMARY KEY" if columns[0][0] == "PK" else "UNIQUE"
+            keys = ", ".join(f"[{column}] DESC" if is_descending else f"[{column}]" for _, _, column, is_descending in columns)
+            add_constraint(name, f"{kind} {columns[0][1]} ({keys})")
+        statements += index_statements(cursor.execute(INDEXES_QUERY, target).fetchall(), shadow)
+        for name, definition in cursor.execute(CHECK_CONSTRAINTS_QUERY, target).fetchall():
+            add_constraint(name, f"CHECK {definition}")
+        for name, column, definition in cursor.execute(DEFAULT_CONSTRAINTS_QUERY, target).fetchall():
+            if column in types:
+                add_constraint(name, f"DEFAULT {definition} FOR [{column}]")
+        for name, columns in grouped(cursor.execute(FOREIGN_KEYS_QUERY, target).fetchall()).items():
+            _, schema, table, _, on_delete, on_update = columns[0]
+            keys = ", ".join(f"[{column[0]}]" for column in columns)
+            references = ", ".join(f"[{column[3]}]" for column in columns)
+            add_constraint(
+                name,
+                f"FOREIGN KEY ({keys}) REFERENCES [{schema}].[{table}] ({references}) "
+                f"ON DELETE {on_delete.replace('_', ' ')} ON UPDATE {on_update.replace('_', ' ')}",
+            )
+        for state, permission, grantee, column in cursor.execute(PERMISSIONS_QUERY, target).fetchall():
+            if column is not None and column not in types:
+                continue
+            on = f"{shadow} ([{column}])" if column is not None else shadow
+            if state == "GRANT_WITH_GRANT_OPTION":
+                statements.append(f"GRANT {permission} ON {on} TO [{grantee}] WITH GRANT OPTION")
+            else:
+                statements.append(f"{state} {permission} ON {on} TO [{grantee}]")
+        return statements, renames
+
+    def overwrite_data(self, datafile):
+        """Replace the target table with one holding the contents of `datafile`.
+
+        Rows are bulk inserted into a shadow heap, the constraints, indexes
+        and permissions of the target are then rebuilt on it, and it is
+        swapped in with `sp_rename`.  It all runs in one transaction, and
+        readers of the target are blocked only from the rename until the
+        commit.  Tables that schema-bound views depend on or foreign keys
+        reference can't be swapped out; they are emptied and reloaded in
+        the transaction instead, which blocks their readers for the whole
+        load.
+        """
+        target = f"{self.schema}.{datafile.tablename}"
+        self.connection.autocommit = False
+        cursor = self.connection.cursor()
+        try:
+            logger.info(f"Overwriting {target} with records from {datafile}")
+            has_schema_bound, is_referenced = cursor.execute(DEPENDENTS_QUERY, target, target).fetchone()
+            if has_schema_bound or is_referenced:
+                self.reload_table(cursor, datafile, is_referenced)
+            else:
+                self.swap_in_shadow(cursor, datafile)
+            with self.metrics.span("commit", datafile):
+                cursor.commit()
+        except pyodbc.DatabaseError as err:
+            self.connection.rollback()
+            # The target table was left as it was; introspect it again on the next load
+            self.catalog = None
+            logger.error(f"Overwriting of {target} with {datafile} failed")
+            raise err
+        else:
+            logger.info(
+                f"Overwrite successful. Loaded {datafile.processed} records from {datafile} into SQL Server"
+            )
+        finally:
+            cursor.close()
+            self.connection.autocommit = True
+
+    def insert_chunks(self, cursor, datafile, insert):
+        cursor.fast_executemany = True
+        with self.metrics.span("insert", datafile):
+            for _ in datafile.chunks():
+                for batch in datafile.batches(self.batch_size):
+                    cursor.executemany(insert, batch)
+
+    def swap_in_shadow(self, cursor, datafile):
+        tablename = datafile.tablename
+        target = f"{self.schema}.{tablename}"
+        shadow_name = f"{tablename}{SHADOW_SUFFIX}"
+        shadow = f"{self.schema}.{shadow_name}"
+        retired = f"{tablename}__retired"
+        statements, renames = self.shadow_statements(cursor, datafile)
+        cursor.execute(f"DROP TABLE IF EXISTS {shadow}")
+        cursor.execute(self.create_table_statement(datafile, shadow_name))
+        # TABLOCK on an empty heap allows minimally logged inserts, and nobody reads the shadow
+        columns = ", ".join(f"[{column}]" for column in datafile.columns)
+        insert = f"INSERT INTO {shadow} WITH (TABLOCK) ({columns}) VALUES ({','.join(repeat('?', len(datafile.columns)))})"
+        self.insert_chunks(cursor, datafile, insert)
+        for ddl in statements:
+            logger.debug(f"Executing SQL: \n{ddl}")
+            cursor.execute(ddl)
+        exists = cursor.execute("SELECT OBJECT_ID(?)", target).fetchone()[0] is not None
+        if exists:
+            cursor.execute("EXEC sp_rename ?, ?", target, retired)
+        cursor.execute("EXEC sp_rename ?, ?", shadow, tablename)
+        if exists:
+            cursor.execute(f"DROP TABLE {self.schema}.{retired}")
+        for shadow_constraint, constraint in renames:
+            cursor.execute("EXEC sp_rename ?, ?, 'OBJECT'", f"{self.schema}.{shadow_constraint}", constraint)
+        self.catalog.add_table(self.schemaname, tablename, self.table_columns(datafile))
+
+    def reload_table(self, cursor, datafile, is_referenced=False):
+        """Empty the target table and load `datafile` into it, taking its columns."""
+        target = f"{self.schema}.{datafile.tablename}"
+        logger.info(f"{target} has dependents; reloading it in place")
+        self.ensure_table(datafile)
+        # TRUNCATE is refused on tables that foreign keys reference
+        cursor.execute(f"DELETE FROM {target}" if is_referenced else f"TRUNCATE TABLE {target}")
+        columns = ", ".join(f"[{column}]" for column in datafile.columns)
+        hint = " WITH (TABLOCK)" if self.tablock else ""
+        self.insert_chunks(
+            cursor, datafile, f"INSERT INTO {target}{hint} ({columns}) VALUES ({','.join(repeat('?', len(datafile.columns)))})"
+        )
+
+    @connected
+    def row_counts_by_run(self, tablename):
+        exists = self.connection.execute(
+            "SELECT 1 FROM INFORMATION_SCHEMA.TABLES WHERE TABLE_NAME = ? AND TABLE_SCHEMA = ?",
+            tablename,
+            self.schemaname,
+        ).fetchone()
+        if not exists:
+            return {}
+        rows = self.connection.execute(
+            f"SELECT run_id, COUNT(*) FROM {self.schema}.{tablename} GROUP BY run_id"
+        ).fetchall()
+        return {run_id: count for run_id, count in rows}
 
     def load_data(self, datafile):
         # We don't want to autocommit here, since the driver will issue a commit for each record in the load
         # Rather we'll commit explicitly at the end so that either all the records are committed, or none are
-        self.autocommit = False
+        # (or, with checkpointing enabled, after each batch along with its checkpoint)
+        self.connection.autocommit = False
         try:
             logger.info(f"Loading records from {datafile} into SQL Server")
             self.perform_load(datafile)
@@ -118,4 +528,5 @@ class SqlLoader(LoaderBase):
             logger.info(
                 f"Load successful. Loaded {datafile.processed} records from {datafile} into SQL Server"
             )
-            self.autocommit = True
+        finally:
+            self.connection.autocommit = True
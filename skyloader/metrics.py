@@ -0,0 +1,183 @@
+"""Timing and counting the stages of a load run.
+
+`LoaderManager`, the loaders and `Drive` time each stage of loading a file
+(list, download, parse, metadata, ddl, insert, commit, move) as spans of
+the `Metrics` they are given, and count the rows, bytes, retries and
+failures.  The totals are written out as a JSON run report, or as a
+Prometheus text file for node_exporter's textfile collector.  Without a
+`Metrics`, they use `NULL_METRICS`, which records nothing.
+"""
+import datetime
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+STAGES = ("list", "download", "parse", "metadata", "ddl", "insert", "commit", "move")
+COUNTERS = ("files", "rows", "bytes", "retries", "failures")
+
+
+class Span:
+    """Times one stage, for one datafile when given, while entered or between `start` and `stop`."""
+
+    def __init__(self, metrics, stage, datafile=None):
+        self.metrics = metrics
+        self.stage = stage
+        self.datafile = datafile
+        self.started = None
+        self.hooks = []
+
+    def start(self):
+        self.hooks = [hook(self.stage, self.datafile) for hook in self.metrics.hooks]
+        for hook in self.hooks:
+            hook.__enter__()
+        self.started = time.perf_counter()
+        return self
+
+    def stop(self):
+        if self.started is None:
+            return
+        seconds = time.perf_counter() - self.started
+        self.started = None
+        for hook in reversed(self.hooks):
+            hook.__exit__(None, None, None)
+        self.metrics.record(self.stage, seconds, self.datafile)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+class NullSpan:
+    def start(self):
+        return self
+
+    def stop(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Metrics:
+    """Collects stage timings and counters over a run; safe to share between threads.
+
+    Each of `hooks` is called with the stage and datafile of every span,
+    and the context manager it returns is entered for the span's duration,
+    so callers can attach a profiler, e.g.
+    `Metrics(hooks=[lambda stage, datafile: profiler])` for a
+    `cProfile.Profile` shared across spans.
+    """
+
+    enabled = True
+
+    def __init__(self, run_id=None, hooks=()):
+        self.run_id = run_id
+        self.hooks = list(hooks)
+        self.started_at = datetime.datetime.now()
+        self.seconds = defaultdict(float)
+        self.spans = defaultdict(int)
+        self.max_seconds = defaultdict(float)
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.files = {}
+        self._lock = threading.Lock()
+
+    def span(self, stage, datafile=None):
+        return Span(self, stage, datafile)
+
+    def record(self, stage, seconds, datafile=None):
+        with self._lock:
+            self.seconds[stage] += seconds
+            self.spans[stage] += 1
+            self.max_seconds[stage] = max(self.max_seconds[stage], seconds)
+            if datafile is not None:
+                file = self.files.setdefault(datafile.id, {"name": datafile.name, "stages": {}})
+                file["stages"][stage] = file["stages"].get(stage, 0) + seconds
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def report(self):
+        stages = [stage for stage in STAGES if stage in self.spans]
+        stages += sorted(set(self.spans) - set(STAGES))
+        return {
+            "run_id": self.run_id,
+            "started_at": self.started_at.isoformat(),
+            "reported_at": datetime.datetime.now().isoformat(),
+            "stages": {
+                stage: {
+                    "spans": self.spans[stage],
+                    "seconds": self.seconds[stage],
+                    "max_seconds": self.max_seconds[stage],
+                }
+                for stage in stages
+            },
+            "counters": dict(self.counters),
+            "files": [{"id": file_id, **file} for file_id, file in self.files.items()],
+        }
+
+    def prometheus(self):
+        """Render the totals in the Prometheus text exposition format."""
+        report = self.report()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP skyloader_{name} {help_text}")
+            lines.append(f"# TYPE skyloader_{name} {kind}")
+            for labels, value in samples:
+                lines.append(f"skyloader_{name}{labels} {value}")
+
+        stages = report["stages"].items()
+        metric("stage_seconds_total", "counter", "Time spent in each stage of loading files.",
+               [(f'{{stage="{stage}"}}', totals["seconds"]) for stage, totals in stages])
+        metric("stage_spans_total", "counter", "Times each stage was run.",
+               [(f'{{stage="{stage}"}}', totals["spans"]) for stage, totals in stages])
+        metric("stage_max_seconds", "gauge", "Longest single run of each stage.",
+               [(f'{{stage="{stage}"}}', totals["max_seconds"]) for stage, totals in stages])
+        for name, value in report["counters"].items():
+            metric(f"{name}_total", "counter", f"Total {name} in the run.", [("", value)])
+        metric("run_timestamp_seconds", "gauge", "When the run started.",
+               [(f'{{run_id="{self.run_id}"}}', self.started_at.timestamp())])
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, path):
+        write_atomically(path, json.dumps(self.report(), indent=2))
+
+    def write_prometheus(self, path):
+        # node_exporter may read the file at any time, so it is replaced whole
+        write_atomically(path, self.prometheus())
+
+
+class NullMetrics(Metrics):
+    """Records nothing, for runs without instrumentation."""
+
+    enabled = False
+
+    def span(self, stage, datafile=None):
+        return NULL_SPAN
+
+    def record(self, stage, seconds, datafile=None):
+        pass
+
+    def count(self, name, value=1):
+        pass
+
+
+NULL_METRICS = NullMetrics()
+
+
+def write_atomically(path, text):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
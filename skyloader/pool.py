@@ -0,0 +1,167 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+def ping(connection):
+    """Default health check: a round trip that any DB-API connection supports."""
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT 1")
+        cursor.fetchall()
+    finally:
+        cursor.close()
+    # Don't hand out a connection left inside the check's implicit transaction
+    if not getattr(connection, "autocommit", True):
+        connection.rollback()
+
+
+class ConnectionPool:
+    """A thread-safe pool of DB-API connections that loaders borrow from.
+
+    `connect` is called to open each new connection.  Connections are
+    checked with `check` (a `SELECT 1` round trip by default) when they are
+    checked out, and replaced with a new one if the check fails, so a
+    connection dropped by the server is reconnected transparently.  The pool
+    keeps at least `min_size` and at most `max_size` connections; idle
+    connections above `min_size` are closed after `idle_timeout` seconds.
+    """
+
+    def __init__(self, connect, min_size=1, max_size=4, idle_timeout=300, timeout=30, check=ping):
+        if not 0 <= min_size <= max_size:
+            raise ValueError(f"Expected 0 <= min_size <= max_size; got {min_size} and {max_size}")
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.check = check
+        self.size = 0
+        self.idle = []
+        self.condition = threading.Condition()
+        self.opened = False
+        self.closed = False
+
+    def _open_connection(self):
+        connection = self.connect()
+        logger.debug(f"Opened pooled connection {connection!r}")
+        return connection
+
+    def _discard(self, connection):
+        with self.condition:
+            self.size -= 1
+            self.condition.notify()
+        try:
+            connection.close()
+        except Exception:
+            logger.debug(f"Error closing discarded connection {connection!r}", exc_info=True)
+
+    def _evict_idle(self):
+        """Close idle connections past their timeout; call with the condition held."""
+        now = time.monotonic()
+        evicted = []
+        while self.size > self.min_size and self.idle:
+            connection, since = self.idle[0]
+            if now - since < self.idle_timeout:
+                break
+            self.idle.pop(0)
+            self.size -= 1
+            evicted.append(connection)
+        return evicted
+
+    def open(self):
+        """Open `min_size` connections ahead of first use."""
+        with self.condition:
+            if self.opened:
+                return
+            self.opened = True
+        for _ in range(self.min_size):
+            connection = self._open_connection()
+            with self.condition:
+                self.size += 1
+                self.idle.append((connection, time.monotonic()))
+
+    def acquire(self):
+        if not self.opened:
+            self.open()
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with self.condition:
+                if self.closed:
+                    raise PoolTimeout("Connection pool is closed")
+                connection = None
+                while not self.idle and self.size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not self.condition.wait(remaining):
+                        raise PoolTimeout(
+                            f"No connection became available within {self.timeout}s (max_size={self.max_size})"
+                        )
+                if self.idle:
+                    connection, _ = self.idle.pop()
+                else:
+                    self.size += 1
+            if connection is None:
+                try:
+                    return self._open_connection()
+                except Exception:
+                    with self.condition:
+                        self.size -= 1
+                        self.condition.notify()
+                    raise
+            try:
+                self.check(connection)
+            except Exception:
+                logger.warning(f"Pooled connection {connection!r} failed its health check; reconnecting")
+                self._discard(connection)
+                continue
+            return connection
+
+    def release(self, connection, discard=False):
+        """Return a connection to the pool, rolling back any open transaction."""
+        if not discard:
+            try:
+                if not getattr(connection, "autocommit", True):
+                    connection.rollback()
+            except Exception:
+                discard = True
+        if discard or self.closed:
+            self._discard(connection)
+            return
+        with self.condition:
+            self.idle.append((connection, time.monotonic()))
+            evicted = self._evict_idle()
+            self.condition.notify()
+        for stale in evicted:
+            stale.close()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            idle, self.idle = self.idle, []
+            self.size -= len(idle)
+            self.condition.notify_all()
+        for connection, _ in idle:
+            connection.close()
+
+
+_shared_pools = {}
+_shared_pools_lock = threading.Lock()
+
+
+def shared_pool(key, connect, **options):
+    """Return the process-wide pool registered under `key`, creating it on first use.
+
+    Loaders built with the same key (for example a connection string) share
+    connections, so the connection handshake is paid once per process.
+    """
+    with _shared_pools_lock:
+        pool = _shared_pools.get(key)
+        if pool is None or pool.closed:
+            pool = _shared_pools[key] = ConnectionPool(connect, **options)
+        return pool
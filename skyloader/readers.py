@@ -0,0 +1,348 @@
+"""Readers parsing downloaded files into DataFrames.
+
+Workbooks are read with one of several engines: calamine (a Rust parser,
+when `python-calamine` is installed), openpyxl in read-only streaming mode,
+or `pandas.read_excel`.  The streaming engines can also yield the rows of a
+sheet as DataFrames of `chunk_size` rows, rather than one whole frame.
+
+Delimited text files, optionally gzipped, are read with pyarrow's
+multithreaded CSV reader, after sniffing their encoding and delimiter.
+"""
+import csv
+import gzip
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import date, datetime
+from importlib.util import find_spec
+from itertools import islice
+from pathlib import PurePath
+
+import pandas as pd
+
+ENGINES = ("auto", "calamine", "openpyxl", "pandas")
+
+DEFAULT_CHUNK_SIZE = 50_000
+
+CSV_MIMETYPES = {"text/csv", "text/tab-separated-values", "text/plain", "application/csv"}
+CSV_SUFFIXES = {".csv", ".tsv", ".tab", ".txt"}
+DELIMITERS = ",\t;|"
+
+# Bytes of a delimited file looked at to tell its encoding and delimiter
+SNIFF_SIZE = 64 * 1024
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+class ReadOptions:
+    """How to read a file: the engine, the sheet and the dtypes to pin columns to.
+
+    `sheet_name` is a sheet's name or position, the first sheet by default.
+    Columns named in `dtypes` are built with the given dtype instead of one
+    inferred from their values.  With `arrow`, files are read into Arrow
+    tables instead of DataFrames.  With `newlines_in_values`, quoted values
+    of delimited files may span lines; this slows down pyarrow's splitting
+    of files into blocks, so is only for files known to need it.
+    """
+
+    def __init__(
+        self,
+        engine="auto",
+        sheet_name=None,
+        dtypes=None,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        arrow=False,
+        newlines_in_values=False,
+    ):
+        if engine not in ENGINES:
+            raise ValueError(f"Expected engine to be one of {ENGINES}; got {engine} instead")
+        self.engine = engine
+        self.sheet_name = sheet_name
+        self.dtypes = dtypes or {}
+        self.chunk_size = chunk_size
+        self.arrow = arrow
+        self.newlines_in_values = newlines_in_values
+
+    def __repr__(self):
+        return (
+            f"<ReadOptions engine={self.engine} sheet_name={self.sheet_name} dtypes={self.dtypes} arrow={self.arrow}>"
+        )
+
+
+def make_header(row):
+    """Name the columns after the header row, as `read_excel` does for blank and repeated names."""
+    header, seen = [], {}
+    for i, name in enumerate(row):
+        if name is None or name == "":
+            name = f"Unnamed: {i}"
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        header.append(name)
+    return header
+
+
+def without_trailing_blanks(rows):
+    """Drop blank rows at the end of a sheet, keeping those between data rows."""
+    blanks = []
+    for row in rows:
+        if all(value is None for value in row):
+            blanks.append(row)
+            continue
+        if blanks:
+            yield from blanks
+            blanks = []
+        yield row
+
+
+def frame_from_rows(rows, header, dtypes=None):
+    """Build a DataFrame column by column, inferring dtypes only for columns not pinned in `dtypes`."""
+    dtypes = dtypes or {}
+    width = len(header)
+    columns = list(zip(*(tuple(row[:width]) + (None,) * (width - len(row)) for row in rows))) or [()] * width
+    data = {}
+    for name, values in zip(header, columns):
+        if name in dtypes:
+            data[name] = pd.Series(values, dtype=dtypes[name])
+            continue
+        series = pd.Series(values, dtype=None if values else object)
+        # Blank columns come out as float, as from read_excel
+        data[name] = series.astype("float64") if series.dtype == object and series.isna().all() else series
+    return pd.DataFrame(data, columns=header)
+
+
+def table_from_rows(rows, header, dtypes=None):
+    """Build an Arrow table column by column, like `frame_from_rows`."""
+    import pyarrow as pa
+
+    dtypes = dtypes or {}
+    width = len(header)
+    columns = list(zip(*(tuple(row[:width]) + (None,) * (width - len(row)) for row in rows))) or [()] * width
+    arrays = []
+    for name, values in zip(header, columns):
+        try:
+            arrays.append(pa.array(values, type=arrow_type(dtypes[name]) if name in dtypes else None))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Columns mixing strings with other values are read as text
+            arrays.append(pa.array([None if value is None else str(value) for value in values], pa.string()))
+    return pa.table(arrays, names=[str(name) for name in header])
+
+
+class ExcelReader(ABC):
+    """Reads one sheet of a workbook, its first row being the header."""
+
+    def __init__(self, options=None):
+        self.options = options or ReadOptions()
+
+    @abstractmethod
+    def rows(self, fh):
+        """Yield the cells of each row of the sheet, None for empty cells."""
+
+    def build(self, rows, header):
+        build = table_from_rows if self.options.arrow else frame_from_rows
+        return build(rows, header, self.options.dtypes)
+
+    def read(self, fh):
+        rows = self.rows(fh)
+        header = make_header(next(rows, ()))
+        return self.build(list(without_trailing_blanks(rows)), header)
+
+    def chunks(self, fh):
+        """Yield the sheet as DataFrames (or Arrow tables) of at most `chunk_size` rows."""
+        rows = self.rows(fh)
+        header = make_header(next(rows, ()))
+        rows = without_trailing_blanks(rows)
+        while chunk := list(islice(rows, self.options.chunk_size)):
+            yield self.build(chunk, header)
+
+
+class CalamineReader(ExcelReader):
+    def rows(self, fh):
+        from python_calamine import CalamineWorkbook
+
+        workbook = CalamineWorkbook.from_filelike(fh)
+        sheet_name = self.options.sheet_name
+        if isinstance(sheet_name, str):
+            sheet = workbook.get_sheet_by_name(sheet_name)
+        else:
+            sheet = workbook.get_sheet_by_index(sheet_name or 0)
+        for row in sheet.iter_rows():
+            # Excel stores every number as a float and calamine returns empty cells as ""
+            yield [
+                None if value == ""
+                else int(value) if type(value) is float and value.is_integer()
+                else datetime.combine(value, datetime.min.time()) if type(value) is date
+                else value
+                for value in row
+            ]
+
+
+class OpenpyxlReader(ExcelReader):
+    def rows(self, fh):
+        import openpyxl
+
+        workbook = openpyxl.load_workbook(fh, read_only=True, data_only=True, keep_links=False)
+        try:
+            sheet_name = self.options.sheet_name
+            if isinstance(sheet_name, str):
+                sheet = workbook[sheet_name]
+            else:
+                sheet = workbook.worksheets[sheet_name or 0]
+            yield from sheet.iter_rows(values_only=True)
+        finally:
+            workbook.close()
+
+
+class PandasReader(ExcelReader):
+    def rows(self, fh):
+        data = pd.read_excel(fh, sheet_name=self.options.sheet_name or 0, header=None)
+        for row in data.astype(object).itertuples(index=False):
+            yield [None if pd.isna(value) else value for value in row]
+
+    def read(self, fh):
+        data = pd.read_excel(fh, sheet_name=self.options.sheet_name or 0, dtype=self.options.dtypes or None)
+        if self.options.arrow:
+            import pyarrow as pa
+
+            return pa.Table.from_pandas(data, preserve_index=False)
+        return data
+
+    def chunks(self, fh):
+        yield self.read(fh)
+
+
+def sniff_encoding(sample):
+    if sample.startswith((b"\xff\xfe", b"\xfe\xff")):
+        return "utf-16"
+    if sample.startswith(b"\xef\xbb\xbf"):
+        return "utf-8-sig"
+    try:
+        sample.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # The sample may end part way through a character
+        if e.start < len(sample) - 3:
+            return "cp1252"
+    return "utf-8"
+
+
+def sniff_delimiter(text, default=","):
+    lines = text.splitlines()
+    # Leave out the last line, which is likely cut short
+    sample = "\n".join(lines[:-1] if len(lines) > 1 else lines)
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=DELIMITERS).delimiter
+    except csv.Error:
+        return default
+
+
+def arrow_type(dtype):
+    """The Arrow type to parse a column pinned to a pandas `dtype` as; text when there is none."""
+    import pyarrow as pa
+
+    dtype = pd.api.types.pandas_dtype(dtype)
+    try:
+        return pa.from_numpy_dtype(getattr(dtype, "numpy_dtype", dtype))
+    except (TypeError, pa.ArrowNotImplementedError):
+        return pa.string()
+
+
+class CsvReader:
+    """Reads delimited text files with pyarrow.csv, on all cores.
+
+    The encoding and delimiter are sniffed from the start of the file, and
+    gzipped files are decompressed as they are read.
+    """
+
+    def __init__(self, options=None, suffix=""):
+        self.options = options or ReadOptions()
+        self.suffix = suffix
+
+    @contextmanager
+    def open(self, fh):
+        """Open the file for reading, decompressing it if it is gzipped."""
+        compressed = fh.read(2) == GZIP_MAGIC
+        fh.seek(0)
+        if not compressed:
+            yield fh
+            return
+        with gzip.GzipFile(fileobj=fh, mode="rb") as stream:
+            yield stream
+
+    def arrow_options(self, stream):
+        from pyarrow import csv as pacsv
+
+        sample = stream.read(SNIFF_SIZE)
+        stream.seek(0)
+        encoding = sniff_encoding(sample)
+        default = "\t" if self.suffix in (".tsv", ".tab") else ","
+        delimiter = sniff_delimiter(sample.decode(encoding, errors="ignore"), default)
+        read_options = pacsv.ReadOptions(encoding=encoding, block_size=1 << 22, use_threads=True)
+        parse_options = pacsv.ParseOptions(delimiter=delimiter, newlines_in_values=self.options.newlines_in_values)
+        convert_options = pacsv.ConvertOptions(
+            strings_can_be_null=True,
+            column_types={name: arrow_type(dtype) for name, dtype in self.options.dtypes.items()},
+        )
+        return read_options, parse_options, convert_options
+
+    def convert(self, table):
+        """Return a table read by pyarrow as the result: a DataFrame unless reading into Arrow."""
+        if self.options.arrow:
+            return table
+        data = table.to_pandas()
+        pinned = {name: dtype for name, dtype in self.options.dtypes.items() if name in data.columns}
+        return data.astype(pinned) if pinned else data
+
+    def read(self, fh):
+        from pyarrow import csv as pacsv
+
+        with self.open(fh) as stream:
+            return self.convert(pacsv.read_csv(stream, *self.arrow_options(stream)))
+
+    def chunks(self, fh):
+        """Yield the file as DataFrames of about `chunk_size` rows, holding one block in memory at a time."""
+        import pyarrow as pa
+        from pyarrow import csv as pacsv
+
+        with self.open(fh) as stream:
+            batches, rows = [], 0
+            for batch in pacsv.open_csv(stream, *self.arrow_options(stream)):
+                batches.append(batch)
+                rows += batch.num_rows
+                if rows >= self.options.chunk_size:
+                    yield self.convert(pa.Table.from_batches(batches))
+                    batches, rows = [], 0
+            if batches:
+                yield self.convert(pa.Table.from_batches(batches))
+
+
+EXCEL_READERS = {
+    "calamine": CalamineReader,
+    "openpyxl": OpenpyxlReader,
+    "pandas": PandasReader,
+}
+
+
+def excel_engine(engine="auto"):
+    if engine == "auto":
+        return "calamine" if find_spec("python_calamine") is not None else "openpyxl"
+    return engine
+
+
+def file_suffix(name):
+    """The suffix that tells a file's format, looking past a `.gz` compression suffix."""
+    suffixes = [suffix.lower() for suffix in PurePath(name or "").suffixes]
+    if suffixes and suffixes[-1] == ".gz":
+        suffixes.pop()
+    return suffixes[-1] if suffixes else ""
+
+
+def is_delimited(name=None, mimetype=None):
+    return mimetype in CSV_MIMETYPES or file_suffix(name) in CSV_SUFFIXES
+
+
+def reader_for(options=None, name=None, mimetype=None):
+    """Return the reader for a file, telling its format by `mimetype` or the suffix of `name`."""
+    options = options or ReadOptions()
+    if is_delimited(name, mimetype):
+        return CsvReader(options, suffix=file_suffix(name))
+    return EXCEL_READERS[excel_engine(options.engine)](options)
@@ -0,0 +1,101 @@
+import logging
+import threading
+import time
+import traceback
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class FolderRun:
+    """The outcome of processing one registered folder."""
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.waited = 0.0
+        self.elapsed = 0.0
+        self.loaded = 0
+        self.failed = 0
+        self.error = None
+
+    @property
+    def status(self):
+        if self.error is not None:
+            return "error"
+        return "failed files" if self.failed else "ok"
+
+
+class FolderScheduler:
+    """Processes many folder registrations concurrently.
+
+    `manager_factory` is called with each `GoogleFolder` and returns the
+    `LoaderManager` to process it with.  At most `max_workers` folders are
+    processed at once, and at most `connections_per_database` of them load
+    into the same `GoogleFolder.database`.  Folders sharing a target table
+    are processed one after another, in registration order, so their loads
+    never interleave.
+    """
+
+    def __init__(self, folders, manager_factory, max_workers=8, connections_per_database=4):
+        self.folders = list(folders)
+        self.manager_factory = manager_factory
+        self.max_workers = max_workers
+        self.connections_per_database = connections_per_database
+        self._guard = threading.Lock()
+        self._table_locks = defaultdict(threading.Lock)
+        self._database_slots = defaultdict(
+            lambda: threading.BoundedSemaphore(self.connections_per_database)
+        )
+
+    def table_lock(self, target_table):
+        with self._guard:
+            return self._table_locks[target_table.lower()]
+
+    def database_slots(self, database):
+        with self._guard:
+            return self._database_slots[database]
+
+    def process_folder(self, folder):
+        run = FolderRun(folder)
+        started = time.perf_counter()
+        with self.table_lock(folder.target_table), self.database_slots(folder.database):
+            run.waited = time.perf_counter() - started
+            logger.info(f"Processing {folder} into {folder.target_table}")
+            try:
+                with self.manager_factory(folder) as manager:
+                    manager.process_files()
+                run.loaded, run.failed = manager.loaded, manager.failed
+            except Exception as e:
+                logger.error(f"Processing of {folder} failed:\n{traceback.format_exc()}")
+                run.error = e
+        run.elapsed = time.perf_counter() - started - run.waited
+        return run
+
+    def process_folders(self, folders):
+        return [self.process_folder(folder) for folder in folders]
+
+    def run(self):
+        """Process every folder, print a summary and return a `FolderRun` per folder."""
+        started = time.perf_counter()
+        # Folders sharing a table go to the same worker, so that they run in
+        # registration order without idling other workers on the table lock
+        by_table = defaultdict(list)
+        for folder in self.folders:
+            by_table[folder.target_table.lower()].append(folder)
+        with ThreadPoolExecutor(self.max_workers) as pool:
+            grouped = list(pool.map(self.process_folders, by_table.values()))
+        order = {id(folder): i for i, folder in enumerate(self.folders)}
+        runs = sorted((run for group in grouped for run in group), key=lambda r: order[id(r.folder)])
+        self.print_summary(runs, time.perf_counter() - started)
+        return runs
+
+    def print_summary(self, runs, elapsed):
+        width = max([len(run.folder.desc) for run in runs] + [6])
+        print(f"{'folder':<{width}}  {'waited':>8}  {'elapsed':>8}  {'loaded':>6}  {'failed':>6}  status")
+        for run in runs:
+            print(
+                f"{run.folder.desc:<{width}}  {run.waited:>7.1f}s  {run.elapsed:>7.1f}s  "
+                f"{run.loaded:>6}  {run.failed:>6}  {run.status}"
+            )
+        print(f"{len(runs)} folders processed in {elapsed:.1f}s")
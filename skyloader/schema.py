@@ -0,0 +1,78 @@
+from skyloader.sqltypes import (
+    SAFETY_MARGIN,
+    catalog_type,
+    column_types,
+    format_type,
+    is_arrow,
+    null_columns,
+    widen_type,
+)
+
+
+class SchemaMismatch(Exception):
+    pass
+
+
+class SchemaDiff:
+    """How the columns of a DataFrame differ from those of the table it loads into.
+
+    `added` and `widened` hold (column, type) pairs for the columns to add
+    to the table and the columns whose type must grow to hold the incoming
+    values; `incompatible` names the columns whose type can't safely grow,
+    and `missing` the table columns absent from the frame, which are left
+    NULL by the load.
+    """
+
+    def __init__(self):
+        self.added = []
+        self.widened = []
+        self.incompatible = []
+        self.missing = []
+
+    @classmethod
+    def compare(cls, columns, data, dialect, margin=SAFETY_MARGIN, types=None, case_sensitive=False):
+        """Compare catalog `columns` with those of `data`, a DataFrame or Arrow table.
+
+        `types` holds the generic types of the columns of `data`, with which
+        hold only nulls, as returned by `chunked_column_types`; by default
+        they are inferred from `data`.  Names are matched case-insensitively,
+        unless `case_sensitive`.
+        """
+        diff = cls()
+
+        def key(name):
+            return str(name) if case_sensitive else str(name).lower()
+
+        existing = {key(column.name): column for column in columns}
+        names = data.column_names if is_arrow(data) else data.columns
+        wanted_types, only_null_columns = types or (column_types(data, margin, dialect), null_columns(data))
+        for name, wanted, only_nulls in zip(names, wanted_types, only_null_columns):
+            column = existing.pop(key(name), None)
+            if column is None:
+                diff.added.append((name, format_type(*wanted, dialect)))
+                continue
+            current = catalog_type(column)
+            if current is None or only_nulls:
+                # Columns of types we don't know, or only NULLs, are left to the database
+                continue
+            widened = widen_type(current, wanted, dialect)
+            if widened is None:
+                diff.incompatible.append(f"{name} ({column.data_type} from {format_type(*wanted, dialect)})")
+            elif widened != current:
+                diff.widened.append((column.name, format_type(*widened, dialect)))
+        diff.missing = [column.name for column in existing.values()]
+        return diff
+
+    @property
+    def changes(self):
+        return bool(self.added or self.widened or self.incompatible)
+
+    def __str__(self):
+        parts = []
+        if self.added:
+            parts.append(f"new columns {', '.join(str(name) for name, _ in self.added)}")
+        if self.widened:
+            parts.append(f"wider types for {', '.join(f'{name} ({sql_type})' for name, sql_type in self.widened)}")
+        if self.incompatible:
+            parts.append(f"incompatible types for {', '.join(self.incompatible)}")
+        return "; ".join(parts) or "no changes"
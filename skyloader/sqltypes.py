@@ -0,0 +1,324 @@
+"""Infer tight SQL column types from the values of a DataFrame.
+
+Rather than mapping each dtype to one fixed, generous type, the values of
+each column are inspected: the longest string, the range of integers, the
+precision and scale of decimals and whether datetimes carry a time zone.
+Sizes are grown by a safety margin, so that later files with slightly
+longer or larger values still fit.
+"""
+import math
+
+import numpy as np
+import pandas as pd
+
+DIALECTS = ("sqlserver", "postgres")
+
+# Sizes are grown by this fraction over the largest value seen
+SAFETY_MARGIN = 0.25
+
+# Floats with no more decimal places than this are stored as decimals
+MAX_SCALE = 6
+MAX_PRECISION = 38
+
+INT32_MAX = 2**31 - 1
+INT64_MAX = 2**63 - 1
+
+SQLSERVER_TYPES = {
+    "bool": "bit",
+    "int": "int",
+    "bigint": "bigint",
+    "float": "float",
+    "decimal": "decimal({precision},{scale})",
+    "timestamp": "datetime2",
+    "timestamptz": "datetimeoffset",
+    "interval": "time",
+    "varchar": "varchar({length})",
+    "nvarchar": "nvarchar({length})",
+    "text": "nvarchar(max)",
+}
+
+POSTGRES_TYPES = {
+    "bool": "bool",
+    "int": "int4",
+    "bigint": "int8",
+    "float": "float8",
+    "decimal": "numeric({precision},{scale})",
+    "timestamp": "timestamp",
+    "timestamptz": "timestamptz",
+    "interval": "interval",
+    "varchar": "varchar({length})",
+    "nvarchar": "varchar({length})",
+    "text": "text",
+}
+
+# Generic types of the type names found in catalogs, whether introspected
+# (`integer`, `character varying`) or as written in our DDL (`int4`, `varchar`)
+TYPE_ALIASES = {
+    "bit": "bool", "bool": "bool", "boolean": "bool",
+    "tinyint": "int", "smallint": "int", "int": "int", "integer": "int", "int2": "int", "int4": "int",
+    "bigint": "bigint", "int8": "bigint",
+    "float": "float", "real": "float", "float4": "float", "float8": "float", "double precision": "float",
+    "decimal": "decimal", "numeric": "decimal",
+    "datetime2": "timestamp", "datetime": "timestamp", "smalldatetime": "timestamp", "date": "timestamp",
+    "timestamp": "timestamp", "timestamp without time zone": "timestamp",
+    "datetimeoffset": "timestamptz", "timestamptz": "timestamptz", "timestamp with time zone": "timestamptz",
+    "time": "interval", "interval": "interval",
+    "char": "varchar", "character": "varchar", "varchar": "varchar", "character varying": "varchar",
+    "nchar": "nvarchar", "nvarchar": "nvarchar",
+    "text": "text", "ntext": "text",
+}
+
+# Digits needed to the left of the decimal point to hold any value of these types
+INTEGER_DIGITS = {"int": 10, "bigint": 19}
+
+STRING_TYPES = {"varchar", "nvarchar", "text"}
+
+# The longest length each dialect accepts before a LOB type is needed
+MAX_LENGTHS = {
+    "sqlserver": {"varchar": 8000, "nvarchar": 4000},
+    "postgres": {"varchar": 10485760, "nvarchar": 10485760},
+}
+
+
+def with_margin(value, margin):
+    return int(math.ceil(value * (1 + margin)))
+
+
+def integer_type(low, high, margin):
+    largest = with_margin(max(abs(int(low)), abs(int(high))), margin)
+    if largest <= INT32_MAX:
+        return "int", {}
+    if largest <= INT64_MAX:
+        return "bigint", {}
+    return "decimal", {"precision": min(len(str(largest)), MAX_PRECISION), "scale": 0}
+
+
+def float_type(values, margin):
+    finite = values[np.isfinite(values)]
+    if len(finite) < len(values):
+        return "float", {}
+    if not len(finite):
+        return "float", {}
+    if np.all(finite == np.round(finite)) and np.abs(finite).max() <= INT64_MAX:
+        return integer_type(finite.min(), finite.max(), margin)
+    for scale in range(1, MAX_SCALE + 1):
+        if np.all(np.round(finite, scale) == finite):
+            break
+    else:
+        return "float", {}
+    integer_digits = len(str(with_margin(int(np.abs(finite).max()), margin)))
+    precision = integer_digits + scale
+    if precision > MAX_PRECISION:
+        return "float", {}
+    return "decimal", {"precision": precision, "scale": scale}
+
+
+def sized_string_type(longest, is_ascii, dialect, margin):
+    kind = "varchar" if is_ascii else "nvarchar"
+    length = max(with_margin(longest, margin), 1)
+    if length > MAX_LENGTHS[dialect][kind]:
+        return "text", {}
+    return kind, {"length": length}
+
+
+def string_type(series, dialect, margin):
+    values = series.dropna()
+    if not len(values):
+        return "text", {}
+    strings = values.astype(str)
+    return sized_string_type(int(strings.str.len().max()), strings.str.isascii().all(), dialect, margin)
+
+
+def arrow_column_type(array, margin=SAFETY_MARGIN, dialect="sqlserver"):
+    """Return the generic type of a column of an Arrow table and the parameters it needs."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    dtype = array.type
+    if pa.types.is_dictionary(dtype):
+        array = pc.cast(array, dtype.value_type)
+        dtype = dtype.value_type
+    values = pc.drop_null(array)
+    if pa.types.is_boolean(dtype):
+        return "bool", {}
+    if pa.types.is_integer(dtype):
+        if not len(values):
+            return "int", {}
+        bounds = pc.min_max(values)
+        return integer_type(bounds["min"].as_py(), bounds["max"].as_py(), margin)
+    if pa.types.is_floating(dtype):
+        return float_type(values.to_numpy().astype("float64"), margin)
+    if pa.types.is_decimal(dtype):
+        if dtype.precision > MAX_PRECISION:
+            return "float", {}
+        return "decimal", {"precision": dtype.precision, "scale": dtype.scale}
+    if pa.types.is_timestamp(dtype):
+        return ("timestamptz" if dtype.tz else "timestamp"), {}
+    if pa.types.is_date(dtype):
+        return "timestamp", {}
+    if pa.types.is_duration(dtype) or pa.types.is_time(dtype):
+        return "interval", {}
+    if not len(values):
+        return "text", {}
+    if not (pa.types.is_string(dtype) or pa.types.is_large_string(dtype)):
+        values = pc.cast(values, pa.string())
+    longest = pc.max(pc.utf8_length(values)).as_py()
+    return sized_string_type(longest, pc.all(pc.string_is_ascii(values)).as_py(), dialect, margin)
+
+
+def column_type(series, margin=SAFETY_MARGIN, dialect="sqlserver"):
+    """Return the generic type of a column and the parameters it needs."""
+    dtype = series.dtype
+    if pd.api.types.is_bool_dtype(dtype):
+        return "bool", {}
+    if pd.api.types.is_integer_dtype(dtype):
+        values = series.dropna()
+        if not len(values):
+            return "int", {}
+        return integer_type(values.min(), values.max(), margin)
+    if pd.api.types.is_float_dtype(dtype):
+        return float_type(series.dropna().to_numpy(dtype="float64"), margin)
+    if isinstance(dtype, pd.DatetimeTZDtype):
+        return "timestamptz", {}
+    if pd.api.types.is_datetime64_dtype(dtype):
+        return "timestamp", {}
+    if pd.api.types.is_timedelta64_dtype(dtype):
+        return "interval", {}
+    return string_type(series, dialect, margin)
+
+
+def check_dialect(dialect):
+    if dialect not in DIALECTS:
+        raise ValueError(f"Expected dialect to be one of {DIALECTS}; got {dialect} instead")
+
+
+def format_type(kind, params, dialect):
+    check_dialect(dialect)
+    types = SQLSERVER_TYPES if dialect == "sqlserver" else POSTGRES_TYPES
+    return types[kind].format(**params)
+
+
+def infer_sql_type(series, dialect, margin=SAFETY_MARGIN):
+    """Return the tightest `dialect` type holding every value of `series`."""
+    check_dialect(dialect)
+    return format_type(*column_type(series, margin, dialect), dialect)
+
+
+def catalog_type(column):
+    """Return the generic type of a catalog `Column` and its parameters, or None for unknown types."""
+    kind = TYPE_ALIASES.get(column.data_type)
+    if kind in ("varchar", "nvarchar"):
+        if column.max_length is None or column.max_length < 0:
+            return "text", {}
+        return kind, {"length": column.max_length}
+    if kind == "decimal":
+        return kind, {"precision": column.precision or MAX_PRECISION, "scale": column.scale or 0}
+    return (kind, {}) if kind is not None else None
+
+
+def decimal_holding(integer_digits, scale):
+    precision = integer_digits + scale
+    if precision > MAX_PRECISION:
+        return None
+    return "decimal", {"precision": precision, "scale": scale}
+
+
+def widen_type(existing, wanted, dialect):
+    """Return the narrowest type holding the values of both generic types, or None if none can safely.
+
+    `existing` is returned as is when it already holds `wanted` values.
+    Widening only ever grows strings and numbers; any other change of type
+    would need values converted, so has no safe widening.  Integer and
+    decimal columns widen to float for `wanted` floats: `float_type` types
+    whole and short-decimal floats as integers and decimals, so a column
+    first typed from such floats must take later floats of any precision.
+    """
+    kind, params = existing
+    wanted_kind, wanted_params = wanted
+    if kind == "text":
+        return existing
+    if kind in STRING_TYPES:
+        if wanted_kind == "text":
+            return wanted
+        if wanted_kind not in STRING_TYPES:
+            return existing
+        widened = "nvarchar" if "nvarchar" in (kind, wanted_kind) else "varchar"
+        length = max(params["length"], wanted_params["length"])
+        if length > MAX_LENGTHS[dialect][widened]:
+            return "text", {}
+        return widened, {"length": length}
+    if kind == "float":
+        return existing if wanted_kind in ("int", "bigint", "decimal", "float") else None
+    if kind in INTEGER_DIGITS:
+        if wanted_kind in INTEGER_DIGITS:
+            return wanted if INTEGER_DIGITS[wanted_kind] > INTEGER_DIGITS[kind] else existing
+        if wanted_kind == "decimal":
+            digits = max(INTEGER_DIGITS[kind], wanted_params["precision"] - wanted_params["scale"])
+            return decimal_holding(digits, wanted_params["scale"])
+        if wanted_kind == "float":
+            return wanted
+        return None
+    if kind == "decimal":
+        digits, scale = params["precision"] - params["scale"], params["scale"]
+        if wanted_kind in INTEGER_DIGITS:
+            wanted_digits, wanted_scale = INTEGER_DIGITS[wanted_kind], 0
+        elif wanted_kind == "decimal":
+            wanted_digits = wanted_params["precision"] - wanted_params["scale"]
+            wanted_scale = wanted_params["scale"]
+        elif wanted_kind == "float":
+            return wanted
+        else:
+            return None
+        if wanted_digits <= digits and wanted_scale <= scale:
+            return existing
+        return decimal_holding(max(digits, wanted_digits), max(scale, wanted_scale))
+    if kind in ("timestamp", "timestamptz") and wanted_kind in ("timestamp", "timestamptz"):
+        return existing
+    return existing if kind == wanted_kind else None
+
+
+def is_arrow(data):
+    return not isinstance(data, pd.DataFrame) and hasattr(data, "column_names")
+
+
+def column_types(data, margin=SAFETY_MARGIN, dialect="sqlserver"):
+    """Return the generic type and parameters of each column of a DataFrame or Arrow table."""
+    if is_arrow(data):
+        return [arrow_column_type(column, margin, dialect) for column in data.columns]
+    return [column_type(data.iloc[:, i], margin, dialect) for i in range(data.shape[1])]
+
+
+def null_columns(data):
+    """Tell, for each column of a DataFrame or Arrow table, whether it holds only nulls."""
+    if is_arrow(data):
+        return [column.null_count == len(column) for column in data.columns]
+    return [bool(data.iloc[:, i].isna().all()) for i in range(data.shape[1])]
+
+
+def chunked_column_types(chunks, margin=SAFETY_MARGIN, dialect="sqlserver"):
+    """Type the columns of data read in `chunks`, one chunk at a time.
+
+    Returns the generic type and parameters of each column, widened to hold
+    the values of every chunk, and whether each column holds only nulls.
+    Columns of chunks with no type in common are typed as text.
+    """
+    types = nulls = None
+    for chunk in chunks:
+        chunk_types, chunk_nulls = column_types(chunk, margin, dialect), null_columns(chunk)
+        if types is None:
+            types, nulls = chunk_types, chunk_nulls
+            continue
+        for i, (wanted, only_nulls) in enumerate(zip(chunk_types, chunk_nulls)):
+            # Chunks holding only nulls say nothing of a column's type
+            if only_nulls:
+                continue
+            if nulls[i]:
+                types[i], nulls[i] = wanted, False
+                continue
+            types[i] = widen_type(types[i], wanted, dialect) or ("text", {})
+    return types or [], nulls or []
+
+
+def infer_sql_types(df, dialect, margin=SAFETY_MARGIN):
+    check_dialect(dialect)
+    return [format_type(kind, params, dialect) for kind, params in column_types(df, margin, dialect)]
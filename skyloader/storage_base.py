@@ -0,0 +1,92 @@
+import logging
+from abc import abstractmethod
+
+from skyloader.metrics import NULL_METRICS
+
+logger = logging.getLogger(__name__)
+
+# Folders of every backend carry Drive's folder mimetype, which DataFile.is_folder checks
+FOLDER_MIMETYPE = "application/vnd.google-apps.folder"
+
+
+class StorageBase():
+    """Where `LoaderManager` finds files to load, and files them away once processed.
+
+    Backends list a folder's files as `DataFile`s, fetch their contents as
+    binary file objects, move and rename them into the archive and error
+    folders, and store run logs.
+    """
+
+    root = None
+    metrics = NULL_METRICS
+
+    def __init__(self):
+        self.pending_moves = []
+
+    @abstractmethod
+    def list_datafiles(self, folder_id):
+        """Return a `DataFile` for each file and folder in the folder `folder_id`."""
+        pass
+
+    @abstractmethod
+    def download_datafile(self, datafile):
+        """Return the contents of `datafile` as a binary file object, rewound."""
+        pass
+
+    @abstractmethod
+    def move_and_rename_file(self, file_id, new_parent_id, new_name, previous_parents=None):
+        pass
+
+    @abstractmethod
+    def upload_log(self, log_stream, file_name, parent_folder_id):
+        """Store the text of `log_stream` as `file_name` in the folder `parent_folder_id`."""
+        pass
+
+    def ls(self, folder_id=None, download=False, most_recent_only=False):
+        folder_id = folder_id or self.root.identifier
+        datafiles = self.list_datafiles(folder_id)
+        if most_recent_only and datafiles:
+            datafiles = [max(datafiles, key=lambda d: d.modified_at and d.is_file)]
+        datafiles.sort(key=lambda d: d.modified_at)
+        if download:
+            self.download_files(datafiles)
+        return datafiles
+
+    def ls_changed(self, folder_ids, page_token=None):
+        """List the files in any of `folder_ids`, oldest first, with the page token to pass on the next call.
+
+        Backends without a changes feed list every folder in full, and
+        return no page token.
+        """
+        datafiles = [
+            datafile for folder_id in folder_ids
+            for datafile in self.list_datafiles(folder_id) if datafile.is_file
+        ]
+        datafiles.sort(key=lambda d: d.modified_at)
+        return datafiles, None
+
+    def download_files(self, files: list):
+        """Fetch the contents of files, which are only parsed when their `data` is first accessed."""
+        for file in files:
+            if not file.is_folder:
+                file.fh = self.download_datafile(file)
+
+    def queue_move_and_rename(self, datafile, new_parent_id, new_name):
+        """Queue a move and rename of `datafile`, to be sent by `flush_moves`."""
+        self.pending_moves.append((datafile, new_parent_id, new_name))
+
+    def flush_moves(self):
+        """Make all queued moves.
+
+        Returns a mapping of file id to the exception raised for that file's
+        move, or None when it succeeded.
+        """
+        results = {}
+        moves, self.pending_moves = self.pending_moves, []
+        for datafile, new_parent_id, new_name in moves:
+            try:
+                self.move_and_rename_file(datafile.id, new_parent_id, new_name, datafile.parents or None)
+                results[datafile.id] = None
+            except Exception as e:
+                results[datafile.id] = e
+        return results
@@ -0,0 +1,132 @@
+"""Load files dropped in a local (or NFS mounted) directory.
+
+`LocalStorage` lays a directory out like a Drive folder: files waiting to
+be loaded sit in the root, and are renamed into its `archive` and `error`
+subdirectories once processed.  Nothing is copied: parsers read each file
+through a memory map, and moves are atomic renames on the same volume.
+"""
+import io
+import logging
+import mimetypes
+import mmap
+import os
+from datetime import datetime, timezone
+
+from skyloader.datafile import DataFile
+from skyloader.storage_base import FOLDER_MIMETYPE, StorageBase
+
+logger = logging.getLogger(__name__)
+
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+
+
+def timestamp(seconds):
+    """Format a file time like Drive's RFC 3339 timestamps, which `DataFile` parses."""
+    return datetime.fromtimestamp(seconds, tz=timezone.utc).strftime(TIMESTAMP_FORMAT)
+
+
+class MappedFile(io.RawIOBase):
+    """A read-only binary file over a memory map of a local file.
+
+    Reads are served from the page cache without buffering a copy of the
+    file, and `getbuffer` exposes the whole mapping without copying.
+    `path` lets worker processes open the file themselves.
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def read(self, size=-1):
+        return self.map.read(None if size is None or size < 0 else size)
+
+    def readall(self):
+        return self.map.read()
+
+    def readinto(self, buffer):
+        data = self.map.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        self.map.seek(offset, whence)
+        return self.map.tell()
+
+    def tell(self):
+        return self.map.tell()
+
+    def getbuffer(self):
+        return memoryview(self.map)
+
+    def close(self):
+        if getattr(self, "map", None) is not None:
+            self.map.close()
+        super().close()
+
+
+class LocalStorage(StorageBase):
+    """Files in the directory `root_path`, identified by their absolute paths.
+
+    Entries whose names start with a dot are skipped, so feeds can write
+    to a hidden name and rename it into place once complete.
+    """
+
+    def __init__(self, root_path):
+        super().__init__()
+        self.root_path = os.path.abspath(root_path)
+        self.root = DataFile(name="Root", identifier=self.root_path, mimetype=FOLDER_MIMETYPE)
+
+    def datafile(self, entry, folder_id):
+        stat = entry.stat()
+        if entry.is_dir():
+            mimetype = FOLDER_MIMETYPE
+        else:
+            mimetype = mimetypes.guess_type(entry.name)[0] or "application/octet-stream"
+        return DataFile(
+            name=entry.name,
+            identifier=entry.path,
+            mimetype=mimetype,
+            kind="local#file",
+            stat={
+                # Local file systems keep no creation time that is portable; the
+                # inode change time is updated by the rename that delivers a file
+                "created_at": timestamp(stat.st_ctime),
+                "modified_at": timestamp(stat.st_mtime),
+            },
+            parents=[folder_id],
+            size=None if entry.is_dir() else stat.st_size,
+        )
+
+    def list_datafiles(self, folder_id):
+        with os.scandir(folder_id) as entries:
+            return [self.datafile(entry, folder_id) for entry in entries if not entry.name.startswith(".")]
+
+    def download_datafile(self, datafile):
+        try:
+            return MappedFile(datafile.identifier)
+        except ValueError:
+            # Empty files can't be mapped
+            return io.BytesIO()
+
+    def move_and_rename_file(self, file_id, new_parent_id, new_name, previous_parents=None):
+        path = os.path.join(new_parent_id, new_name)
+        if os.path.exists(path):
+            raise FileExistsError(f"Cannot move {file_id} to {path}, which already exists")
+        os.replace(file_id, path)
+        logger.debug(f"Renamed {file_id} to {path}")
+        return {"id": path, "parents": [new_parent_id], "name": new_name}
+
+    def upload_log(self, log_stream, file_name, parent_folder_id):
+        path = os.path.join(parent_folder_id, file_name)
+        tmp_path = os.path.join(parent_folder_id, f".{file_name}.tmp")
+        with open(tmp_path, "w") as f:
+            f.write(log_stream.getvalue())
+        os.replace(tmp_path, path)
@@ -0,0 +1,167 @@
+"""An in-process stand-in for the Google Drive v3 service object.
+
+Only the calls skyloader makes are implemented, with Drive's paging and
+changes-feed semantics, so `Drive` can be exercised without the network.
+"""
+from datetime import datetime, timedelta
+from itertools import count
+
+FOLDER_MIMETYPE = "application/vnd.google-apps.folder"
+EPOCH = datetime(2023, 1, 1)
+
+
+class FakeRequest:
+    def __init__(self, execute):
+        self._execute = execute
+
+    def execute(self):
+        return self._execute()
+
+
+class FakeBatch:
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        self.requests.append((request_id, request, callback or self.callback))
+
+    def execute(self):
+        for request_id, request, callback in self.requests:
+            try:
+                response, exception = request.execute(), None
+            except Exception as e:
+                response, exception = None, e
+            callback(request_id, response, exception)
+
+
+class FakeFiles:
+    def __init__(self, service):
+        self.service = service
+
+    def list(self, q, pageSize=100, pageToken=None, **kwargs):
+        folder_id = q.split("'")[1]
+        offset = int(pageToken or 0)
+
+        def execute():
+            self.service.calls.append("files.list")
+            items = [f for f in self.service.items.values() if folder_id in f["parents"]]
+            page = items[offset:offset + pageSize]
+            results = {"files": [dict(f) for f in page]}
+            if offset + pageSize < len(items):
+                results["nextPageToken"] = str(offset + pageSize)
+            return results
+
+        return FakeRequest(execute)
+
+    def get(self, fileId, **kwargs):
+        def execute():
+            self.service.calls.append("files.get")
+            return dict(self.service.items[fileId])
+
+        return FakeRequest(execute)
+
+    def get_media(self, fileId, **kwargs):
+        self.service.calls.append("files.get_media")
+        return FakeRequest(lambda: self.service.contents[fileId])
+
+    def export_media(self, fileId, mimeType, **kwargs):
+        self.service.calls.append(f"files.export_media:{mimeType}")
+        return FakeRequest(lambda: self.service.contents[fileId])
+
+    def update(self, fileId, body=None, addParents=None, removeParents=None, **kwargs):
+        def execute():
+            self.service.calls.append("files.update")
+            if fileId in self.service.fail_ids:
+                raise PermissionError(f"Cannot update {fileId}")
+            changes = dict(body or {})
+            if addParents or removeParents:
+                parents = [
+                    p for p in self.service.items[fileId]["parents"]
+                    if p not in (removeParents or "").split(",")
+                ]
+                changes["parents"] = parents + (addParents or "").split(",")
+            return dict(self.service.update_file(fileId, **changes))
+
+        return FakeRequest(execute)
+
+
+class FakeChanges:
+    def __init__(self, service):
+        self.service = service
+
+    def getStartPageToken(self, **kwargs):
+        return FakeRequest(lambda: {"startPageToken": str(len(self.service.change_log))})
+
+    def list(self, pageToken, pageSize=100, **kwargs):
+        offset = int(pageToken)
+
+        def execute():
+            self.service.calls.append("changes.list")
+            page = self.service.change_log[offset:offset + pageSize]
+            changes = [
+                {"fileId": file_id, "removed": file_id not in self.service.items,
+                 "file": dict(self.service.items[file_id]) if file_id in self.service.items else None}
+                for file_id in page
+            ]
+            results = {"changes": changes}
+            if offset + pageSize < len(self.service.change_log):
+                results["nextPageToken"] = str(offset + pageSize)
+            else:
+                results["newStartPageToken"] = str(len(self.service.change_log))
+            return results
+
+        return FakeRequest(execute)
+
+
+class FakeDriveService:
+    def __init__(self):
+        self.items = {}
+        self.contents = {}
+        self.change_log = []
+        self.calls = []
+        self.fail_ids = set()
+        self._ids = count(1)
+        self._clock = count(1)
+
+    def _timestamp(self):
+        moment = EPOCH + timedelta(seconds=next(self._clock))
+        return moment.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+    def add_file(self, name, parent_id, mimetype="application/vnd.ms-excel", **extra):
+        file_id = f"file{next(self._ids)}"
+        timestamp = self._timestamp()
+        self.items[file_id] = {
+            "id": file_id,
+            "name": name,
+            "kind": "drive#file",
+            "mimeType": mimetype,
+            "createdTime": timestamp,
+            "modifiedTime": timestamp,
+            "parents": [parent_id],
+            **extra,
+        }
+        self.change_log.append(file_id)
+        return self.items[file_id]
+
+    def add_folder(self, name, parent_id):
+        return self.add_file(name, parent_id, mimetype=FOLDER_MIMETYPE)
+
+    def update_file(self, file_id, **changes):
+        self.items[file_id].update(changes, modifiedTime=self._timestamp())
+        self.change_log.append(file_id)
+        return self.items[file_id]
+
+    def delete_file(self, file_id):
+        del self.items[file_id]
+        self.change_log.append(file_id)
+
+    def files(self):
+        return FakeFiles(self)
+
+    def changes(self):
+        return FakeChanges(self)
+
+    def new_batch_http_request(self, callback=None):
+        self.calls.append("batch")
+        return FakeBatch(callback)
@@ -0,0 +1,72 @@
+"""An in-process stand-in for a pyodbc connection to SQL Server.
+
+Statements are recorded rather than run.  Queries return the rows given for
+the first fragment of SQL they contain in `responses`, and statements
+containing a fragment in `failures` raise the exception given for it, so
+`SqlLoader` can be exercised without a server.
+"""
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.fast_executemany = False
+        self.rows = []
+        self.rowcount = -1
+
+    def execute(self, sql, *params):
+        self.rows = self.connection.run(sql, params)
+        self.rowcount = len(self.rows)
+        return self
+
+    def executemany(self, sql, rows):
+        self.connection.run(sql, list(rows))
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return list(self.rows)
+
+    def commit(self):
+        self.connection.commit()
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, responses=None, failures=None):
+        self.responses = responses or {}
+        self.failures = failures or {}
+        self.statements = []
+        self.autocommit = True
+
+    def run(self, sql, params):
+        self.statements.append((" ".join(sql.split()), params))
+        for fragment, error in self.failures.items():
+            if fragment in sql:
+                raise error
+        for fragment, rows in self.responses.items():
+            if fragment in sql:
+                return rows(params) if callable(rows) else list(rows)
+        return []
+
+    def sql(self):
+        """The statements run, with COMMIT and ROLLBACK marking the ends of transactions."""
+        return [sql for sql, _ in self.statements]
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def execute(self, sql, *params):
+        return self.cursor().execute(sql, *params)
+
+    def commit(self):
+        self.statements.append(("COMMIT", ()))
+
+    def rollback(self):
+        self.statements.append(("ROLLBACK", ()))
+
+    def close(self):
+        pass
@@ -0,0 +1,126 @@
+import hashlib
+import os
+
+import pandas as pd
+from pytest import fixture, importorskip
+
+pa = importorskip("pyarrow")
+
+from skyloader.cache import ParseCache
+from skyloader.datafile import DataFile
+from skyloader.loader_manager import LoaderManager
+from skyloader.readers import ReadOptions
+from skyloader.storage_local import LocalStorage
+
+
+@fixture
+def cache(tmp_path):
+    return ParseCache(tmp_path / "cache")
+
+
+def parsed(name="feed.csv", md5="0" * 32, rows=3, **options):
+    datafile = DataFile(name=name, identifier=name, mimetype="text/csv", md5=md5)
+    datafile.read_options = ReadOptions(**options)
+    datafile.data = pd.DataFrame({"id": range(rows), "amount": [0.5] * rows})
+    return datafile
+
+
+def test_round_trip(cache):
+    datafile = parsed()
+    cache.put(datafile)
+    assert cache.get(datafile).equals(datafile.data)
+    assert cache.original_name(datafile) == "feed.csv"
+    arrow = parsed(arrow=True)
+    assert isinstance(cache.get(arrow), pa.Table)
+    assert cache.get(parsed(sheet_name="other")) is None
+    assert cache.get(parsed(md5=None)) is None
+
+
+def test_write_failures_are_not_fatal(cache, monkeypatch):
+    import pyarrow.parquet as pq
+
+    def write_table(table, path, **kwargs):
+        with open(path, "wb") as f:
+            f.write(b"PAR1")
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(pq, "write_table", write_table)
+    datafile = parsed()
+    cache.put(datafile)
+    assert cache.get(datafile) is None
+    assert os.listdir(cache.path) == []
+
+
+def test_evicts_least_recently_used(cache):
+    datafiles = [parsed(md5=str(i) * 32) for i in range(3)]
+    for i, datafile in enumerate(datafiles):
+        cache.put(datafile)
+        os.utime(cache.entry_path(datafile), (i, i))
+    cache.get(datafiles[0])
+    size = os.path.getsize(cache.entry_path(datafiles[0]))
+    cache.max_bytes = 2 * size
+    cache.evict()
+    assert cache.get(datafiles[1]) is None
+    assert cache.get(datafiles[0]) is not None
+    assert cache.get(datafiles[2]) is not None
+
+
+class ChecksummedStorage(LocalStorage):
+    def __init__(self, root_path):
+        super().__init__(root_path)
+        self.downloads = 0
+
+    def list_datafiles(self, folder_id):
+        datafiles = super().list_datafiles(folder_id)
+        for datafile in datafiles:
+            if datafile.is_file:
+                with open(datafile.identifier, "rb") as f:
+                    datafile.md5 = hashlib.md5(f.read()).hexdigest()
+        return datafiles
+
+    def download_datafile(self, datafile):
+        self.downloads += 1
+        return super().download_datafile(datafile)
+
+
+class FlakyLoader:
+    def __init__(self, fail):
+        self.fail = fail
+        self.loaded = {}
+
+    def load_datafile(self, datafile, **kwargs):
+        if self.fail:
+            raise RuntimeError("database unavailable")
+        self.loaded[datafile.tablename] = len(datafile.data)
+
+
+def test_replay_errors_from_cache(tmp_path, cache):
+    root = tmp_path / "inbox"
+    for folder in ("archive", "error"):
+        (root / folder).mkdir(parents=True)
+    pd.DataFrame({"id": [1, 2, 3]}).to_csv(root / "feed.csv", index=False)
+    storage = ChecksummedStorage(root)
+
+    with LoaderManager(storage, FlakyLoader(fail=True), parse_workers=0, run_id="r1", cache=cache) as manager:
+        manager.process_files()
+    assert os.listdir(root / "error") == ["feed-r1.csv"]
+
+    loader = FlakyLoader(fail=False)
+    with LoaderManager(storage, loader, parse_workers=0, run_id="r2", cache=cache) as manager:
+        manager.replay_errors()
+    assert loader.loaded == {"feed": 3}
+    assert storage.downloads == 1
+    assert os.listdir(root / "archive") == ["feed-r2.csv"]
+
+
+def test_replay_leaves_uncached_files_in_error_folder(tmp_path, cache):
+    root = tmp_path / "inbox"
+    for folder in ("archive", "error"):
+        (root / folder).mkdir(parents=True)
+    pd.DataFrame({"id": [1]}).to_csv(root / "error" / "feed-r1.csv", index=False)
+    loader = FlakyLoader(fail=False)
+    with LoaderManager(ChecksummedStorage(root), loader, parse_workers=0, run_id="r2", cache=cache) as manager:
+        manager.replay_errors()
+    assert loader.loaded == {}
+    assert os.listdir(root / "error") == ["feed-r1.csv"]
+    assert os.listdir(root / "archive") == []
@@ -0,0 +1,62 @@
+from skyloader.catalog import Catalog, Column
+from skyloader.test.fake_odbc import FakeConnection
+
+
+def test_catalog_from_introspection_rows():
+    catalog = Catalog.from_rows(
+        [
+            ("dbo", "Sales", "Region", "nvarchar", 50, None, None, "YES"),
+            ("dbo", "Sales", "Amount", "decimal", None, 10, 2, "NO"),
+            ("empty_schema", None, None, None, None, None, None, None),
+        ]
+    )
+    assert catalog.has_schema("DBO")
+    assert catalog.has_schema("empty_schema")
+    assert catalog.has_table("dbo", "sales")
+    assert not catalog.has_table("empty_schema", "sales")
+    assert [c.name for c in catalog.columns("dbo", "sales")] == ["Region", "Amount"]
+    assert [c.nullable for c in catalog.columns("dbo", "sales")] == [True, False]
+    assert catalog.columns("dbo", "missing") is None
+
+
+def test_case_sensitive_catalog():
+    catalog = Catalog.from_rows(
+        [
+            ("public", "sales", "id", "integer", None, 32, 0, "YES"),
+            ("public", "Sales", "ID", "integer", None, 32, 0, "YES"),
+        ],
+        case_sensitive=True,
+    )
+    assert not catalog.has_schema("PUBLIC")
+    assert [c.name for c in catalog.columns("public", "sales")] == ["id"]
+    assert [c.name for c in catalog.columns("public", "Sales")] == ["ID"]
+    assert catalog.columns("public", "SALES") is None
+
+
+def test_catalog_tracks_created_objects():
+    catalog = Catalog()
+    catalog.add_table("reports", "sales", [Column.from_sql_type("id", "bigint")])
+    catalog.add_columns("reports", "sales", [Column.from_sql_type("note", "nvarchar(max)")])
+    assert catalog.has_schema("reports")
+    assert [c.name for c in catalog.columns("reports", "sales")] == ["id", "note"]
+
+
+def test_column_from_sql_type():
+    assert Column.from_sql_type("a", "nvarchar(max)") == Column("a", "nvarchar", max_length=-1)
+    assert Column.from_sql_type("a", "varchar(20)") == Column("a", "varchar", max_length=20)
+    assert Column.from_sql_type("a", "decimal(10, 2)") == Column("a", "decimal", precision=10, scale=2)
+    assert Column.from_sql_type("a", "double precision") == Column("a", "double precision")
+
+
+def test_catalog_loads_only_the_target_schema():
+    connection = FakeConnection(responses={
+        "INFORMATION_SCHEMA.SCHEMATA": [("Reports", "sales", "id", "int", None, 10, 0, "NO")],
+    })
+    catalog = Catalog.load(connection, "reports")
+    [(sql, params)] = connection.statements
+    assert "WHERE s.SCHEMA_NAME = ?" in sql
+    assert params == (("reports",),)
+    assert catalog.schemas == {"reports"}
+    assert catalog.has_table("reports", "sales")
+    Catalog.load(connection, "reports", placeholder="%s")
+    assert "= %s" in connection.statements[-1][0]
@@ -1,5 +1,7 @@
+import io
+
 from skyloader.datafile import DataFile
-from pytest import fixture
+from pytest import fixture, importorskip
 
 import pandas as pd
 
@@ -51,3 +53,74 @@ def test_processed_total(mock_datafile):
     assert mock_datafile.processed == 4
 
 
+def test_batches_convert_nulls(mock_datafile):
+    mock_datafile.data = pd.DataFrame(
+      {
+        "a": [1, 2, 3],
+        "b": [1.5, float("nan"), 3.5],
+        "c": ["x", None, "z"],
+        "d": pd.to_datetime(["2023-01-01", None, "2023-01-03"]),
+      }
+    )
+    batches = list(mock_datafile.batches(batch_size=2))
+    assert [len(batch) for batch in batches] == [2, 1]
+    assert batches[0][1] == (2, None, None, None)
+    assert type(batches[0][0][0]) is int
+    assert mock_datafile.processed == 3
+
+
+def test_column_batches_resume_from_offset(mock_datafile):
+    mock_datafile.data = pd.DataFrame({"a": range(5)})
+    columns = list(mock_datafile.column_batches(batch_size=2, start=3))
+    assert columns == [[[3, 4]]]
+    assert mock_datafile.processed == 2
+
+
+def test_data_is_read_lazily_and_released(mock_datafile, monkeypatch):
+    reads = []
+    frame = pd.DataFrame({"a": [1, 2]})
+    monkeypatch.setattr(mock_datafile, "read", lambda: reads.append(1) or frame)
+    mock_datafile.fh = io.BytesIO(b"contents")
+    assert not reads
+    assert mock_datafile.data is frame
+    assert mock_datafile.data is frame
+    assert len(reads) == 1
+    fh = mock_datafile.fh
+    mock_datafile.release()
+    assert fh.closed
+    assert mock_datafile.fh is None
+    assert mock_datafile.data is None
+
+
+def test_arrow_data(mock_datafile):
+    pa = importorskip("pyarrow")
+    mock_datafile.data = pa.table({"a": [1, None, 3], "b": ["x", "y", None]})
+    mock_datafile.add_column("run_id", "run")
+    assert mock_datafile.is_arrow
+    assert mock_datafile.columns == ["a", "b", "run_id"]
+    batches = list(mock_datafile.batches(batch_size=2))
+    assert batches == [[(1, "x", "run"), (None, "y", "run")], [(3, None, "run")]]
+    assert mock_datafile.processed == 3
+
+
+def test_streamed_chunks_get_added_columns():
+    openpyxl = importorskip("openpyxl")
+    from skyloader.readers import ReadOptions
+
+    workbook = openpyxl.Workbook()
+    workbook.active.append(["id"])
+    for i in range(5):
+        workbook.active.append([i])
+    fh = io.BytesIO()
+    workbook.save(fh)
+    datafile = DataFile(name="feed.xlsx", identifier="feed.xlsx")
+    datafile.read_options = ReadOptions(engine="openpyxl", chunk_size=2)
+    datafile.fh = fh
+    datafile.stream()
+    assert datafile.data["id"].tolist() == [0, 1]
+    datafile.add_column("run_id", "r1")
+    chunks = [chunk.copy() for chunk in datafile.chunks()]
+    assert [chunk["id"].tolist() for chunk in chunks] == [[0, 1], [2, 3], [4]]
+    assert all(chunk["run_id"].eq("r1").all() for chunk in chunks)
+    assert sum(len(batch) for _ in datafile.chunks() for batch in datafile.batches(batch_size=1)) == 5
+    assert datafile.processed == 5
@@ -0,0 +1,90 @@
+import hashlib
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from pytest import fixture, raises
+
+from skyloader.datafile import DataFile
+from skyloader.download import ChecksumMismatch, DownloadError, RangedDownloader
+from skyloader.drive import Drive
+from skyloader.test.fake_drive import FakeDriveService
+
+CONTENT = os.urandom(100_000)
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """Serves `CONTENT` with Range support, sending only half of the first response for each range in `server.flaky`."""
+
+    def do_GET(self):
+        start, end = (int(n) for n in self.headers["Range"].removeprefix("bytes=").split("-"))
+        self.server.requested.append((start, end))
+        body = CONTENT[start:end + 1]
+        if start in self.server.flaky:
+            self.server.flaky.discard(start)
+            body = body[:len(body) // 2]
+        self.send_response(206)
+        self.send_header("Content-Range", f"bytes {start}-{end}/{len(CONTENT)}")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+    server.requested = []
+    server.flaky = set()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@fixture
+def url(server):
+    return f"http://127.0.0.1:{server.server_port}/file"
+
+
+def test_download_assembles_ranges(server, url):
+    downloader = RangedDownloader(chunk_size=16_384, workers=4)
+    fh = downloader.download(url, len(CONTENT), md5=hashlib.md5(CONTENT).hexdigest())
+    assert fh.read() == CONTENT
+    assert sorted(server.requested) == downloader.ranges(len(CONTENT))
+    assert len(server.requested) == 7
+
+
+def test_download_resumes_failed_range(server, url):
+    server.flaky.add(16_384)
+    downloader = RangedDownloader(chunk_size=16_384, workers=4, backoff=0)
+    fh = downloader.download(url, len(CONTENT), md5=hashlib.md5(CONTENT).hexdigest())
+    assert fh.read() == CONTENT
+    assert downloader.retried == 1
+    assert (16_384 + 8_192, 32_767) in server.requested
+
+
+def test_download_gives_up_after_retries(server, url):
+    downloader = RangedDownloader(chunk_size=len(CONTENT), retries=0)
+    server.flaky.add(0)
+    with raises(DownloadError):
+        downloader.download(url, len(CONTENT))
+
+
+def test_download_checks_md5(url):
+    downloader = RangedDownloader(chunk_size=32_768)
+    with raises(ChecksumMismatch):
+        downloader.download(url, len(CONTENT), md5=hashlib.md5(b"other").hexdigest())
+
+
+def test_drive_downloads_large_files_as_ranges(server, url):
+    service = FakeDriveService()
+    item = service.add_file("large.csv", "root", size=str(len(CONTENT)), md5Checksum=hashlib.md5(CONTENT).hexdigest())
+    drive = Drive("root", service=service, range_threshold=50_000, downloader=RangedDownloader(chunk_size=32_768))
+    drive.media_url = f"{url}?id={{file_id}}"
+    fh = drive.download_datafile(DataFile.from_gdrive(item))
+    assert fh.read() == CONTENT
+    assert "files.get_media" not in service.calls
@@ -0,0 +1,103 @@
+from pytest import fixture, raises
+
+from skyloader.datafile import DataFile
+from skyloader.drive import (
+    CSV_MIMETYPE,
+    SPREADSHEET_MIMETYPE,
+    XLSX_MIMETYPE,
+    Drive,
+    PageTokenStore,
+)
+from skyloader.readers import ReadOptions
+from skyloader.test.fake_drive import FakeDriveService
+
+
+@fixture
+def service():
+    return FakeDriveService()
+
+
+@fixture
+def drive(service):
+    return Drive("root", service=service, page_size=2)
+
+
+def test_ls_follows_every_page(drive, service):
+    for i in range(5):
+        service.add_file(f"report-{i}.xlsx", "root")
+    service.add_file("elsewhere.xlsx", "other")
+    datafiles = drive.ls()
+    assert [d.name for d in datafiles] == [f"report-{i}.xlsx" for i in range(5)]
+    assert service.calls.count("files.list") == 3
+
+
+def test_ls_changed_lists_only_changes_in_folders(drive, service):
+    first = service.add_file("first.xlsx", "inbox")
+    datafiles, token = drive.ls_changed(["inbox"])
+    assert [d.name for d in datafiles] == ["first.xlsx"]
+
+    added = service.add_file("added.xlsx", "inbox")
+    service.add_file("unrelated.xlsx", "other")
+    moved = service.add_file("moved.xlsx", "inbox")
+    service.update_file(moved["id"], parents=["archive"])
+    deleted = service.add_file("deleted.xlsx", "inbox")
+    service.delete_file(deleted["id"])
+    service.update_file(first["id"], name="first-v2.xlsx")
+
+    datafiles, token = drive.ls_changed(["inbox"], token)
+    assert [d.name for d in datafiles] == ["added.xlsx", "first-v2.xlsx"]
+    assert [d.id for d in datafiles] == [added["id"], first["id"]]
+
+    datafiles, _ = drive.ls_changed(["inbox"], token)
+    assert datafiles == []
+
+
+def test_page_token_store_round_trip(tmp_path):
+    store = PageTokenStore(tmp_path / "token.json")
+    assert store.load() is None
+    store.save("42")
+    assert store.load() == "42"
+
+
+def test_flush_moves_reports_each_file(drive, service):
+    datafiles = [
+        DataFile.from_gdrive(service.add_file(f"report-{i}.xlsx", "inbox"))
+        for i in range(3)
+    ]
+    service.fail_ids.add(datafiles[1].id)
+    for datafile in datafiles:
+        drive.queue_move_and_rename(datafile, "archive", f"archived-{datafile.name}")
+    results = drive.flush_moves()
+    assert results[datafiles[0].id] is None
+    assert isinstance(results[datafiles[1].id], PermissionError)
+    assert service.items[datafiles[2].id]["parents"] == ["archive"]
+    assert "files.get" not in service.calls
+
+
+def test_native_sheets_are_exported_in_the_format_they_are_read_in(drive, service, monkeypatch):
+    downloads = []
+    monkeypatch.setattr(
+        drive, "download_file", lambda file_id, export_mimetype=None: downloads.append((file_id, export_mimetype))
+    )
+    sheet = DataFile.from_gdrive(service.add_file("budget", "inbox", mimetype=SPREADSHEET_MIMETYPE))
+    workbook = DataFile.from_gdrive(service.add_file("budget.xlsx", "inbox", mimetype=XLSX_MIMETYPE))
+    drive.download_datafile(sheet)
+    drive.download_datafile(workbook)
+    assert sheet.content_type == CSV_MIMETYPE
+    assert workbook.content_type == XLSX_MIMETYPE
+
+    sheet.read_options = ReadOptions(sheet_name="Totals")
+    drive.download_datafile(sheet)
+    assert sheet.content_type == XLSX_MIMETYPE
+    assert downloads == [(sheet.id, CSV_MIMETYPE), (workbook.id, None), (sheet.id, XLSX_MIMETYPE)]
+
+    document = DataFile.from_gdrive(service.add_file("notes", "inbox", mimetype="application/vnd.google-apps.document"))
+    with raises(ValueError):
+        drive.download_datafile(document)
+
+
+def test_media_request_exports_native_documents(drive, service):
+    service.contents["file1"] = b"a,b\n"
+    assert drive.media_request("file1", CSV_MIMETYPE).execute() == b"a,b\n"
+    drive.media_request("file1").execute()
+    assert service.calls == [f"files.export_media:{CSV_MIMETYPE}", "files.get_media"]
@@ -0,0 +1,40 @@
+import subprocess
+import sys
+
+from pytest import raises
+
+import skyloader
+
+
+def imported_after(code):
+    """Return the top-level packages a fresh interpreter has imported after running `code`."""
+    result = subprocess.run(
+        [sys.executable, "-c", f"{code}\nimport sys\nprint(' '.join(sys.modules))"],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return {name.split(".")[0] for name in result.stdout.split()}
+
+
+def test_import_defers_heavy_dependencies():
+    imported = imported_after("import skyloader")
+    assert not imported & {"pandas", "numpy", "googleapiclient", "psycopg", "pyodbc", "requests"}
+
+
+def test_drive_defers_google_client():
+    imported = imported_after("import skyloader.drive")
+    assert "googleapiclient" not in imported
+
+
+def test_missing_optional_dependency_names_its_extra():
+    code = "import sys; sys.modules['psycopg'] = None; import skyloader; skyloader.loader_postgres"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    assert "skyloader.loader_postgres requires psycopg; install skyloader[postgres]" in result.stderr
+
+
+def test_submodules_load_on_access():
+    assert skyloader.mode.Mode.APPEND.value == "append"
+    assert "loader_sql_server" in dir(skyloader)
+    with raises(AttributeError):
+        skyloader.not_a_module
@@ -0,0 +1,55 @@
+from pytest import fixture
+
+from skyloader.datafile import DataFile
+from skyloader.ledger import LoadLedger
+
+
+@fixture
+def ledger(tmp_path):
+    ledger = LoadLedger(str(tmp_path / "ledger.db"))
+    yield ledger
+    ledger.close()
+
+
+def make_datafile(md5, run_id="run1", processed=10):
+    datafile = DataFile(name=f"{md5}.xlsx", identifier=f"id-{md5}", md5=md5, size=100, run_id=run_id)
+    datafile.processed = processed
+    return datafile
+
+
+def test_ledger_is_keyed_on_content_and_table(ledger):
+    datafile = make_datafile("abc")
+    assert not ledger.contains(datafile, "sales")
+    ledger.record(datafile, "sales")
+    assert ledger.contains(datafile, "sales")
+    assert ledger.contains(DataFile(name="copy.xlsx", md5="abc", size=100), "sales")
+    assert not ledger.contains(DataFile(name="copy.xlsx", md5="abc", size=101), "sales")
+    assert not ledger.contains(datafile, "returns")
+
+
+def test_files_without_checksum_are_never_skipped(ledger):
+    datafile = DataFile(name="native-sheet")
+    ledger.record(datafile, "sales")
+    assert not ledger.contains(datafile, "sales")
+    assert ledger.entries() == []
+
+
+class CountingLoader:
+    def __init__(self, counts):
+        self.counts = counts
+
+    def row_counts_by_run(self, tablename):
+        return self.counts.get(tablename, {})
+
+
+def test_reconcile_drops_runs_missing_from_target(ledger):
+    ledger.record(make_datafile("a", run_id="run1"), "sales")
+    ledger.record(make_datafile("b", run_id="run1"), "sales")
+    ledger.record(make_datafile("c", run_id="run2"), "sales")
+    ledger.record(make_datafile("d", run_id="run1"), "returns")
+    loader = CountingLoader({"sales": {"run1": 20, "run2": 3}})
+
+    dropped = ledger.reconcile(loader)
+
+    assert sorted((e["target_table"], e["md5"]) for e in dropped) == [("returns", "d"), ("sales", "c")]
+    assert sorted(e["md5"] for e in ledger.entries()) == ["a", "b"]
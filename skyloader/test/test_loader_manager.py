@@ -0,0 +1,158 @@
+import io
+import os
+import threading
+import time
+
+import pandas as pd
+from pytest import fixture
+
+from skyloader.datafile import DataFile
+from skyloader.drive import Drive, PageTokenStore
+from skyloader.ledger import LoadLedger
+from skyloader.loader_manager import LoaderManager
+from skyloader.storage_local import LocalStorage
+from skyloader.test.fake_drive import FakeDriveService
+
+
+class RecordingLoader:
+    def __init__(self):
+        self.loaded = []
+        self.rows = {}
+        self.streamed = []
+
+    def load_datafile(self, datafile, **kwargs):
+        self.loaded.append(datafile.name)
+        self.streamed.append(datafile.streamed)
+        if datafile.data is not None:
+            self.rows[datafile.name] = [i for chunk in datafile.chunks() for i in chunk["id"].tolist()]
+
+
+class SlowStorage(LocalStorage):
+    """Local files whose downloads take longer the earlier the file, counting those not yet loaded."""
+
+    def __init__(self, root_path):
+        super().__init__(root_path)
+        self.lock = threading.Lock()
+        self.fetched = 0
+        self.most_pending = 0
+
+    def download_datafile(self, datafile):
+        time.sleep(0.02 * (5 - int(datafile.stem[-1])))
+        with self.lock:
+            self.fetched += 1
+        return super().download_datafile(datafile)
+
+
+class PendingLoader(RecordingLoader):
+    def __init__(self, storage):
+        super().__init__()
+        self.storage = storage
+
+    def load_datafile(self, datafile, **kwargs):
+        with self.storage.lock:
+            pending = self.storage.fetched - len(self.loaded)
+            self.storage.most_pending = max(self.storage.most_pending, pending)
+        super().load_datafile(datafile, **kwargs)
+
+
+@fixture
+def service():
+    return FakeDriveService()
+
+
+@fixture
+def root(tmp_path):
+    for folder in ("archive", "error"):
+        (tmp_path / folder).mkdir()
+    for i in range(6):
+        path = tmp_path / f"feed-{i}.csv"
+        pd.DataFrame({"id": [i, i]}).to_csv(path, index=False)
+        os.utime(path, (1000 + i, 1000 + i))
+    return tmp_path
+
+
+def test_files_are_loaded_in_order_with_bounded_pending(root):
+    storage = SlowStorage(root)
+    loader = PendingLoader(storage)
+    with LoaderManager(storage, loader, download_workers=4, parse_workers=0, max_pending=2, run_id="r1") as manager:
+        manager.process_files()
+    assert loader.loaded == [f"feed-{i}.csv" for i in range(6)]
+    assert storage.most_pending <= 2
+    assert sorted(os.listdir(root / "archive")) == [f"feed-{i}-r1.csv" for i in range(6)]
+
+
+def test_parse_workers(root, service):
+    loader = RecordingLoader()
+    with LoaderManager(LocalStorage(root), loader, parse_workers=2, run_id="r1") as manager:
+        manager.process_files()
+    assert loader.rows == {f"feed-{i}.csv": [i, i] for i in range(6)}
+    assert not any(loader.streamed)
+
+    # Downloads without a path are sent to the workers as bytes, or parsed
+    # in the downloading thread once larger than parse_max_bytes
+    small = service.add_file("small.csv", "root", mimetype="text/csv")
+    large = service.add_file("large.csv", "root", mimetype="text/csv")
+    service.contents[small["id"]] = b"id\n1\n"
+    service.contents[large["id"]] = b"id\n" + b"2\n" * 100
+    drive = Drive("root", service=service)
+    drive.download_file = lambda file_id, export_mimetype=None: io.BytesIO(service.contents[file_id])
+    loader = RecordingLoader()
+    with LoaderManager(drive, loader, parse_workers=1, parse_max_bytes=64, run_id="r1") as manager:
+        manager.process_files()
+    assert loader.rows == {"small.csv": [1], "large.csv": [2] * 100}
+
+
+def test_already_loaded_files_are_archived_with_batched_moves(tmp_path, service):
+    archive = service.add_folder("archive", "root")
+    ledger = LoadLedger(str(tmp_path / "ledger.db"))
+    page_tokens = PageTokenStore(tmp_path / "token.json")
+    drive = Drive("root", service=service)
+    loader = RecordingLoader()
+
+    def run(run_id):
+        with LoaderManager(
+            drive, loader, batch_moves=True, page_tokens=page_tokens, ledger=ledger, run_id=run_id, parse_workers=0
+        ) as manager:
+            manager.process_files()
+        return manager
+
+    run("r1")
+    first_token = page_tokens.load()
+
+    # Only the re-uploaded copy of a loaded file has changed since the last run
+    item = service.add_file("feed.csv", "root", mimetype="text/csv", md5Checksum="0" * 32, size="4")
+    loaded = DataFile.from_gdrive(dict(item))
+    ledger.record(loaded, loaded.tablename)
+    manager = run("r2")
+
+    assert loader.loaded == []
+    assert service.items[item["id"]]["parents"] == [archive["id"]]
+    assert drive.pending_moves == [] and manager.moves == {}
+    assert page_tokens.load() != first_token
+
+
+def test_large_files_are_streamed(root):
+    loader = RecordingLoader()
+    with LoaderManager(LocalStorage(root), loader, parse_workers=2, stream_min_bytes=0, run_id="r1") as manager:
+        manager.process_files()
+    assert loader.rows == {f"feed-{i}.csv": [i, i] for i in range(6)}
+    assert all(loader.streamed)
+
+
+def test_catalog_is_reloaded_each_run(root):
+    class CatalogLoader(RecordingLoader):
+        catalog = None
+
+        def load_datafile(self, datafile, **kwargs):
+            self.seen.append(self.catalog)
+            self.catalog = datafile.name
+
+    loader = CatalogLoader()
+    loader.seen = []
+    for run_id in ("r1", "r2"):
+        (root / f"{run_id}.csv").write_text("id\n1\n")
+        with LoaderManager(LocalStorage(root), loader, parse_workers=0, run_id=run_id) as manager:
+            manager.process_files()
+    # Each run starts from a fresh catalog, then keeps the one its first load read
+    assert loader.seen.count(None) == 2
+    assert len(loader.seen) == 8
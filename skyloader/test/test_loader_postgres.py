@@ -0,0 +1,261 @@
+import os
+from decimal import Decimal
+
+import pandas as pd
+from pytest import fixture, importorskip, raises, skip
+
+psycopg = importorskip("psycopg")
+
+from skyloader.catalog import Catalog, Column
+from skyloader.datafile import DataFile
+from skyloader.loader_postgres import PostgresLoader
+from skyloader.mode import Mode
+
+SCHEMA = "skyloader_test"
+
+
+class DsnLoader(PostgresLoader):
+    def __init__(self, dsn, **kwargs):
+        super().__init__(server=None, database=None, schemaname=SCHEMA, **kwargs)
+        self.dsn = dsn
+
+    @property
+    def connection_string(self):
+        return self.dsn
+
+
+@fixture
+def loader():
+    """A loader connected to the database at $SKYLOADER_TEST_POSTGRES, in a schema of its own."""
+    dsn = os.environ.get("SKYLOADER_TEST_POSTGRES")
+    if not dsn:
+        skip("set SKYLOADER_TEST_POSTGRES to the DSN of a scratch database to run these tests")
+    loader = DsnLoader(dsn)
+    loader.connect()
+    loader.connection.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    loader.connection.execute(f"CREATE SCHEMA {SCHEMA}")
+    yield loader
+    loader.connection.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    loader.close_connection()
+
+
+def datafile(name, data):
+    datafile = DataFile(name=f"{name}.csv", identifier=name, mimetype="text/csv")
+    datafile.data = data
+    return datafile
+
+
+def query(loader, sql, *params):
+    return loader.connection.execute(sql, params).fetchall()
+
+
+class FakeCopy:
+    """Records what is written to a COPY, as psycopg's `Copy` would send it."""
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.types = None
+        self.rows = []
+        self.data = b""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set_types(self, types):
+        self.types = types
+
+    def write_row(self, row):
+        self.rows.append(row)
+
+    def write(self, data):
+        self.data += bytes(data)
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def copy(self, sql):
+        copy = FakeCopy(sql)
+        self.connection.copies.append(copy)
+        return copy
+
+
+class FakeConnection:
+    def __init__(self):
+        self.copies = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def close(self):
+        pass
+
+
+def copy_loader(**kwargs):
+    loader = PostgresLoader(server=None, database=None, schemaname=SCHEMA, batch_size=2, **kwargs)
+    loader.connection = FakeConnection()
+    loader.catalog = Catalog()
+    loader.catalog.add_table(SCHEMA, "sales", [Column("id", "integer"), Column("amount", "numeric"), Column("note", "text")])
+    return loader
+
+
+def sales():
+    # Integers with a missing value arrive as floats
+    return pd.DataFrame({
+      "id": [1.0, None, 3.0, 4.0],
+      "amount": [0.5, 1.25, None, 2.0],
+      "note": ["tab\there", None, "line\nbreak, \"quoted\"", ""],
+    })
+
+
+EXPECTED_ROWS = [
+  (1, 0.5, "tab\there"),
+  (None, 1.25, None),
+  (3, None, 'line\nbreak, "quoted"'),
+  (4, 2.0, ""),
+]
+
+
+def test_copy_from_dataframe():
+    loader = copy_loader()
+    loader.perform_load(datafile("sales", sales()))
+    [copy] = loader.connection.copies
+    assert copy.sql == f'COPY "{SCHEMA}"."sales" ("id", "amount", "note") FROM STDIN'
+    assert copy.types is None
+    # NULLs go as None, never NaN, and psycopg escapes tabs and newlines in values
+    assert copy.rows == EXPECTED_ROWS
+    assert [type(row[0]) for row in copy.rows] == [int, type(None), int, int]
+
+
+def test_binary_copy_from_dataframe():
+    loader = copy_loader(copy_format="binary")
+    loader.perform_load(datafile("sales", sales()))
+    [copy] = loader.connection.copies
+    assert copy.sql.endswith("FROM STDIN (FORMAT BINARY)")
+    assert copy.types == ["integer", "numeric", "text"]
+    assert [row[1] for row in copy.rows] == [Decimal("0.5"), Decimal("1.25"), None, Decimal("2.0")]
+
+
+def test_copy_from_arrow_matches_dataframe():
+    pa = importorskip("pyarrow")
+    from pyarrow import csv as pacsv
+
+    loader = copy_loader()
+    loader.perform_load(datafile("sales", pa.Table.from_pandas(sales(), preserve_index=False)))
+    [copy] = loader.connection.copies
+    assert copy.sql == f'COPY "{SCHEMA}"."sales" ("id", "amount", "note") FROM STDIN (FORMAT CSV)'
+    assert copy.rows == []
+    # Read the CSV back as PostgreSQL does: unquoted empty fields are NULL, quoted ones empty strings
+    table = pacsv.read_csv(
+        pa.py_buffer(copy.data),
+        read_options=pacsv.ReadOptions(column_names=["id", "amount", "note"]),
+        parse_options=pacsv.ParseOptions(newlines_in_values=True),
+        convert_options=pacsv.ConvertOptions(
+            column_types={"id": pa.int64(), "amount": pa.float64(), "note": pa.string()},
+            strings_can_be_null=True,
+            quoted_strings_can_be_null=False,
+        ),
+    )
+    assert [tuple(row.values()) for row in table.to_pylist()] == EXPECTED_ROWS
+
+
+def test_overwrite_keeps_constraints_defaults_and_grants(loader):
+    loader.connection.execute(
+        f"""CREATE TABLE {SCHEMA}.sales (
+            id serial PRIMARY KEY,
+            amount numeric(10,2) DEFAULT 0 CONSTRAINT positive_amount CHECK (amount >= 0),
+            note varchar(20) NOT NULL
+        )"""
+    )
+    loader.connection.execute(f"CREATE INDEX sales_note ON {SCHEMA}.sales (note)")
+    loader.connection.execute(f"GRANT SELECT ON {SCHEMA}.sales TO PUBLIC")
+    loader.connection.execute(f"INSERT INTO {SCHEMA}.sales (amount, note) VALUES (9, 'old')")
+    table_oid = query(loader, "SELECT to_regclass(%s)::oid", f"{SCHEMA}.sales")
+
+    data = pd.DataFrame({"id": [1, 2], "amount": [1.5, 2.5], "note": ["a", "b"]})
+    loader.load_datafile(datafile("sales", data), mode=Mode.OVERWRITE)
+
+    assert query(loader, "SELECT to_regclass(%s)::oid", f"{SCHEMA}.sales") != table_oid
+    assert query(loader, f"SELECT id, note FROM {SCHEMA}.sales ORDER BY id") == [(1, "a"), (2, "b")]
+    constraints = query(
+        loader, "SELECT conname, contype FROM pg_constraint WHERE conrelid = %s::regclass ORDER BY conname",
+        f"{SCHEMA}.sales",
+    )
+    assert ("sales_pkey", "p") in constraints and ("positive_amount", "c") in constraints
+    assert query(loader, "SELECT indexname FROM pg_indexes WHERE schemaname = %s ORDER BY indexname", SCHEMA) == [
+        ("sales_note",), ("sales_pkey",),
+    ]
+    assert query(loader, "SELECT has_table_privilege('public', %s, 'SELECT')", f"{SCHEMA}.sales") == [(True,)]
+    with raises(psycopg.errors.CheckViolation):
+        loader.connection.execute(f"INSERT INTO {SCHEMA}.sales (id, amount, note) VALUES (5, -1, 'c')")
+    with raises(psycopg.errors.UniqueViolation):
+        loader.connection.execute(f"INSERT INTO {SCHEMA}.sales (id, note) VALUES (1, 'c')")
+    with raises(psycopg.errors.NotNullViolation):
+        loader.connection.execute(f"INSERT INTO {SCHEMA}.sales (id) VALUES (5)")
+    # The serial default, and the sequence behind it, came along
+    loader.connection.execute(f"SELECT setval('{SCHEMA}.sales_id_seq', 10)")
+    assert query(loader, f"INSERT INTO {SCHEMA}.sales (note) VALUES ('c') RETURNING id, amount") == [(11, 0)]
+
+
+def test_overwrite_reloads_tables_with_dependent_views(loader):
+    loader.connection.execute(f"CREATE TABLE {SCHEMA}.sales (id int4, note varchar(20))")
+    loader.connection.execute(f"INSERT INTO {SCHEMA}.sales VALUES (9, 'old')")
+    loader.connection.execute(f"CREATE VIEW {SCHEMA}.sales_view AS SELECT id FROM {SCHEMA}.sales")
+    table_oid = query(loader, "SELECT to_regclass(%s)::oid", f"{SCHEMA}.sales")
+
+    data = pd.DataFrame({"id": [1, 2], "note": ["a", "b"], "added": [True, False]})
+    loader.load_datafile(datafile("sales", data), mode=Mode.OVERWRITE)
+
+    assert query(loader, "SELECT to_regclass(%s)::oid", f"{SCHEMA}.sales") == table_oid
+    assert query(loader, f"SELECT id FROM {SCHEMA}.sales_view ORDER BY id") == [(1,), (2,)]
+    assert query(loader, f"SELECT added FROM {SCHEMA}.sales ORDER BY id") == [(True,), (False,)]
+
+
+def test_merge_replaces_only_the_partition(loader):
+    for file_date, ids in [("2024-01-01", [1, 2]), ("2024-01-02", [3, 4]), ("2024-01-01", [5])]:
+        data = pd.DataFrame({"id": ids, "file_date": [file_date] * len(ids)})
+        merged = datafile("sales", data)
+        merged.partition = {"file_date": file_date}
+        loader.load_datafile(merged, mode=Mode.MERGE)
+    assert query(loader, f"SELECT file_date, id FROM {SCHEMA}.sales ORDER BY id") == [
+        ("2024-01-02", 3), ("2024-01-02", 4), ("2024-01-01", 5),
+    ]
+
+
+def test_merge_leaves_columns_the_file_lacks_to_their_defaults(loader):
+    loader.connection.execute(
+        f"""CREATE TABLE {SCHEMA}.sales (
+            row_id serial NOT NULL,
+            id integer,
+            file_date text,
+            loaded_at timestamp NOT NULL DEFAULT now()
+        )"""
+    )
+    merged = datafile("sales", pd.DataFrame({"id": [1, 2], "file_date": ["2024-01-01"] * 2}))
+    merged.partition = {"file_date": "2024-01-01"}
+    loader.load_datafile(merged, mode=Mode.MERGE)
+    assert query(loader, f"SELECT row_id, id, loaded_at IS NOT NULL FROM {SCHEMA}.sales ORDER BY id") == [
+        (1, 1, True), (2, 2, True),
+    ]
+
+
+def test_merge_without_partition(loader):
+    with raises(ValueError, match="no partition"):
+        loader.load_datafile(datafile("sales", pd.DataFrame({"id": [1]})), mode=Mode.MERGE)
+
+
+def test_header_differing_only_in_case_is_a_new_column(loader):
+    loader.connection.execute(f"CREATE TABLE {SCHEMA}.t (id integer)")
+    loader.load_datafile(datafile("t", pd.DataFrame({"ID": [1, 2]})))
+    loader.load_datafile(datafile("t", pd.DataFrame({"id": [3]})))
+    assert query(loader, f'SELECT id, "ID" FROM {SCHEMA}.t ORDER BY 1, 2') == [(3, None), (None, 1), (None, 2)]
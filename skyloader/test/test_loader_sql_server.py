@@ -0,0 +1,192 @@
+import pandas as pd
+from pytest import fixture, importorskip, raises
+
+# pyodbc fails to import without the unixODBC driver manager, too
+pyodbc = importorskip("pyodbc", exc_type=ImportError)
+
+from skyloader.catalog import Catalog, Column
+from skyloader.datafile import DataFile
+from skyloader.loader_sql_server import SqlLoader
+from skyloader.mode import Mode
+from skyloader.test.fake_odbc import FakeConnection
+
+
+def connect(loader, connection):
+    loader.connection = connection
+    loader.connected = True
+    loader.catalog = Catalog()
+    loader.catalog.add_table("dbo", "sales", [Column("id", "int"), Column("note", "varchar", 20)])
+    return loader
+
+
+@fixture
+def datafile():
+    datafile = DataFile(name="sales.csv", identifier="file1", mimetype="text/csv")
+    datafile.data = pd.DataFrame({"id": [1, 2], "note": ["a", "b"]})
+    return datafile
+
+
+def test_overwrite_rebuilds_constraints_and_permissions_on_the_shadow(datafile):
+    connection = FakeConnection(responses={
+        "sys.sql_expression_dependencies": [(0, 0)],
+        "is_nullable = 0": [("id",)],
+        "sys.key_constraints": [("PK_sales", "PK", "CLUSTERED", "id", False)],
+        "FROM sys.indexes i": [("IX_note", "NONCLUSTERED", False, "note", False, False)],
+        "sys.check_constraints": [("CK_id", "([id]>(0))")],
+        "sys.default_constraints": [("DF_note", "note", "('')"), ("DF_gone", "gone", "((0))")],
+        "sys.foreign_key_columns": [("FK_region", "id", "ref", "regions", "region_id", "CASCADE", "NO_ACTION")],
+        "sys.database_permissions": [
+          ("GRANT", "SELECT", "reader", None),
+          ("DENY", "UPDATE", "reader", "note"),
+          ("GRANT_WITH_GRANT_OPTION", "SELECT", "owner", "gone"),
+        ],
+        "SELECT OBJECT_ID(?)": [(1234,)],
+    })
+    loader = connect(SqlLoader(schemaname="dbo", type_margin=0), connection)
+    loader.load_datafile(datafile, mode=Mode.OVERWRITE)
+
+    sql = connection.sql()
+    shadow = "dbo.sales__shadow"
+    expected = [
+        f"ALTER TABLE {shadow} ALTER COLUMN [id] int NOT NULL",
+        f"ALTER TABLE {shadow} ADD CONSTRAINT [PK_sales__shadow] PRIMARY KEY CLUSTERED ([id])",
+        f"CREATE NONCLUSTERED INDEX [IX_note] ON {shadow} ([note])",
+        f"ALTER TABLE {shadow} ADD CONSTRAINT [CK_id__shadow] CHECK ([id]>(0))",
+        f"ALTER TABLE {shadow} ADD CONSTRAINT [DF_note__shadow] DEFAULT ('') FOR [note]",
+        f"ALTER TABLE {shadow} ADD CONSTRAINT [FK_region__shadow] FOREIGN KEY ([id]) "
+        "REFERENCES [ref].[regions] ([region_id]) ON DELETE CASCADE ON UPDATE NO ACTION",
+        f"GRANT SELECT ON {shadow} TO [reader]",
+        f"DENY UPDATE ON {shadow} ([note]) TO [reader]",
+        "EXEC sp_rename ?, ?",
+        "EXEC sp_rename ?, ?",
+        "DROP TABLE dbo.sales__retired",
+    ]
+    positions = [sql.index(statement) for statement in expected]
+    assert positions == sorted(positions)
+    assert positions[0] > max(i for i, statement in enumerate(sql) if statement.startswith("INSERT INTO dbo.sales__shadow"))
+    assert not any("DF_gone" in statement or "owner" in statement for statement in sql)
+    renames = [params for statement, params in connection.statements if statement == "EXEC sp_rename ?, ?, 'OBJECT'"]
+    assert renames == [
+        ("dbo.PK_sales__shadow", "PK_sales"),
+        ("dbo.CK_id__shadow", "CK_id"),
+        ("dbo.DF_note__shadow", "DF_note"),
+        ("dbo.FK_region__shadow", "FK_region"),
+    ]
+    assert sql.index(expected[-1]) < sql.index("EXEC sp_rename ?, ?, 'OBJECT'") < sql.index("COMMIT")
+
+
+def test_overwrite_reloads_tables_with_dependents(datafile):
+    for schema_bound, referenced, empty in [(1, 0, "TRUNCATE TABLE dbo.sales"), (0, 1, "DELETE FROM dbo.sales")]:
+        connection = FakeConnection(responses={"sys.sql_expression_dependencies": [(schema_bound, referenced)]})
+        loader = connect(SqlLoader(schemaname="dbo"), connection)
+        loader.load_datafile(datafile, mode=Mode.OVERWRITE)
+        sql = connection.sql()
+        insert = "INSERT INTO dbo.sales ([id], [note]) VALUES (?,?)"
+        assert sql.index(empty) < sql.index(insert) < sql.index("COMMIT")
+        assert connection.statements[sql.index(insert)][1] == [(1, "a"), (2, "b")]
+        assert not any("sp_rename" in statement or "__shadow" in statement for statement in sql)
+
+
+def test_merge_replaces_the_partition_through_staging(datafile):
+    connection = FakeConnection(responses={"DELETE FROM dbo.sales": [(1,), (2,), (3,)]})
+    loader = connect(SqlLoader(schemaname="dbo"), connection)
+    datafile.partition = {"note": "a"}
+    loader.load_datafile(datafile, mode=Mode.MERGE)
+    assert connection.sql() == [
+        "SELECT TOP 0 [id], [note] INTO #staging_sales FROM dbo.sales",
+        "INSERT INTO #staging_sales ([id], [note]) VALUES (?,?)",
+        "DELETE FROM dbo.sales WHERE [note] = ?",
+        "INSERT INTO dbo.sales ([id], [note]) SELECT [id], [note] FROM #staging_sales",
+        "COMMIT",
+        "IF OBJECT_ID('tempdb..#staging_sales') IS NOT NULL DROP TABLE #staging_sales",
+    ]
+    assert connection.statements[2][1] == ("a",)
+    assert connection.autocommit
+
+
+def test_merge_raises_the_original_error_when_cleanup_fails(datafile):
+    connection = FakeConnection(failures={
+        "DELETE FROM dbo.sales": pyodbc.DatabaseError("deadlock victim"),
+        "DROP TABLE #staging_sales": pyodbc.OperationalError("communication link failure"),
+    })
+    loader = connect(SqlLoader(schemaname="dbo"), connection)
+    datafile.partition = {"note": "a"}
+    with raises(pyodbc.DatabaseError, match="deadlock victim"):
+        loader.load_datafile(datafile, mode=Mode.MERGE)
+    assert "ROLLBACK" in connection.sql() and "COMMIT" not in connection.sql()
+    assert connection.autocommit
+
+
+def test_merge_without_partition(datafile):
+    loader = connect(SqlLoader(schemaname="dbo"), FakeConnection())
+    with raises(ValueError, match="no partition"):
+        loader.load_datafile(datafile, mode=Mode.MERGE)
+
+
+
+def test_widening_keeps_not_null(datafile):
+    connection = FakeConnection()
+    loader = connect(SqlLoader(schemaname="dbo", type_margin=0), connection)
+    loader.catalog.add_table("dbo", "sales", [Column("id", "int", nullable=False), Column("note", "varchar", 1)])
+    datafile.data = pd.DataFrame({"id": [1, 2**40], "note": ["a", "longer"]})
+    loader.load_datafile(datafile)
+    sql = connection.sql()
+    assert "ALTER TABLE dbo.sales ALTER COLUMN [id] bigint NOT NULL" in sql[0]
+    assert "ALTER TABLE dbo.sales ALTER COLUMN [note] varchar(6) NULL" in sql[0]
+    assert [c.nullable for c in loader.catalog.columns("dbo", "sales")] == [False, True]
+
+
+def test_append_brackets_column_names(datafile):
+    connection = FakeConnection()
+    loader = connect(SqlLoader(schemaname="dbo", tablock=True), connection)
+    loader.catalog.add_table("dbo", "sales", [Column("order id", "int"), Column("select", "varchar", 20)])
+    datafile.data = pd.DataFrame({"order id": [1], "select": ["a"]})
+    loader.load_datafile(datafile)
+    assert connection.sql()[0] == "INSERT INTO dbo.sales WITH (TABLOCK) ([order id], [select]) VALUES (?,?)"
+
+CHECKPOINT_WRITES = ("UPDATE dbo.skyloader_checkpoint", "INSERT INTO dbo.skyloader_checkpoint")
+
+
+def checkpointed(datafile, connection, md5="abc"):
+    datafile.md5 = md5
+    datafile.data = pd.DataFrame({"id": [1, 2, 3], "note": ["a", "b", "c"]})
+    loader = connect(SqlLoader(schemaname="dbo", checkpoint=True, batch_size=1), connection)
+    loader.load_datafile(datafile)
+    return [params for statement, params in connection.statements if statement.startswith("INSERT INTO dbo.sales")]
+
+
+def test_checkpoint_saved_with_each_batch_and_cleared(datafile):
+    connection = FakeConnection()
+    assert checkpointed(datafile, connection) == [[(1, "a")], [(2, "b")], [(3, "c")]]
+    reads = [params for statement, params in connection.statements if statement.startswith("SELECT row_offset")]
+    assert reads == [("file1@abc",)]
+    writes = [
+      (statement.split()[0], params)
+      for statement, params in connection.statements
+      if statement.startswith(CHECKPOINT_WRITES)
+    ]
+    assert writes == [
+      ("UPDATE", (1, "file1@abc")), ("INSERT", ("file1@abc", 1)),
+      ("UPDATE", (2, "file1@abc")), ("INSERT", ("file1@abc", 2)),
+      ("UPDATE", (3, "file1@abc")), ("INSERT", ("file1@abc", 3)),
+    ]
+    sql = connection.sql()
+    # Each batch commits along with its checkpoint, and the last commit clears it
+    assert sql.count("COMMIT") == 4
+    clear = next(i for i, statement in enumerate(sql) if statement.startswith("DELETE FROM dbo.skyloader_checkpoint"))
+    assert clear == len(sql) - 2
+    assert connection.statements[clear][1] == ("file1", 6, "file1@")
+
+
+def test_checkpoint_resumes_after_the_committed_rows(datafile):
+    connection = FakeConnection(responses={"SELECT row_offset": [(2,)]})
+    assert checkpointed(datafile, connection) == [[(3, "c")]]
+
+
+def test_checkpoint_of_a_replaced_file_is_not_resumed(datafile):
+    def offsets(params):
+        # Only the earlier version of the file has a checkpoint
+        return [] if params == ("file1@def",) else [(2,)]
+
+    connection = FakeConnection(responses={"SELECT row_offset": offsets})
+    assert checkpointed(datafile, connection, md5="def") == [[(1, "a")], [(2, "b")], [(3, "c")]]
@@ -0,0 +1,76 @@
+import json
+from contextlib import contextmanager
+
+from pytest import fixture
+
+from skyloader.datafile import DataFile
+from skyloader.metrics import NULL_METRICS, NULL_SPAN, Metrics
+
+
+@fixture
+def datafile():
+    return DataFile(name="report.xlsx", identifier="file1")
+
+
+def test_spans_add_up_per_stage_and_file(datafile):
+    metrics = Metrics(run_id="r1")
+    for _ in range(2):
+        with metrics.span("parse", datafile):
+            pass
+    metrics.record("insert", 0.5, datafile)
+    metrics.count("rows", 10)
+    report = metrics.report()
+    assert list(report["stages"]) == ["parse", "insert"]
+    assert report["stages"]["parse"]["spans"] == 2
+    assert report["stages"]["insert"] == {"spans": 1, "seconds": 0.5, "max_seconds": 0.5}
+    assert report["counters"]["rows"] == 10
+    assert report["files"] == [
+      {"id": "file1", "name": "report.xlsx", "stages": {"parse": report["stages"]["parse"]["seconds"], "insert": 0.5}}
+    ]
+
+
+def test_span_started_inside_a_block(datafile):
+    metrics = Metrics()
+    commit = metrics.span("commit", datafile)
+    commit.stop()
+    assert metrics.report()["stages"] == {}
+    commit.start()
+    commit.stop()
+    commit.stop()
+    assert metrics.report()["stages"]["commit"]["spans"] == 1
+
+
+def test_hooks_wrap_each_span(datafile):
+    calls = []
+
+    @contextmanager
+    def hook(stage, datafile):
+        calls.append(("enter", stage, datafile.name))
+        yield
+        calls.append(("exit", stage, datafile.name))
+
+    metrics = Metrics(hooks=[hook])
+    with metrics.span("download", datafile):
+        calls.append("body")
+    assert calls == [("enter", "download", "report.xlsx"), "body", ("exit", "download", "report.xlsx")]
+
+
+def test_null_metrics_record_nothing(datafile):
+    assert NULL_METRICS.span("parse", datafile) is NULL_SPAN
+    NULL_METRICS.record("parse", 1.0, datafile)
+    NULL_METRICS.count("rows", 5)
+    assert NULL_METRICS.report()["stages"] == {}
+    assert NULL_METRICS.report()["counters"]["rows"] == 0
+
+
+def test_exports(tmp_path, datafile):
+    metrics = Metrics(run_id="r1")
+    metrics.record("download", 1.5, datafile)
+    metrics.count("bytes", 2048)
+    metrics.write_json(tmp_path / "run.json")
+    metrics.write_prometheus(tmp_path / "run.prom")
+    assert json.loads((tmp_path / "run.json").read_text())["counters"]["bytes"] == 2048
+    lines = (tmp_path / "run.prom").read_text().splitlines()
+    assert "# TYPE skyloader_stage_seconds_total counter" in lines
+    assert 'skyloader_stage_seconds_total{stage="download"} 1.5' in lines
+    assert "skyloader_bytes_total 2048" in lines
@@ -0,0 +1,69 @@
+import threading
+
+from pytest import raises
+
+from skyloader.pool import ConnectionPool, PoolTimeout, shared_pool
+
+
+class FakeConnection:
+    opened = 0
+
+    def __init__(self):
+        FakeConnection.opened += 1
+        self.id = FakeConnection.opened
+        self.healthy = True
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def check(connection):
+    if not connection.healthy:
+        raise ConnectionError("server closed the connection")
+
+
+def make_pool(**options):
+    return ConnectionPool(FakeConnection, check=check, **options)
+
+
+def test_connections_are_reused():
+    pool = make_pool(min_size=1, max_size=2)
+    first = pool.acquire()
+    pool.release(first)
+    assert pool.acquire() is first
+    assert pool.size == 1
+
+
+def test_dropped_connection_is_replaced_on_checkout():
+    pool = make_pool(min_size=1, max_size=1)
+    dropped = pool.acquire()
+    pool.release(dropped)
+    dropped.healthy = False
+    replacement = pool.acquire()
+    assert replacement is not dropped
+    assert dropped.closed
+    assert pool.size == 1
+
+
+def test_acquire_waits_for_a_free_connection():
+    pool = make_pool(min_size=0, max_size=1, timeout=5)
+    held = pool.acquire()
+    threading.Timer(0.05, pool.release, args=(held,)).start()
+    assert pool.acquire() is held
+    with raises(PoolTimeout):
+        make_pool(min_size=0, max_size=0, timeout=0.01).acquire()
+
+
+def test_idle_connections_above_min_size_are_evicted():
+    pool = make_pool(min_size=1, max_size=3, idle_timeout=0)
+    connections = [pool.acquire() for _ in range(3)]
+    for connection in connections:
+        pool.release(connection)
+    assert pool.size == 1
+    assert sum(c.closed for c in connections) == 2
+
+
+def test_shared_pool_is_shared_per_key():
+    assert shared_pool("dsn-a", FakeConnection) is shared_pool("dsn-a", FakeConnection)
+    assert shared_pool("dsn-a", FakeConnection) is not shared_pool("dsn-b", FakeConnection)
@@ -0,0 +1,131 @@
+import gzip
+import io
+from datetime import datetime
+from importlib.util import find_spec
+
+import openpyxl
+import pytest
+
+from skyloader.readers import CsvReader, ExcelReader, ReadOptions, reader_for
+
+ENGINES = [
+  "pandas",
+  "openpyxl",
+  pytest.param("calamine", marks=pytest.mark.skipif(
+    find_spec("python_calamine") is None, reason="python-calamine is not installed"
+  )),
+]
+
+
+@pytest.fixture
+def workbook():
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = "first"
+    sheet.append(["id", "name", None, "observed_at", "amount"])
+    sheet.append([1, "a", None, datetime(2023, 1, 2, 3, 4), 1.5])
+    sheet.append([2, None, None, datetime(2023, 1, 3), 2])
+    sheet.append([3, "c", None, None, 3.25])
+    sheet.append([None] * 5)
+    second = workbook.create_sheet("second")
+    second.append(["x"])
+    second.append(["y"])
+    fh = io.BytesIO()
+    workbook.save(fh)
+    return fh.getvalue()
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_read_first_sheet(workbook, engine):
+    data = reader_for(ReadOptions(engine=engine)).read(io.BytesIO(workbook))
+    assert list(data.columns) == ["id", "name", "Unnamed: 2", "observed_at", "amount"]
+    assert data["id"].tolist() == [1, 2, 3]
+    assert data["id"].dtype == "int64"
+    assert data["amount"].tolist() == [1.5, 2.0, 3.25]
+    assert data["observed_at"].dtype.kind == "M"
+    assert data["Unnamed: 2"].isna().all()
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_read_named_sheet(workbook, engine):
+    data = reader_for(ReadOptions(engine=engine, sheet_name="second")).read(io.BytesIO(workbook))
+    assert data.to_dict("list") == {"x": ["y"]}
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_rows(workbook, engine):
+    rows = [list(row) for row in reader_for(ReadOptions(engine=engine)).rows(io.BytesIO(workbook))]
+    assert rows[:2] == [
+      ["id", "name", None, "observed_at", "amount"],
+      [1, "a", None, datetime(2023, 1, 2, 3, 4), 1.5],
+    ]
+
+
+def test_excel_readers_must_read_rows():
+    with pytest.raises(TypeError):
+        ExcelReader()
+
+
+def test_chunks_with_pinned_dtypes(workbook):
+    options = ReadOptions(engine="openpyxl", chunk_size=2, dtypes={"id": "Int64", "name": "string"})
+    chunks = list(reader_for(options).chunks(io.BytesIO(workbook)))
+    assert [len(chunk) for chunk in chunks] == [2, 1]
+    assert all(chunk["id"].dtype == "Int64" for chunk in chunks)
+    assert chunks[0]["name"].dtype == "string"
+
+
+def test_unknown_engine():
+    with pytest.raises(ValueError):
+        ReadOptions(engine="xlrd")
+
+
+CSV_TEXT = 'id;name;amount\n1;café;1.5\n2;;2\n3;"x;y";\n'
+
+
+@pytest.mark.parametrize("encoding", ["utf-8", "cp1252", "utf-16"])
+@pytest.mark.parametrize("compress", [False, True])
+def test_read_csv(encoding, compress):
+    pytest.importorskip("pyarrow")
+    payload = CSV_TEXT.encode(encoding)
+    if compress:
+        payload = gzip.compress(payload)
+    data = reader_for(name="export.csv.gz" if compress else "export.csv").read(io.BytesIO(payload))
+    assert list(data.columns) == ["id", "name", "amount"]
+    assert data["id"].tolist() == [1, 2, 3]
+    assert data["name"].tolist()[::2] == ["café", "x;y"]
+    assert data["name"].isna().tolist() == [False, True, False]
+    assert data["amount"].tolist()[:2] == [1.5, 2.0]
+
+
+def test_read_tsv_with_pinned_dtypes():
+    pytest.importorskip("pyarrow")
+    options = ReadOptions(dtypes={"id": "Int64", "code": "string"})
+    data = reader_for(options, name="export.tsv").read(io.BytesIO(b"id\tcode\n1\t007\n\t\n"))
+    assert data["id"].dtype == "Int64"
+    assert data["code"].tolist()[0] == "007"
+
+
+def test_newlines_in_values_is_opt_in():
+    pytest.importorskip("pyarrow")
+    payload = io.BytesIO(b'id,note\n1,"two\nlines"\n')
+    for newlines_in_values in (False, True):
+        reader = CsvReader(ReadOptions(newlines_in_values=newlines_in_values))
+        _, parse_options, _ = reader.arrow_options(payload)
+        assert parse_options.newlines_in_values is newlines_in_values
+    assert reader.read(payload)["note"].tolist() == ["two\nlines"]
+
+
+def test_reader_dispatch():
+    assert isinstance(reader_for(mimetype="text/csv"), CsvReader)
+    assert isinstance(reader_for(name="EXPORT.TSV"), CsvReader)
+    assert not isinstance(reader_for(name="report.xlsx"), CsvReader)
+
+
+def test_read_into_arrow(workbook):
+    pa = pytest.importorskip("pyarrow")
+    table = reader_for(ReadOptions(engine="openpyxl", arrow=True)).read(io.BytesIO(workbook))
+    assert isinstance(table, pa.Table)
+    assert table.column("id").to_pylist() == [1, 2, 3]
+    table = reader_for(ReadOptions(arrow=True), name="export.csv").read(io.BytesIO(CSV_TEXT.encode()))
+    assert isinstance(table, pa.Table)
+    assert table.column("name").to_pylist() == ["café", None, "x;y"]
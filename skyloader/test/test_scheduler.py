@@ -0,0 +1,64 @@
+import threading
+import time
+
+from skyloader.folder_google import GoogleFolder
+from skyloader.scheduler import FolderScheduler
+
+
+class RecordingManager:
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def __init__(self, folder, events):
+        self.folder = folder
+        self.events = events
+        self.loaded = 1
+        self.failed = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return
+
+    def process_files(self):
+        if self.folder.desc == "broken":
+            raise RuntimeError("drive unavailable")
+        with RecordingManager.lock:
+            RecordingManager.active += 1
+            RecordingManager.peak = max(RecordingManager.peak, RecordingManager.active)
+        self.events.append(("start", self.folder.target_table, self.folder.desc))
+        time.sleep(0.02)
+        self.events.append(("end", self.folder.target_table, self.folder.desc))
+        with RecordingManager.lock:
+            RecordingManager.active -= 1
+
+
+def test_scheduler_serializes_folders_per_table(capsys):
+    folders = [
+        GoogleFolder("1", "sales_east", target_table="sales"),
+        GoogleFolder("2", "returns"),
+        GoogleFolder("3", "sales_west", target_table="sales"),
+        GoogleFolder("4", "broken"),
+        GoogleFolder("5", "stock", database="warehouse"),
+        GoogleFolder("6", "orders", database="warehouse"),
+    ]
+    events = []
+    scheduler = FolderScheduler(
+        folders, lambda folder: RecordingManager(folder, events),
+        max_workers=4, connections_per_database=1,
+    )
+    runs = scheduler.run()
+
+    assert [run.folder.desc for run in runs] == [folder.desc for folder in folders]
+    assert [run.status for run in runs] == ["ok", "ok", "ok", "error", "ok", "ok"]
+    sales = [(kind, desc) for kind, table, desc in events if table == "sales"]
+    assert sales == [
+        ("start", "sales_east"), ("end", "sales_east"),
+        ("start", "sales_west"), ("end", "sales_west"),
+    ]
+    warehouse = [kind for kind, table, desc in events if table in ("stock", "orders")]
+    assert warehouse == ["start", "end", "start", "end"]
+    assert RecordingManager.peak <= 4
+    assert "6 folders processed" in capsys.readouterr().out
@@ -0,0 +1,62 @@
+import pandas as pd
+
+from skyloader.catalog import Column
+from skyloader.schema import SchemaDiff
+from skyloader.sqltypes import widen_type
+
+
+def test_widen_type():
+    assert widen_type(("varchar", {"length": 10}), ("nvarchar", {"length": 5}), "sqlserver") == ("nvarchar", {"length": 10})
+    assert widen_type(("varchar", {"length": 10}), ("varchar", {"length": 5}), "sqlserver") == ("varchar", {"length": 10})
+    assert widen_type(("nvarchar", {"length": 3000}), ("nvarchar", {"length": 5000}), "sqlserver") == ("text", {})
+    assert widen_type(("int", {}), ("bigint", {}), "postgres") == ("bigint", {})
+    assert widen_type(("int", {}), ("decimal", {"precision": 5, "scale": 2}), "postgres") == (
+        "decimal", {"precision": 12, "scale": 2}
+    )
+    assert widen_type(("decimal", {"precision": 5, "scale": 2}), ("int", {}), "postgres") == (
+        "decimal", {"precision": 12, "scale": 2}
+    )
+    assert widen_type(("float", {}), ("bigint", {}), "postgres") == ("float", {})
+    assert widen_type(("bigint", {}), ("float", {}), "postgres") == ("float", {})
+    assert widen_type(("decimal", {"precision": 4, "scale": 2}), ("float", {}), "postgres") == ("float", {})
+    assert widen_type(("bool", {}), ("float", {}), "postgres") is None
+    assert widen_type(("int", {}), ("varchar", {"length": 5}), "postgres") is None
+
+
+def test_schema_diff():
+    columns = [
+        Column("id", "integer"),
+        Column("Name", "character varying", max_length=4),
+        Column("price", "numeric", precision=5, scale=2),
+        Column("comment", "text"),
+    ]
+    data = pd.DataFrame({
+      "ID": [1, 2**40],
+      "name": ["a", "much longer"],
+      "price": [None, None],
+      "added": [True, False],
+    })
+    diff = SchemaDiff.compare(columns, data, "postgres", margin=0)
+    assert diff.added == [("added", "bool")]
+    assert diff.widened == [("id", "int8"), ("Name", "varchar(11)")]
+    assert diff.incompatible == []
+    assert diff.missing == ["comment"]
+    assert diff.changes
+
+    diff = SchemaDiff.compare(columns, pd.DataFrame({"id": ["x"]}), "sqlserver")
+    assert diff.incompatible == ["id (integer from varchar(2))"]
+    assert not SchemaDiff.compare(columns, pd.DataFrame({"id": [1]}), "sqlserver").changes
+
+    diff = SchemaDiff.compare(columns, pd.DataFrame({"ID": [1]}), "postgres", case_sensitive=True)
+    assert diff.added == [("ID", "int4")]
+    assert "id" in diff.missing
+
+
+def test_float_columns_typed_as_decimal_widen_to_float():
+    first = pd.DataFrame({"price": [10.5, 20.25]})
+    [(_, sql_type)] = SchemaDiff.compare([], first, "postgres", margin=0).added
+    assert sql_type == "numeric(4,2)"
+    columns = [Column("price", "numeric", precision=4, scale=2)]
+    diff = SchemaDiff.compare(columns, pd.DataFrame({"price": [1 / 3, 2.0]}), "postgres")
+    assert diff.incompatible == []
+    assert diff.widened == [("price", "float8")]
@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+from pytest import importorskip, raises
+
+from skyloader.sqltypes import chunked_column_types, infer_sql_type, infer_sql_types
+
+
+def test_strings_get_sized_varchar():
+    series = pd.Series(["abcd", None, "ab"], dtype=object)
+    assert infer_sql_type(series, "sqlserver") == "varchar(5)"
+    assert infer_sql_type(series, "sqlserver", margin=0) == "varchar(4)"
+    assert infer_sql_type(pd.Series(["café"]), "sqlserver", margin=0) == "nvarchar(4)"
+    assert infer_sql_type(pd.Series(["x" * 7000]), "sqlserver") == "nvarchar(max)"
+    assert infer_sql_type(pd.Series(["x" * 5000]), "postgres") == "varchar(6250)"
+    assert infer_sql_type(pd.Series([None, None], dtype=object), "postgres") == "text"
+
+
+def test_integers_by_range():
+    assert infer_sql_type(pd.Series([1, -5, 300]), "sqlserver") == "int"
+    assert infer_sql_type(pd.Series([1, 2**40]), "sqlserver") == "bigint"
+    assert infer_sql_type(pd.Series([1, 2**31 - 10]), "postgres") == "int8"
+    assert infer_sql_type(pd.Series([1, None, 3], dtype="Int64"), "postgres") == "int4"
+    assert infer_sql_type(pd.Series([1.0, np.nan, 3.0]), "sqlserver") == "int"
+
+
+def test_decimals_by_precision_and_scale():
+    assert infer_sql_type(pd.Series([12.5, 1234.25, np.nan]), "sqlserver") == "decimal(6,2)"
+    assert infer_sql_type(pd.Series([0.1, 2.75]), "postgres") == "numeric(3,2)"
+    assert infer_sql_type(pd.Series([1 / 3]), "sqlserver") == "float"
+
+
+def test_datetimes_and_other_dtypes():
+    naive = pd.Series(pd.to_datetime(["2023-01-01", None]))
+    assert infer_sql_type(naive, "sqlserver") == "datetime2"
+    assert infer_sql_type(naive.dt.tz_localize("UTC"), "sqlserver") == "datetimeoffset"
+    assert infer_sql_type(naive.dt.tz_localize("UTC"), "postgres") == "timestamptz"
+    assert infer_sql_type(pd.Series([True, False]), "sqlserver") == "bit"
+    assert infer_sql_type(pd.Series(["a", "bc"], dtype="string"), "postgres") == "varchar(3)"
+    assert infer_sql_type(pd.Series(["a", "b"], dtype="category"), "sqlserver") == "varchar(2)"
+
+
+def test_infer_sql_types_for_frame():
+    df = pd.DataFrame({"a": [1, 2], "b": ["x", "yz"]})
+    assert infer_sql_types(df, "postgres", margin=0) == ["int4", "varchar(2)"]
+    with raises(ValueError):
+        infer_sql_types(df, "oracle")
+
+
+def test_arrow_columns_match_dataframe_columns():
+    pa = importorskip("pyarrow")
+    frame = pd.DataFrame({
+      "id": [1, 2**40, None],
+      "amount": [12.5, 1234.25, np.nan],
+      "label": ["abcd", None, "café"],
+      "observed_at": pd.to_datetime(["2023-01-01", None, "2023-01-02"]),
+      "flag": [True, False, True],
+    })
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    for dialect in ("sqlserver", "postgres"):
+        assert infer_sql_types(table, dialect) == infer_sql_types(frame, dialect)
+
+
+def test_chunked_column_types_widen_over_chunks():
+    chunks = [
+        pd.DataFrame({"id": [1, 2], "name": ["a", "b"], "note": [None, None]}),
+        pd.DataFrame({"id": [2**40, 3], "name": ["much longer", None], "note": [None, "x"]}),
+        pd.DataFrame({"id": [None, None], "name": [None, None], "note": [None, None]}),
+    ]
+    types, nulls = chunked_column_types(chunks, margin=0, dialect="postgres")
+    assert types == [("bigint", {}), ("varchar", {"length": 11}), ("varchar", {"length": 1})]
+    assert nulls == [False, False, False]
+    assert chunked_column_types([]) == ([], [])
@@ -0,0 +1,79 @@
+import io
+
+import pandas as pd
+from pytest import fixture, raises
+
+from skyloader.loader_manager import LoaderManager
+from skyloader.readers import ReadOptions, reader_for
+from skyloader.storage_local import LocalStorage, MappedFile
+
+
+@fixture
+def root(tmp_path):
+    (tmp_path / "archive").mkdir()
+    (tmp_path / "error").mkdir()
+    pd.DataFrame({"id": [1, 2, 3], "label": ["a", "b", "c"]}).to_csv(tmp_path / "feed.csv", index=False)
+    pd.DataFrame({"id": [4, 5]}).to_excel(tmp_path / "feed.xlsx", index=False)
+    (tmp_path / ".partial.csv").write_text("id\n9\n")
+    return tmp_path
+
+
+@fixture
+def storage(root):
+    return LocalStorage(root)
+
+
+def test_ls_lists_files_and_folders(storage, root):
+    datafiles = {d.name: d for d in storage.ls()}
+    assert sorted(datafiles) == ["archive", "error", "feed.csv", "feed.xlsx"]
+    assert datafiles["archive"].is_folder
+    assert datafiles["feed.csv"].mimetype == "text/csv"
+    assert datafiles["feed.csv"].size == (root / "feed.csv").stat().st_size
+    assert datafiles["feed.csv"].parents == [str(root)]
+
+
+def test_mapped_file_feeds_every_reader(storage, root):
+    datafiles = {d.name: d for d in storage.ls()}
+    for name, engine in [("feed.csv", "auto"), ("feed.xlsx", "openpyxl"), ("feed.xlsx", "pandas")]:
+        fh = storage.download_datafile(datafiles[name])
+        assert isinstance(fh, MappedFile)
+        data = reader_for(ReadOptions(engine=engine), name).read(fh)
+        assert data["id"].tolist() == ([1, 2, 3] if name == "feed.csv" else [4, 5])
+        fh.close()
+
+
+def test_empty_files_are_not_mapped(storage, root):
+    (root / "empty.csv").write_bytes(b"")
+    datafile, = [d for d in storage.ls() if d.name == "empty.csv"]
+    assert storage.download_datafile(datafile).read() == b""
+
+
+def test_moves_rename_without_overwriting(storage, root):
+    datafile, = [d for d in storage.ls() if d.name == "feed.csv"]
+    storage.move_and_rename_file(datafile.id, str(root / "archive"), "feed-r1.csv")
+    assert (root / "archive" / "feed-r1.csv").exists()
+    assert not (root / "feed.csv").exists()
+    (root / "feed.csv").write_text("id\n1\n")
+    with raises(FileExistsError):
+        storage.move_and_rename_file(str(root / "feed.csv"), str(root / "archive"), "feed-r1.csv")
+
+
+def test_upload_log(storage, root):
+    storage.upload_log(io.StringIO("done\n"), "r1.logs", str(root))
+    assert (root / "r1.logs").read_text() == "done\n"
+
+
+class RecordingLoader:
+    def __init__(self):
+        self.loaded = {}
+
+    def load_datafile(self, datafile, **kwargs):
+        self.loaded[datafile.name] = len(datafile.data)
+
+
+def test_loader_manager_loads_and_archives(storage, root):
+    loader = RecordingLoader()
+    with LoaderManager(storage, loader, parse_workers=0, run_id="r1") as manager:
+        manager.process_files()
+    assert loader.loaded == {"feed.csv": 3, "feed.xlsx": 2}
+    assert sorted(p.name for p in (root / "archive").iterdir()) == ["feed-r1.csv", "feed-r1.xlsx"]
@@ -0,0 +1,19 @@
+import datetime
+
+import pytest
+
+from skyloader.utils import extract_date
+
+
+@pytest.mark.parametrize(
+    "name, date_mask, expected",
+    [
+        ("ABC-20200101.xlsx", "YYYYMMDD", datetime.datetime(2020, 1, 1)),
+        ("sales_2021-03-04.xlsx", "YYYY-MM-DD", datetime.datetime(2021, 3, 4)),
+        ("report 04.03.2021.xlsx", "DD.MM.YYYY", datetime.datetime(2021, 3, 4)),
+        ("report 20211304.xlsx", "YYYYMMDD", None),
+        ("report.xlsx", "YYYYMMDD", None),
+    ],
+)
+def test_extract_date(name, date_mask, expected):
+    assert extract_date(name, date_mask) == expected
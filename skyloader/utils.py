@@ -1,3 +1,9 @@
+import datetime
+import re
+
+DATE_MASK_PARTS = {"YYYY": r"(?P<year>\d{4})", "MM": r"(?P<month>\d{2})", "DD": r"(?P<day>\d{2})"}
+
+
 def build_connection_string(
     driver, server, database, uid, pwd, port="1433", extra_connection_params=""
 ):
@@ -14,9 +20,40 @@ def authenticated(func):
 
 
 def connected(func):
+    """Connect before calling `func` if not yet connected.
+
+    Loaders with a connection pool borrow a connection for the call only and
+    return it afterwards, so the pool can health-check it before its next use.
+    """
     def wrapper(self, *args, **kwargs):
-        if not self.connected:
-            self.connect()
-        return func(self, *args, **kwargs)
+        if self.connected:
+            return func(self, *args, **kwargs)
+        self.connect()
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            if getattr(self, "pool", None) is not None:
+                self.close_connection()
 
     return wrapper
+
+
+def extract_date(name, date_mask="YYYYMMDD"):
+    """Extract the date a filename refers to, following `date_mask`.
+
+    `YYYY`, `MM` and `DD` in the mask stand for the date parts; any other
+    characters must appear as-is (e.g. `ABC-20200101.txt` with `YYYYMMDD`
+    gives 2020-01-01).  Returns None when the name holds no such date.
+    """
+    pattern = "".join(
+        DATE_MASK_PARTS.get(part, re.escape(part))
+        for part in re.split(r"(YYYY|MM|DD)", date_mask)
+        if part
+    )
+    match = re.search(pattern, name)
+    if match is None:
+        return None
+    try:
+        return datetime.datetime(int(match["year"]), int(match["month"]), int(match["day"]))
+    except ValueError:
+        return None